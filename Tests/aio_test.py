@@ -0,0 +1,138 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from download_test import listdir, make_matrix
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import aio, query
+from ssgetpy.db import MatrixDB
+from ssgetpy.matrix import DownloadError
+
+
+def run(coroutine):
+    # asyncio.run needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class TestAsyncDownload(ServerTestCase):
+    def read_mtx(self, matrix):
+        path = os.path.join(self.destpath, matrix.name, matrix.name + ".mtx")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_yields_matrices_as_completed(self):
+        matrices = [make_matrix(i, f"m{i}") for i in range(1, 6)]
+        for matrix in matrices:
+            make_bundle(self.server.root, "HB", matrix.name, b"%d" % matrix.id)
+
+        done = run(
+            collect(
+                aio.as_completed(
+                    matrices, "MM", self.destpath, extract=True, workers=3
+                )
+            )
+        )
+
+        self.assertEqual(sorted(m.id for m in done), [1, 2, 3, 4, 5])
+        for matrix in matrices:
+            self.assertEqual(self.read_mtx(matrix), b"%d" % matrix.id)
+
+    def test_errors_are_raised_after_the_rest(self):
+        matrices = [make_matrix(1, "present"), make_matrix(2, "missing")]
+        make_bundle(self.server.root, "HB", "present")
+        done = []
+
+        async def consume():
+            async for matrix in aio.as_completed(
+                matrices, "MM", self.destpath
+            ):
+                done.append(matrix)
+
+        with self.assertRaises(DownloadError) as cm:
+            run(consume())
+
+        self.assertEqual([m.name for m in done], ["present"])
+        self.assertEqual([m.name for m, _ in cm.exception.errors], ["missing"])
+
+    @mock.patch("ssgetpy.transfer.RETRY_BACKOFF", 0)
+    def test_retries_interrupted_transfer(self):
+        content = os.urandom(200000)
+        make_bundle(self.server.root, "HB", "big", content)
+        url = "/MM/HB/big.tar.gz"
+        self.server.truncate[url] = 50000
+        matrix = make_matrix(1, "big")
+
+        run(matrix.download_async("MM", self.destpath, extract=True))
+
+        self.assertEqual(self.read_mtx(matrix), content)
+        self.assertEqual(self.server.requests, [url] * 2)
+        self.assertEqual(listdir(self.destpath), ["big"])
+
+    def test_resumes_partial_file(self):
+        bundle = make_bundle(self.server.root, "HB", "big", os.urandom(20000))
+        matrix = make_matrix(1, "big")
+        localdest = matrix.localpath("MM", self.destpath)[1]
+        with open(bundle, "rb") as f:
+            expected = f.read()
+        with open(localdest + ".part", "wb") as f:
+            f.write(expected[:5000])
+
+        run(aio.download(matrix, "MM", self.destpath))
+
+        self.assertEqual(self.server.range_requests, ["bytes=5000-"])
+        with open(localdest, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_executor_fallback_without_aiohttp(self):
+        make_bundle(self.server.root, "HB", "m1", b"1")
+        matrix = make_matrix(1, "m1")
+
+        with mock.patch("ssgetpy.aio._aiohttp", return_value=None):
+            run(aio.download(matrix, "MM", self.destpath, extract=True))
+
+        self.assertEqual(self.read_mtx(matrix), b"1")
+
+
+class TestAsyncSearch(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        db = MatrixDB(os.path.join(tmpdir, "index.db"))
+        self.addCleanup(db.conn.close)
+        db.insert(
+            (i, "HB", f"m{i}", 10, 10, 20, "real", 0, 0, 1.0, 1.0, "k")
+            for i in range(1, 6)
+        )
+        patcher = mock.patch("ssgetpy.dbinstance._instance", db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_searches_from_executor_threads(self):
+        async def concurrently():
+            return await asyncio.gather(
+                aio.search(group="HB", cache=False),
+                aio.search(name="m2", cache=False),
+            )
+
+        self.assertEqual(len(query.search(group="HB")), 5)
+        self.assertEqual(len(run(aio.search(group="HB"))), 5)
+        everything, named = run(concurrently())
+
+        self.assertEqual(len(everything), 5)
+        self.assertEqual([m.name for m in named], ["m2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+)
+
+from benchmarks import bench  # noqa: E402
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_quick_run(self):
+        report = bench.run(quick=True, repeat=1)
+
+        names = {result["name"] for result in report["results"]}
+        self.assertTrue(
+            {"index_build", "search", "download", "extract", "fetch"} <= names
+        )
+        self.assertTrue(
+            all(result["seconds"] > 0 for result in report["results"])
+        )
+
+    def test_compare_flags_slowdowns(self):
+        baseline = dict(
+            results=[
+                dict(name="search", params=dict(query="id"), seconds=1.0),
+                dict(name="fetch", params=dict(workers=1), seconds=1.0),
+            ]
+        )
+        report = dict(
+            results=[
+                dict(name="search", params=dict(query="id"), seconds=1.1),
+                dict(name="fetch", params=dict(workers=1), seconds=2.0),
+            ]
+        )
+
+        regressions = bench.compare(report, baseline, tolerance=0.25)
+
+        self.assertEqual([r["name"] for r, _ in regressions], ["fetch"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from download_test import make_matrix
+
+from ssgetpy import query
+from ssgetpy.cache import MatrixCache
+
+
+class TestMatrixCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = MatrixCache(
+            os.path.join(self.root, "index.db"), self.root, quota=250
+        )
+        self.clock = iter(range(1000))
+        patcher = mock.patch(
+            "ssgetpy.cache.time.time", lambda: next(self.clock)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, identifier, size):
+        matrix = make_matrix(identifier, f"m{identifier}")
+        path = os.path.join(self.root, "MM", "HB", matrix.name + ".tar.gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        self.cache.add(matrix, "MM", path)
+        return matrix, path
+
+    def test_evicts_least_recently_used(self):
+        _, first = self.add(1, 100)
+        _, second = self.add(2, 100)
+        self.cache.touch(first)
+
+        _, third = self.add(3, 100)
+
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(third))
+        self.assertEqual(self.cache.usage(), 200)
+
+    def test_pinned_matrices_are_kept(self):
+        matrix, first = self.add(1, 100)
+        self.cache.pin(matrix, "MM")
+        _, second = self.add(2, 100)
+
+        evicted = self.cache.trim(quota=50)
+
+        self.assertEqual([entry.path for entry in evicted], [second])
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(self.cache.entries()[0].pinned)
+
+    def test_reserve_makes_room_before_download(self):
+        _, first = self.add(1, 100)
+        _, second = self.add(2, 100)
+
+        self.cache.reserve(100)
+
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+    def test_touch_records_earlier_downloads(self):
+        matrix = make_matrix(1, "m1")
+        path = os.path.join(self.root, "MM", "HB", "m1.tar.gz")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+
+        self.cache.touch(path, matrix, "MM")
+
+        [entry] = self.cache.entries()
+        self.assertEqual((entry.path, entry.size), (path, 100))
+
+    def test_pin_from_command_line(self):
+        matrix = make_matrix(1, "m1")
+        with mock.patch("ssgetpy.cache._cache", self.cache), mock.patch(
+            "ssgetpy.query.search", return_value=[matrix]
+        ), mock.patch("ssgetpy.query.fetch") as fetch:
+            query.cli(["-n", "m1", "--pin", "-q"])
+            pinned = self.cache.conn.execute(
+                "SELECT * FROM CACHE_PINS"
+            ).fetchall()
+            query.cli(["-n", "m1", "--unpin", "-q"])
+
+        self.assertEqual(pinned, [("MM", "HB", "m1")])
+        fetch.assert_not_called()
+
+    def test_only_manages_paths_under_root(self):
+        self.assertTrue(self.cache.manages(os.path.join(self.root, "MM")))
+        self.assertFalse(self.cache.manages(tempfile.gettempdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()
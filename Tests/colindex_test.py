@@ -0,0 +1,91 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from ssgetpy.db import MatrixDB
+
+try:
+    from ssgetpy.colindex import ColumnarIndex
+except ImportError:
+    ColumnarIndex = None
+
+
+def random_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        rows = rng.randint(1, 10000)
+        yield (
+            i,
+            rng.choice(["HB", "Boeing", "Schenk"]),
+            rng.choice(["ash", "c-", "west", "bcsstk"]) + str(i),
+            rows,
+            rng.choice([rows, rng.randint(1, 10000)]),
+            rng.randint(1, 100000),
+            rng.choice(["real", "complex", "binary"]),
+            rng.random() < 0.5,
+            rng.random() < 0.3,
+            rng.random(),
+            rng.random(),
+            rng.choice(["structural problem", "circuit simulation problem"]),
+        )
+
+
+QUERIES = [
+    dict(group="HB"),
+    dict(name="c-"),
+    dict(name="As_1"),
+    dict(rowbounds=(None, 1000), colbounds=(500, None)),
+    dict(nzbounds=(100, 5000), dtype="real", isspd=True),
+    dict(kind="circuit", is2d3d=False),
+    dict(group="missing"),
+    dict(matid=17),
+]
+
+
+@unittest.skipIf(ColumnarIndex is None, "NumPy is not installed")
+class TestColumnarIndex(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        self.db = MatrixDB(os.path.join(tmpdir, "index.db"))
+        self.addCleanup(self.db.conn.close)
+        self.db.refresh(random_rows(500))
+        self.index = ColumnarIndex.from_db(self.db)
+
+    def test_matches_sql_search(self):
+        for query in QUERIES:
+            expected = sorted(
+                m.id for m in self.db.search(limit=None, **query)
+            )
+            actual = [m.id for m in self.index.search(limit=None, **query)]
+            self.assertEqual(actual, expected, query)
+
+    def test_batched_masks(self):
+        masks = self.index.masks(QUERIES)
+        self.assertEqual(masks.shape, (len(QUERIES), 500))
+        for query, mask in zip(QUERIES, masks):
+            self.assertEqual(mask.sum(), self.index.count(**query))
+        results = self.index.search_many(QUERIES, limit=3)
+        self.assertEqual(
+            [m.id for m in results[0]],
+            [m.id for m in self.db.search(group="HB", limit=3)],
+        )
+
+    def test_symmetry_bounds(self):
+        for matrix in self.index.search(limit=None, psymbounds=(0.9, None)):
+            self.assertGreaterEqual(matrix.psym, 0.9)
+
+    def test_unknown_criteria(self):
+        with self.assertRaises(TypeError):
+            self.index.search(text="ash")
+        with self.assertRaises(TypeError):
+            self.index.search_many([dict(group="HB"), dict(nnzbounds=(1, 2))])
+        self.assertEqual(
+            len(self.index.search_many([dict(group="HB", limit=2)])[0]), 2
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,322 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from localserver import LocalServer, make_bundle
+
+from ssgetpy import dbinstance, events, integrity
+from ssgetpy.cache import MatrixCache
+from ssgetpy.db import MatrixDB
+from ssgetpy.matrix import MatrixArray
+
+ROWS = [
+    (1, "HB", "ash85", 85, 85, 523, "binary", False, True, 1.0, 1.0, "a"),
+    (2, "HB", "bcsstk01", 48, 48, 400, "real", False, True, 1.0, 1.0, "b"),
+    (3, "HB", "west0067", 67, 67, 294, "real", False, False, 0.0, 0.0, "c"),
+]
+
+CSV = """3
+01-Jan-2020 00:00:00
+HB,ash85,85,85,523,1,1,0,1,1.0,1.0,a
+HB,bcsstk01,48,48,400,1,0,0,1,1.0,1.0,b
+HB,west0067,67,67,294,1,0,0,0,0.0,0.0,c
+"""
+
+
+class TestMatrixDB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.db = MatrixDB(os.path.join(self.tmpdir, "index.db"))
+        self.addCleanup(self.db.conn.close)
+
+    def test_refresh_upserts_rows(self):
+        self.db.refresh(ROWS, '"v1"', "Wed, 01 Jan 2020 00:00:00 GMT")
+        changed = (2, "HB", "bcsstk01", 48, 48, 401, "real", False, True)
+        rows = [ROWS[0], changed + (1.0, 1.0, "b")]
+
+        self.db.refresh(rows, '"v2"', None)
+
+        self.assertEqual(self.db.dump(), [tuple(r) for r in rows])
+        self.assertEqual(self.db.validators, ('"v2"', None))
+
+    def test_refresh_without_upsert(self):
+        # Stands in for SQLite versions before 3.24
+        self.db.upsert = False
+        self.test_refresh_upserts_rows()
+        self.assertEqual([m.id for m in self.db.search(text="bcsstk")], [2])
+
+    def _plan(self, **kwargs):
+        querystring, params = self.db._build_query(**kwargs)
+        return " ".join(
+            row[-1]
+            for row in self.db.conn.execute(
+                "EXPLAIN QUERY PLAN " + querystring, params
+            )
+        )
+
+    def test_searches_use_indexes(self):
+        self.db.refresh(ROWS)
+        self.assertIn(
+            "USING INDEX MATRICES_matrixgroup", self._plan(group="HB")
+        )
+        self.assertIn("USING INDEX MATRICES_dtype", self._plan(dtype="real"))
+        self.assertRegex(
+            self._plan(rowbounds=(10, 100), colbounds=(None, 50)),
+            "USING INDEX MATRICES_(rows|cols)",
+        )
+        self.assertIn(
+            "USING INDEX MATRICES_nnz", self._plan(nzbounds=(None, 500))
+        )
+
+    def test_values_are_bound_as_parameters(self):
+        self.db.refresh(ROWS)
+        self.assertEqual(len(self.db.search(name="x' OR '1'='1")), 0)
+        self.assertEqual(len(self.db.search(group="HB", limit=None)), 3)
+
+    def test_columnar_results(self):
+        self.db.refresh(ROWS)
+        matrices = self.db.search(limit=None)
+        array = self.db.search(limit=None, columnar=True)
+
+        self.assertIsInstance(array, MatrixArray)
+        self.assertEqual(len(array), 3)
+        self.assertEqual(
+            [m.to_tuple() for m in array], [m.to_tuple() for m in matrices]
+        )
+        self.assertEqual(array[1:]._repr_html_(), matrices[1:]._repr_html_())
+        self.assertFalse(hasattr(array[0], "__dict__"))
+
+    def test_search_results_are_cached(self):
+        self.db.refresh(ROWS)
+        first = self.db.search(group="HB", nzbounds=(None, 450))
+        first.append(None)
+        first[0].nnz = 0
+        second = self.db.search(group="HB", nzbounds=[None, 450.0])
+
+        self.assertEqual([m.id for m in second], [2, 3])
+        self.assertEqual(second[0].nnz, 400)
+        self.assertEqual(self.db.cache_info()[:2], (1, 1))
+
+        self.db.search(group="HB", nzbounds=(None, 450), cache=False)
+        self.assertEqual(self.db.cache_info()[:2], (1, 1))
+
+    def test_cache_is_invalidated_by_changes(self):
+        self.db.refresh(ROWS[:2])
+        self.assertEqual(len(self.db.search(limit=None)), 2)
+        self.db.insert(ROWS[2:])
+        self.assertEqual(len(self.db.search(limit=None)), 3)
+
+        # A refresh made through another connection is also noticed
+        other = MatrixDB(self.db.db)
+        other.refresh(ROWS[:1])
+        other.conn.close()
+        self.assertEqual(len(self.db.search(limit=None)), 1)
+        self.assertEqual(self.db.cache_info().hits, 0)
+
+    def test_cache_survives_checks(self):
+        self.db.refresh(ROWS)
+        self.db.search(limit=None)
+        self.db.mark_current('"etag"')
+        self.db.search(limit=None)
+
+        self.assertEqual(self.db.cache_info().hits, 1)
+
+    def test_cache_evicts_least_recently_used(self):
+        self.db.cache_size = 2
+        self.db.refresh(ROWS)
+        for matid in (1, 2, 1, 3):
+            self.db.search(matid)
+
+        self.assertEqual(self.db.cache_info(), (1, 3, 2, 2))
+        self.db.search(1)
+        self.db.search(2)
+        self.assertEqual(self.db.cache_info().misses, 4)
+
+    def _text_rows(self):
+        return ROWS + [
+            (4, "Ckt", "rajat01", 6, 6, 9, "real", 0, 0, 0.0, 0.0, "circuit"),
+            (
+                5,
+                "Sim",
+                "circuit_1",
+                9,
+                9,
+                9,
+                "real",
+                0,
+                0,
+                0.0,
+                0.0,
+                "circuit simulation problem",
+            ),
+        ]
+
+    def test_text_search(self):
+        self.db.refresh(self._text_rows())
+
+        self.assertEqual(
+            [m.id for m in self.db.search(text="circuit sim")], [5]
+        )
+        self.assertEqual(
+            [m.id for m in self.db.search(text="circ", limit=None)], [5, 4]
+        )
+        self.assertEqual(len(self.db.search(text="ckt rajat")), 1)
+        self.assertRegex(
+            self._plan(text="circuit"),
+            "MATRICES_fts VIRTUAL TABLE INDEX .* USING INTEGER PRIMARY KEY",
+        )
+
+        # The full-text index follows updates and deletions
+        self.db.refresh(self._text_rows()[:4])
+        self.assertEqual([m.id for m in self.db.search(text="circ")], [4])
+
+    def test_text_search_without_fts(self):
+        with mock.patch.object(MatrixDB, "_create_fts_table") as create:
+            create.return_value = False
+            db = MatrixDB(os.path.join(self.tmpdir, "plain.db"))
+        self.addCleanup(db.conn.close)
+        db.refresh(self._text_rows())
+
+        self.assertEqual([m.id for m in db.search(text="circuit sim")], [5])
+        self.assertEqual(
+            [m.id for m in db.search(text="circ", limit=None)], [4, 5]
+        )
+
+    def test_existing_rows_are_indexed(self):
+        self.db.refresh(self._text_rows())
+        self.db.conn.execute(f"DROP TABLE {self.db.fts_table}")
+        self.db.conn.commit()
+
+        db = MatrixDB(self.db.db)
+        self.addCleanup(db.conn.close)
+        self.assertEqual(len(db.search(text="circuit", limit=None)), 2)
+
+    def test_order_by(self):
+        self.db.refresh(ROWS)
+        self.assertEqual(
+            [m.id for m in self.db.search(order_by="nnz desc")], [1, 2, 3]
+        )
+        self.assertEqual(
+            [m.id for m in self.db.search(order_by=["isspd", "-rows"])],
+            [3, 1, 2],
+        )
+        self.assertIn(
+            "SCAN MATRICES USING INDEX MATRICES_nnz",
+            self._plan(order_by="nnz desc"),
+        )
+        for order_by in ("size", "nnz; DROP TABLE MATRICES", "nnz up"):
+            with self.assertRaises(ValueError):
+                self.db.search(order_by=order_by)
+
+    def test_keyset_pagination(self):
+        rows = [
+            (i, "G", f"m{i}", 1, 1, i % 4, "real", 0, 0, 0.0, 0.0, "k")
+            for i in range(1, 21)
+        ]
+        self.db.refresh(rows)
+        for order_by in (None, "nnz desc", "nnz, name desc"):
+            expected = [
+                m.id for m in self.db.search(order_by=order_by, limit=None)
+            ]
+            pages = [self.db.search(order_by=order_by, limit=3)]
+            while pages[-1]:
+                pages.append(
+                    self.db.search(
+                        order_by=order_by,
+                        after_id=pages[-1][-1].id,
+                        limit=3,
+                    )
+                )
+            self.assertEqual([m.id for p in pages for m in p], expected)
+
+    def test_keyset_pagination_with_nulls(self):
+        rows = [
+            (i, "G", f"m{i}", 1, 1, 1, "real", 0, 0, None, 0.0, "k")
+            for i in range(1, 7)
+        ]
+        for i in (2, 5):
+            rows[i] = rows[i][:9] + (float(i),) + rows[i][10:]
+        self.db.refresh(rows)
+        for order_by in ("psym", "psym desc", "psym desc, id desc"):
+            expected = [
+                m.id for m in self.db.search(order_by=order_by, limit=None)
+            ]
+            pages = [self.db.search(order_by=order_by, limit=2)]
+            while pages[-1]:
+                pages.append(
+                    self.db.search(
+                        order_by=order_by, after_id=pages[-1][-1].id, limit=2
+                    )
+                )
+            self.assertEqual([m.id for p in pages for m in p], expected)
+
+        with self.assertRaises(ValueError):
+            self.db.search(after_id=99)
+
+    def test_search_iter(self):
+        self.db.refresh(ROWS)
+        matrices = self.db.search_iter(batch_size=2, order_by="-id")
+        self.assertEqual(next(matrices).id, 3)
+        self.assertEqual([m.id for m in matrices], [2, 1])
+        self.assertEqual(len(list(self.db.search_iter(group="HB"))), 3)
+        self.assertEqual(
+            [m.id for m in self.db.search_iter(batch_size=2, limit=3)],
+            [1, 2, 3],
+        )
+
+    def test_download_inside_search_iter(self):
+        # The manifest and the cache write to the same database file
+        self.db.refresh(ROWS)
+        with LocalServer() as server, mock.patch(
+            "ssgetpy.config.SS_ROOT_URL", server.url
+        ), mock.patch(
+            "ssgetpy.integrity._manifest", integrity.Manifest(self.db.db)
+        ), mock.patch(
+            "ssgetpy.cache._cache",
+            MatrixCache(self.db.db, self.tmpdir, None),
+        ):
+            for matrix in self.db.search_iter(batch_size=2):
+                make_bundle(server.root, matrix.group, matrix.name, b"x")
+                matrix.download(
+                    "MM",
+                    self.tmpdir,
+                    extract=True,
+                    reporter=events.Reporter(),
+                )
+
+            self.assertEqual(len(server.requests), len(ROWS))
+            self.assertEqual(
+                len(integrity.get_manifest().entries()), len(ROWS)
+            )
+
+    def test_journal_mode(self):
+        mode = self.db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "delete")
+
+        with mock.patch("ssgetpy.db.SS_JOURNAL_MODE", "WAL"):
+            db = MatrixDB(os.path.join(self.tmpdir, "wal.db"))
+        mode = db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_conditional_refresh(self):
+        with LocalServer() as server:
+            os.makedirs(os.path.join(server.root, "files"))
+            with open(
+                os.path.join(server.root, "files", "ssstats.csv"), "w"
+            ) as f:
+                f.write(CSV)
+            url = server.url + "/files/ssstats.csv"
+            with mock.patch("ssgetpy.config.SS_INDEX_URL", url):
+                self.assertTrue(dbinstance.refresh_index(self.db))
+                self.assertFalse(dbinstance.refresh_index(self.db))
+                self.assertTrue(dbinstance.refresh_index(self.db, force=True))
+
+        self.assertEqual(self.db.nrows, 3)
+        self.assertEqual(self.db.search(name="west")[0].id, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import unittest
+from unittest import mock
+
+import requests
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import transfer
+from ssgetpy.matrix import DownloadError, Matrix, MatrixList
+from ssgetpy.transfer import TokenBucket
+
+
+def make_matrix(identifier, name, group="HB"):
+    return Matrix(
+        identifier,
+        group,
+        name,
+        10,
+        10,
+        20,
+        "real",
+        False,
+        False,
+        1.0,
+        1.0,
+        "test problem",
+    )
+
+
+def listdir(path):
+    # Leaves out the lock files kept next to downloads
+    return [name for name in os.listdir(path) if not name.endswith(".lock")]
+
+
+class TestDownload(ServerTestCase):
+    def test_concurrent_download(self):
+        matrices = MatrixList(make_matrix(i, f"m{i}") for i in range(1, 6))
+        for matrix in matrices:
+            make_bundle(self.server.root, "HB", matrix.name, b"%d" % matrix.id)
+
+        matrices.download("MM", self.destpath, extract=True, workers=4)
+
+        for matrix in matrices:
+            mtx = os.path.join(
+                self.destpath, matrix.name, matrix.name + ".mtx"
+            )
+            with open(mtx, "rb") as f:
+                self.assertEqual(f.read(), b"%d" % matrix.id)
+
+    def test_errors_are_collected(self):
+        matrices = MatrixList(
+            [make_matrix(1, "present"), make_matrix(2, "missing")]
+        )
+        make_bundle(self.server.root, "HB", "present")
+
+        with self.assertRaises(DownloadError) as cm:
+            matrices.download("MM", self.destpath, workers=2)
+
+        self.assertEqual([m.name for m, _ in cm.exception.errors], ["missing"])
+        self.assertTrue(
+            os.path.exists(os.path.join(self.destpath, "present.tar.gz"))
+        )
+
+    def test_progress_counts_bytes(self):
+        path = make_bundle(self.server.root, "HB", "big", os.urandom(300000))
+        reporter = mock.Mock()
+        matrix = make_matrix(1, "big")
+
+        matrix.download("MM", self.destpath, reporter=reporter)
+
+        size = os.path.getsize(path)
+        reporter.total.assert_called_once_with(matrix, size)
+        self.assertEqual(
+            sum(c.args[2] for c in reporter.progress.call_args_list), size
+        )
+
+    def _bundle_url(self, name):
+        return f"/MM/HB/{name}.tar.gz"
+
+    @mock.patch("ssgetpy.transfer.RETRY_BACKOFF", 0)
+    def test_resume_after_interruption(self):
+        content = os.urandom(200000)
+        make_bundle(self.server.root, "HB", "big", content)
+        self.server.truncate[self._bundle_url("big")] = 50000
+
+        make_matrix(1, "big").download(
+            "MM", self.destpath, extract=True, chunk_size=10000
+        )
+
+        with open(os.path.join(self.destpath, "big", "big.mtx"), "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.server.requests, [self._bundle_url("big")] * 2)
+        self.assertEqual(self.server.range_requests, ["bytes=50000-"])
+        # The bundle is unpacked as it streams in, so nothing else is saved
+        self.assertEqual(listdir(self.destpath), ["big"])
+
+    @mock.patch("ssgetpy.transfer.RETRIES", 0)
+    def test_partial_file_is_not_served(self):
+        make_bundle(self.server.root, "HB", "big", os.urandom(200000))
+        self.server.truncate[self._bundle_url("big")] = 50000
+        matrix = make_matrix(1, "big")
+
+        with self.assertRaises(Exception):
+            matrix.download("MM", self.destpath, chunk_size=10000)
+        localdest = matrix.localpath("MM", self.destpath)[1]
+        self.assertFalse(os.path.exists(localdest))
+        self.assertEqual(os.path.getsize(localdest + ".part"), 50000)
+
+        # The next attempt picks up where the previous one stopped
+        matrix.download("MM", self.destpath)
+        self.assertEqual(self.server.requests[-1:], [self._bundle_url("big")])
+        with open(
+            os.path.join(self.server.root, "MM", "HB", "big.tar.gz"), "rb"
+        ) as expected, open(localdest, "rb") as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def _download_over_stale_part(self):
+        # Resumes a 20-byte partial file against a 10-byte body
+        content = b"0123456789"
+        with open(os.path.join(self.server.root, "small.bin"), "wb") as f:
+            f.write(content)
+        localdest = os.path.join(self.destpath, "small.bin")
+        with open(localdest + transfer.PART_SUFFIX, "wb") as f:
+            f.write(b"x" * 20)
+        digest = hashlib.sha256()
+
+        nbytes = transfer.download(
+            self.server.url + "/small.bin", localdest, digest=digest
+        )
+
+        self.assertEqual(nbytes, len(content))
+        with open(localdest, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(
+            digest.hexdigest(), hashlib.sha256(content).hexdigest()
+        )
+
+    @mock.patch("ssgetpy.transfer.RETRIES", 0)
+    def test_stale_partial_file_is_replaced(self):
+        self._download_over_stale_part()
+        self.assertEqual(self.server.range_requests, ["bytes=20-"])
+
+    @mock.patch("ssgetpy.transfer.RETRIES", 0)
+    def test_stale_partial_file_is_replaced_without_ranges(self):
+        self.server.ranges = False
+        self._download_over_stale_part()
+
+    def test_connection_failures_are_left_to_the_session(self):
+        # net.get has retried the connection before it raises
+        error = requests.ConnectionError("refused")
+        with mock.patch("ssgetpy.net.get", side_effect=error) as get:
+            with self.assertRaises(requests.ConnectionError):
+                transfer.RemoteFile(self.server.url + "/small.bin")
+
+        self.assertEqual(get.call_count, 1)
+
+
+class TestTokenBucket(unittest.TestCase):
+    @mock.patch("ssgetpy.transfer.time.sleep")
+    def test_sleeps_off_deficit(self, sleep):
+        bucket = TokenBucket(1000, capacity=100)
+        bucket.consume(100)
+        sleep.assert_not_called()
+        bucket.consume(200)
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.2, places=2)
+
+    def test_chunks_fit_in_small_bucket(self):
+        sizer = transfer._ChunkSizer(bucket=TokenBucket(1000, capacity=100))
+        sizer.adjust(transfer.TARGET_CHUNK_TIME * 4)
+        self.assertEqual(sizer.size, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import socket
+import unittest
+from unittest import mock
+
+from download_test import make_matrix
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import events
+
+
+class RecordingReporter(events.Reporter):
+    def __init__(self):
+        self.events = []
+
+    def phase_finished(self, matrix, phase, seconds, nbytes):
+        self.events.append(("phase", phase, nbytes))
+
+    def retry(self, matrix, phase, attempt, error):
+        self.events.append(("retry", phase, attempt))
+
+    def finished(self, matrix, seconds, error=None):
+        self.events.append(("finished", error is None))
+
+
+class TestEvents(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reporter = RecordingReporter()
+
+    def test_phases_of_a_download(self):
+        path = make_bundle(self.server.root, "HB", "m", os.urandom(5000))
+        matrix = make_matrix(1, "m")
+
+        matrix.download("MM", self.destpath, reporter=self.reporter)
+        matrix.download("MM", self.destpath, True, self.reporter)
+
+        size = os.path.getsize(path)
+        self.assertEqual(
+            self.reporter.events,
+            [
+                ("phase", "connect", 0),
+                ("phase", "transfer", size),
+                ("phase", "verify", 0),
+                ("finished", True),
+                ("phase", "extract", 0),
+                ("finished", True),
+            ],
+        )
+
+    @mock.patch("ssgetpy.transfer.RETRY_BACKOFF", 0)
+    def test_retries_are_reported(self):
+        make_bundle(self.server.root, "HB", "m", os.urandom(200000))
+        self.server.truncate["/MM/HB/m.tar.gz"] = 50000
+
+        make_matrix(1, "m").download(
+            "MM", self.destpath, reporter=self.reporter, chunk_size=10000
+        )
+
+        self.assertIn(("retry", "transfer", 1), self.reporter.events)
+
+    def test_failures_are_reported(self):
+        with self.assertRaises(Exception):
+            make_matrix(1, "missing").download(
+                "MM", self.destpath, reporter=self.reporter
+            )
+
+        self.assertEqual(
+            self.reporter.events,
+            [("phase", "connect", 0), ("finished", False)],
+        )
+
+    def test_json_lines(self):
+        make_bundle(self.server.root, "HB", "m", b"data")
+        output = io.StringIO()
+
+        make_matrix(7, "m").download(
+            "MM",
+            self.destpath,
+            True,
+            events.MultiReporter(
+                events.JSONLinesReporter(output), self.reporter
+            ),
+        )
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(
+            [r.get("phase", r["event"]) for r in records],
+            ["connect", "transfer", "verify", "finished"],
+        )
+        self.assertEqual(records[0]["matrix"], "HB/m")
+        self.assertIn("bytes_per_second", records[1])
+        self.assertEqual(len(self.reporter.events), 4)
+
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(receiver.close)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+        reporter = events.StatsDReporter(*receiver.getsockname())
+        self.addCleanup(reporter.close)
+
+        reporter.phase_finished(make_matrix(1, "m"), "transfer", 0.5, 1000)
+
+        self.assertEqual(
+            receiver.recv(1024).decode().split("\n"),
+            [
+                "ssgetpy.transfer.time:500.000|ms",
+                "ssgetpy.transfer.bytes:1000|c",
+                "ssgetpy.transfer.bytes_per_second:2000|g",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
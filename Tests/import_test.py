@@ -0,0 +1,101 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# `import ssgetpy` must stay cheap enough for worker processes that only
+# build URLs, so these modules should only be loaded once a query or
+# download needs them; this is checked in a fresh interpreter.
+DEFERRED = (
+    "requests",
+    "urllib3",
+    "tqdm",
+    "sqlite3",
+    "numpy",
+    "scipy",
+    "concurrent.futures",
+)
+
+# A generous limit, in seconds, on the fastest of a few fresh imports, so
+# that a slow or busy machine does not fail it
+IMPORT_BUDGET = 0.5
+
+SCRIPT = """
+import sys
+import ssgetpy
+print(",".join(m for m in %r if m in sys.modules))
+""" % (DEFERRED,)
+
+TIMED_IMPORT = """
+import time
+start = time.perf_counter()
+import ssgetpy
+print(time.perf_counter() - start)
+"""
+
+
+# Runs the first search on a machine that has never used ssgetpy
+FIRST_SEARCH = """
+from unittest import mock
+import ssgetpy
+from ssgetpy import csvindex
+row = (1, "HB", "ash85", 85, 85, 523, "binary", 0, 1, 1.0, 1.0, "kind")
+update = csvindex.IndexUpdate([row], None, None)
+with mock.patch.object(csvindex, "download_index", return_value=update):
+    print(ssgetpy.search(1)[0].name)
+"""
+
+
+def run_in_empty_home(script):
+    # Returns the lines printed by `script` and the new HOME directory
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, APPDATA=home)
+    output = subprocess.check_output(
+        [sys.executable, "-c", script],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        universal_newlines=True,
+    ).splitlines()
+    return output, home
+
+
+class TestImport(unittest.TestCase):
+    def test_import_is_lazy(self):
+        output, home = run_in_empty_home(SCRIPT)
+
+        self.assertEqual(output, [""])
+        # Nothing is created on disk until the index is first queried
+        self.assertEqual(os.listdir(home), [])
+        os.rmdir(home)
+
+    def test_import_is_fast(self):
+        timings = []
+        for _ in range(3):
+            output, home = run_in_empty_home(TIMED_IMPORT)
+            os.rmdir(home)
+            timings.append(float(output[0]))
+
+        self.assertLess(min(timings), IMPORT_BUDGET)
+
+    def test_first_search_creates_ss_dir(self):
+        output, home = run_in_empty_home(FIRST_SEARCH)
+        self.addCleanup(shutil.rmtree, home, ignore_errors=True)
+
+        self.assertEqual(output, ["ash85"])
+        self.assertIn("index.db", os.listdir(os.path.join(home, ".ssgetpy")))
+
+    def test_instance_is_created_on_first_use(self):
+        from ssgetpy import dbinstance
+
+        with mock.patch(
+            "ssgetpy.dbinstance.get_instance", return_value="db"
+        ) as get_instance:
+            self.assertEqual(dbinstance.instance, "db")
+        get_instance.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import unittest
+
+from download_test import make_matrix
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import integrity
+
+
+def sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def corrupt(path, keep_mtime=False):
+    # Overwrites the first byte of `path` without changing its size
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        first = f.read(1)
+        f.seek(0)
+        f.write(b"y" if first != b"y" else b"z")
+    if keep_mtime:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+class TestIntegrity(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manifest = integrity.get_manifest()
+
+    def test_records_checksum_of_download(self):
+        make_bundle(self.server.root, "HB", "plain", os.urandom(50000))
+        path, _ = make_matrix(1, "plain").download("MM", self.destpath)
+
+        [entry] = self.manifest.entries(path)
+
+        self.assertEqual(entry.digest, sha256(path))
+        self.assertEqual(entry.size, os.path.getsize(path))
+
+    def test_records_checksums_of_unpacked_files(self):
+        make_bundle(self.server.root, "HB", "packed", b"contents")
+        path, _ = make_matrix(1, "packed").download(
+            "MM", self.destpath, extract=True
+        )
+
+        [entry] = self.manifest.entries(path)
+
+        self.assertEqual(entry.path, os.path.join(path, "packed.mtx"))
+        self.assertEqual(entry.digest, sha256(entry.path))
+
+    def test_changed_file_is_downloaded_again(self):
+        make_bundle(self.server.root, "HB", "changed", b"contents")
+        matrix = make_matrix(1, "changed")
+        path, _ = matrix.download("MM", self.destpath, extract=True)
+        mtx = os.path.join(path, "changed.mtx")
+        corrupt(mtx)
+
+        matrix.download("MM", self.destpath, extract=True)
+
+        self.assertEqual(len(self.server.requests), 2)
+        with open(mtx, "rb") as f:
+            self.assertEqual(f.read(), b"contents")
+
+    def test_verify_finds_and_repairs_silent_corruption(self):
+        make_bundle(self.server.root, "HB", "silent", b"contents")
+        make_bundle(self.server.root, "HB", "intact", b"contents")
+        damaged, _ = make_matrix(1, "silent").download(
+            "MM", self.destpath, extract=True
+        )
+        intact, _ = make_matrix(2, "intact").download(
+            "MM", self.destpath, extract=True
+        )
+        corrupt(os.path.join(damaged, "silent.mtx"), keep_mtime=True)
+        self.assertTrue(self.manifest.check(damaged))
+
+        found = integrity.verify(workers=2)
+
+        self.assertEqual([entry.root for entry in found], [damaged])
+        self.assertFalse(os.path.exists(damaged))
+        self.assertEqual(self.manifest.entries(damaged), [])
+        self.assertTrue(os.path.exists(intact))
+
+    def test_resumed_download_has_checksum_of_whole_file(self):
+        make_bundle(self.server.root, "HB", "resumed", os.urandom(300000))
+        self.server.truncate["/MM/HB/resumed.tar.gz"] = 100000
+        path, _ = make_matrix(1, "resumed").download("MM", self.destpath)
+
+        [entry] = self.manifest.entries(path)
+
+        self.assertEqual(entry.digest, sha256(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+A small stand-in for the SuiteSparse web site used by the download tests.
+`LocalServer` serves a temporary directory laid out like `SS_ROOT_URL` and
+records every request it receives, and `ServerTestCase` points `ssgetpy`
+at one for the duration of each test.
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock
+
+from ssgetpy import cache, integrity
+
+
+def make_bundle(root, group, name, content=b"", format="MM"):
+    """
+    Writes a `<name>.tar.gz` bundle containing `<name>/<name>.mtx` (or
+    `.rb` for the RB format) under `root/<format>/<group>` and returns its
+    path.
+    """
+    directory = os.path.join(root, format, group)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + ".tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        extension = "rb" if format == "RB" else "mtx"
+        info = tarfile.TarInfo(f"{name}/{name}.{extension}")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Serves the files of `self.server.local`, a `LocalServer`
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def _serve(self, body):
+        local = self.server.local
+        local.requests.append(self.path)
+        if local.failures.get(self.path):
+            local.failures[self.path] -= 1
+            self.send_error(503)
+            return
+        relpath = self.path.split("?")[0].lstrip("/")
+        path = os.path.join(local.root, *relpath.split("/"))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        stat = os.stat(path)
+        etag = f'"{stat.st_size}-{stat.st_mtime_ns}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = self._start_response(local, len(data))
+        if start is None:
+            return
+        payload = data[start:]
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if body:
+            cut = local.truncate.pop(self.path, None)
+            self.wfile.write(payload[:cut])
+
+    def _start_response(self, local, size):
+        # Sends the status for a body of `size` bytes and returns the
+        # offset to send it from, or None if there is nothing to send
+        requested = self.headers.get("Range")
+        if requested:
+            local.range_requests.append(requested)
+        if not (requested and local.ranges):
+            self.send_response(200)
+            return 0
+        start = int(requested.split("=")[1].split("-")[0])
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return None
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        return start
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer:
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        self.requests = []
+        self.range_requests = []
+        # Paths whose next response is cut off after this many bytes
+        self.truncate = {}
+        # Paths that fail with 503 Service Unavailable this many times
+        self.failures = {}
+        self.ranges = True
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.local = self
+        threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Downloads from a `LocalServer`, `self.server`, into the temporary
+    directory `self.destpath`. The manifest and the cache are kept in a
+    database of their own, so that nothing is recorded in `SS_DB`.
+    """
+
+    def setUp(self):
+        self.server = LocalServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.destpath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destpath, ignore_errors=True)
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home, ignore_errors=True)
+        db = os.path.join(home, "index.db")
+        for target, value in [
+            ("ssgetpy.config.SS_ROOT_URL", self.server.url),
+            ("ssgetpy.integrity._manifest", integrity.Manifest(db)),
+            ("ssgetpy.cache._cache", cache.MatrixCache(db, home, None)),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from download_test import make_matrix
+from localserver import LocalServer, make_bundle
+
+from ssgetpy import cache, config, dbinstance, events, integrity, locking
+from ssgetpy.db import MatrixDB
+
+NAMES = ["m1", "m2", "m3", "m4"]
+
+
+def hold(path, locked, release):
+    # Runs in a child process
+    with locking.FileLock(path):
+        locked.set()
+        release.wait(30)
+
+
+def fetch_all(url, destpath, db):
+    # Runs in a child process; downloads every matrix in NAMES
+    config.set_root_url(url)
+    integrity._manifest = integrity.Manifest(db)
+    cache._cache = cache.MatrixCache(db, os.path.dirname(db), None)
+    contents = []
+    for i, name in enumerate(NAMES):
+        path, _ = make_matrix(i + 1, name).download(
+            "MM", destpath, extract=True, reporter=events.Reporter()
+        )
+        with open(os.path.join(path, name + ".mtx"), "rb") as f:
+            contents.append(f.read())
+    return contents
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, "test.lock")
+
+    def test_lock_held_by_another_process(self):
+        context = multiprocessing.get_context("spawn")
+        locked, release = context.Event(), context.Event()
+        child = context.Process(target=hold, args=(self.path, locked, release))
+        child.start()
+        self.addCleanup(child.join)
+        self.addCleanup(release.set)
+        self.assertTrue(locked.wait(30))
+
+        lock = locking.FileLock(self.path)
+        self.assertFalse(lock.acquire(blocking=False))
+        self.assertFalse(lock.acquire(timeout=0.1))
+
+        release.set()
+        self.assertTrue(lock.acquire(timeout=30))
+        self.assertTrue(lock.locked)
+        lock.release()
+
+    def test_threads_take_turns(self):
+        first = locking.FileLock(self.path)
+        second = locking.FileLock(self.path)
+        first.acquire()
+
+        self.assertFalse(second.acquire(blocking=False))
+        thread = threading.Thread(target=first.release)
+        thread.start()
+        thread.join()
+        self.assertTrue(second.acquire(blocking=False))
+        second.release()
+
+
+class TestConcurrentDownloads(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.destpath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destpath, ignore_errors=True)
+
+    def test_each_matrix_is_downloaded_once(self):
+        expected = []
+        for name in NAMES:
+            content = os.urandom(200000)
+            make_bundle(self.server.root, "HB", name, content)
+            expected.append(content)
+        db = os.path.join(self.destpath, "index.db")
+        integrity.Manifest(db)
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(8) as pool:
+            results = pool.starmap(
+                fetch_all, [(self.server.url, self.destpath, db)] * 8
+            )
+
+        self.assertEqual(results, [expected] * 8)
+        self.assertEqual(
+            sorted(self.server.requests),
+            [f"/MM/HB/{name}.tar.gz" for name in NAMES],
+        )
+        self.assertEqual(len(integrity.Manifest(db).entries()), len(NAMES))
+
+
+class TestRefreshIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, "index.db")
+        self.db = MatrixDB(self.path)
+
+    def refresh(self, results):
+        # Runs in a thread with its own connection, like another process
+        results.append(dbinstance.refresh_index(MatrixDB(self.path)))
+
+    def test_waits_for_refresh_in_progress(self):
+        results = []
+        with mock.patch("ssgetpy.csvindex.download_index") as download:
+            with locking.FileLock(self.path + ".lock"):
+                thread = threading.Thread(target=self.refresh, args=(results,))
+                thread.start()
+                thread.join(0.2)
+                self.assertTrue(thread.is_alive())
+                # Stands in for another process finishing a refresh
+                self.db.mark_current('"etag"')
+            thread.join()
+
+        self.assertEqual(results, [False])
+        download.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
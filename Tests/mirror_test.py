@@ -0,0 +1,149 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from download_test import listdir, make_matrix
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import config, events, mirror, net, query
+from ssgetpy.matrix import MatrixList
+
+
+class TestMirror(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.server.root, "files"))
+        with open(
+            os.path.join(self.server.root, "files", "ssstats.csv"), "w"
+        ) as f:
+            f.write("2\n2024-01-01\n")
+        patcher = mock.patch(
+            "ssgetpy.config.SS_INDEX_URL",
+            self.server.url + "/files/ssstats.csv",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = self.destpath
+        self.matrices = MatrixList(
+            [make_matrix(1, "m1"), make_matrix(2, "m2", "Other")]
+        )
+        for matrix in self.matrices:
+            make_bundle(
+                self.server.root, matrix.group, matrix.name, b"%d" % matrix.id
+            )
+            path = os.path.join(
+                self.server.root, *matrix.urlpath("MAT").split("/")
+            )
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"MATLAB 5.0 MAT-file %d" % matrix.id)
+
+    def mirror(self):
+        mirror.sync(
+            self.directory,
+            self.matrices,
+            ("MM", "MAT"),
+            reporter=events.Reporter(),
+        )
+
+    def test_sync_copies_the_layout_of_the_site(self):
+        self.mirror()
+
+        self.assertTrue(os.path.isfile(mirror.index_path(self.directory)))
+        for matrix in self.matrices:
+            for format in ("MM", "MAT"):
+                relpath = matrix.urlpath(format).split("/")
+                with open(os.path.join(self.server.root, *relpath), "rb") as f:
+                    expected = f.read()
+                path = mirror.matrix_path(self.directory, matrix, format)
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), expected)
+        self.assertEqual(
+            listdir(os.path.join(self.directory, "MM")), ["HB", "Other"]
+        )
+
+    def test_sync_skips_files_already_mirrored(self):
+        self.mirror()
+        del self.server.requests[:]
+
+        self.mirror()
+
+        self.assertEqual(self.server.requests, ["/files/ssstats.csv"])
+
+    def test_downloads_from_served_mirror(self):
+        self.mirror()
+        server = mirror.make_server(self.directory, 0, "127.0.0.1")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        config.set_root_url(f"http://{host}:{port}/")
+        destpath = os.path.join(self.directory, "downloads")
+        matrix = self.matrices[0]
+
+        path, _ = matrix.download("MM", destpath, extract=True)
+        response = net.get(
+            matrix.url("MAT"),
+            headers={"Range": "bytes=4-", "Accept-Encoding": "identity"},
+        )
+
+        with open(os.path.join(path, "m1.mtx"), "rb") as f:
+            self.assertEqual(f.read(), b"1")
+        self.assertEqual(response.status_code, 206)
+        with open(
+            mirror.matrix_path(self.directory, matrix, "MAT"), "rb"
+        ) as f:
+            self.assertEqual(response.content, f.read()[4:])
+        self.assertEqual(
+            net.get(config.SS_INDEX_URL).content, b"2\n2024-01-01\n"
+        )
+
+    def test_cli_mirrors_search_results(self):
+        with mock.patch(
+            "ssgetpy.query.search", return_value=self.matrices
+        ) as search, mock.patch("ssgetpy.mirror.sync") as sync:
+            query.cli(
+                [
+                    "mirror",
+                    self.directory,
+                    "-g",
+                    "HB",
+                    "-f",
+                    "MM",
+                    "-f",
+                    "MAT",
+                    "-q",
+                ]
+            )
+
+        self.assertEqual(search.call_args.kwargs["group"], "HB")
+        self.assertIsNone(search.call_args.kwargs["limit"])
+        sync.assert_called_once_with(
+            self.directory, self.matrices, ["MM", "MAT"], 4, None
+        )
+
+    def test_cli_requires_a_command(self):
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit):
+            mirror.cli([])
+
+
+class TestRootUrl(unittest.TestCase):
+    def test_urls_follow_root_url(self):
+        matrix = make_matrix(1, "m1")
+        with mock.patch("ssgetpy.config.SS_ROOT_URL"), mock.patch(
+            "ssgetpy.config.SS_INDEX_URL"
+        ):
+            config.set_root_url("http://mirror:8000/")
+
+            self.assertEqual(
+                matrix.url("MAT"), "http://mirror:8000/mat/HB/m1.mat"
+            )
+            self.assertEqual(
+                config.SS_INDEX_URL, "http://mirror:8000/files/ssstats.csv"
+            )
+            self.assertTrue(matrix.icon_url().startswith(config.SS_SITE_URL))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import unittest
+from unittest import mock
+
+import requests
+from urllib3.response import HTTPResponse
+from localserver import LocalServer
+
+from ssgetpy import csvindex, net
+
+
+class CannedAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers every request with `body` instead of going to the network.
+    """
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = HTTPResponse(
+            body=io.BytesIO(self.body), preload_content=False
+        )
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        previous = net.set_session(net.create_session(backoff=0))
+        self.addCleanup(net.set_session, previous)
+
+    def test_shared_session(self):
+        self.assertIs(net.get_session(), net.get_session())
+
+    def test_retries_server_errors(self):
+        with LocalServer() as server:
+            with open(f"{server.root}/index.csv", "wb") as f:
+                f.write(b"ok")
+            server.failures["/index.csv"] = 2
+
+            response = net.get(server.url + "/index.csv")
+
+            self.assertEqual(response.content, b"ok")
+            self.assertEqual(len(server.requests), 3)
+
+    def test_gives_up_after_retries(self):
+        net.set_session(net.create_session(retries=1, backoff=0))
+        with LocalServer() as server:
+            server.failures["/index.csv"] = 5
+
+            response = net.get(server.url + "/index.csv")
+
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(len(server.requests), 2)
+
+    def test_mounted_transport(self):
+        adapter = CannedAdapter(
+            b"2\n2020-01-01\nHB,ash85,85,85,523,1,0,0,1,1,1,kind\n"
+        )
+        url = "https://example.invalid/ssstats.csv"
+        net.mount("https://example.invalid/", adapter)
+
+        with mock.patch("ssgetpy.config.SS_INDEX_URL", url):
+            rows = list(csvindex.generate())
+
+        self.assertEqual(adapter.urls, [url])
+        self.assertEqual(rows[0][:3], (1, "HB", "ash85"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import os
+import shutil
+import threading
+import time
+import unittest
+from unittest import mock
+
+from download_test import make_matrix
+from events_test import RecordingReporter
+from localserver import ServerTestCase, make_bundle
+from readers_test import GENERAL, SYMMETRIC, readers
+
+from ssgetpy import pipeline
+from ssgetpy.matrix import DownloadError, MatrixList
+
+
+class TestPipeline(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reporter = RecordingReporter()
+        self.matrices = MatrixList(
+            make_matrix(i, f"m{i}") for i in range(1, 6)
+        )
+        for matrix in self.matrices:
+            make_bundle(self.server.root, "HB", matrix.name, GENERAL)
+
+    def test_downloads_and_extracts(self):
+        stats = self.matrices.download(
+            "MM",
+            self.destpath,
+            workers=2,
+            processes=2,
+            reporter=self.reporter,
+        )
+
+        for matrix in self.matrices:
+            directory = os.path.join(self.destpath, matrix.name)
+            with open(
+                os.path.join(directory, matrix.name + ".mtx"), "rb"
+            ) as f:
+                self.assertEqual(f.read(), GENERAL)
+            self.assertFalse(os.path.exists(directory + ".tar.gz"))
+        self.assertEqual([s.items for s in stats], [5, 5, 0])
+        self.assertGreater(stats[0].nbytes, 0)
+        phases = [e[1] for e in self.reporter.events if e[0] == "phase"]
+        for phase in ("connect", "transfer", "verify", "extract"):
+            self.assertEqual(phases.count(phase), 5)
+        self.assertEqual(self.reporter.events.count(("finished", True)), 5)
+
+        # Matrices already on disk are skipped
+        stats = self.matrices.download(
+            "MM", self.destpath, processes=1, reporter=self.reporter
+        )
+        self.assertEqual([s.items for s in stats], [0, 0, 0])
+        self.assertEqual(len(self.server.requests), 5)
+
+    @unittest.skipIf(readers is None, "requires NumPy and SciPy")
+    def test_converts(self):
+        pipeline.download(
+            self.matrices[:2],
+            "MM",
+            self.destpath,
+            processes=1,
+            convert=True,
+            reporter=self.reporter,
+        )
+
+        for matrix in self.matrices[:2]:
+            binarypath = matrix.binarypath("MM", self.destpath)
+            loaded = readers.read_binary(binarypath, "csr")
+            self.assertEqual(loaded.shape, (3, 4))
+            self.assertEqual(loaded.nnz, 5)
+
+        # A matrix downloaded again is converted again
+        matrix = self.matrices[0]
+        shutil.rmtree(os.path.join(self.destpath, matrix.name))
+        make_bundle(self.server.root, "HB", matrix.name, SYMMETRIC)
+        pipeline.download(
+            [matrix], "MM", self.destpath, processes=1, convert=True
+        )
+        binarypath = matrix.binarypath("MM", self.destpath)
+        self.assertEqual(readers.read_binary(binarypath)[0, 1], -1)
+
+    def test_downloads_mat_files(self):
+        for matrix in self.matrices[:2]:
+            path = os.path.join(
+                self.server.root, *matrix.urlpath("MAT").split("/")
+            )
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"MATLAB 5.0 MAT-file %d" % matrix.id)
+
+        stats = pipeline.download(
+            self.matrices[:2],
+            "MAT",
+            self.destpath,
+            processes=1,
+            reporter=self.reporter,
+        )
+
+        for matrix in self.matrices[:2]:
+            with open(matrix.localpath("MAT", self.destpath)[0], "rb") as f:
+                self.assertEqual(
+                    f.read(), b"MATLAB 5.0 MAT-file %d" % matrix.id
+                )
+        self.assertEqual([s.items for s in stats], [2, 0, 0])
+        self.assertEqual(self.reporter.events.count(("finished", True)), 2)
+
+    def test_errors_before_the_download_are_reported(self):
+        self.matrices.append(make_matrix(9, "m9"))
+        make_bundle(self.server.root, "HB", "m9", GENERAL)
+        paths = pipeline._Pipeline.paths
+
+        def failing_paths(self, matrix):
+            if matrix.name == "m9":
+                raise OSError("no room")
+            return paths(self, matrix)
+
+        with mock.patch.object(pipeline._Pipeline, "paths", failing_paths):
+            with self.assertRaises(DownloadError) as cm:
+                pipeline.download(self.matrices, "MM", self.destpath, 2, 1)
+
+        self.assertEqual([m.name for m, _ in cm.exception.errors], ["m9"])
+        self.assertTrue(os.path.isdir(os.path.join(self.destpath, "m5")))
+
+    def test_failures_do_not_stop_the_others(self):
+        self.matrices.append(make_matrix(9, "missing"))
+
+        with self.assertRaises(DownloadError) as cm:
+            pipeline.download(
+                self.matrices,
+                "MM",
+                self.destpath,
+                3,
+                2,
+                reporter=self.reporter,
+            )
+
+        self.assertEqual([m.name for m, _ in cm.exception.errors], ["missing"])
+        self.assertTrue(os.path.isdir(os.path.join(self.destpath, "m5")))
+
+    def test_queue_applies_backpressure(self):
+        release = threading.Event()
+        queued = []
+        fetch, process = pipeline._Pipeline.fetch, pipeline._Pipeline.process
+
+        def counting_fetch(self, matrix, work):
+            fetch(self, matrix, work)
+            queued.append(matrix)
+
+        def gated_process(self, pool, work):
+            release.wait()
+            process(self, pool, work)
+
+        with mock.patch.object(
+            pipeline._Pipeline, "fetch", counting_fetch
+        ), mock.patch.object(pipeline._Pipeline, "process", gated_process):
+            thread = threading.Thread(
+                target=pipeline.download,
+                args=(self.matrices, "MM", self.destpath, 5, 1),
+                kwargs=dict(reporter=self.reporter, queue_depth=1),
+            )
+            thread.start()
+            deadline = time.monotonic() + 10
+            while len(self.server.requests) < 5:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            time.sleep(0.2)
+
+            # Only one bundle fits in the queue; the other downloads wait
+            self.assertEqual(len(queued), 1)
+            release.set()
+            thread.join()
+
+        self.assertEqual(len(queued), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from download_test import make_matrix
+from localserver import ServerTestCase, make_bundle
+
+try:
+    import numpy as np
+    import scipy.io
+    import scipy.sparse
+
+    from ssgetpy import readers
+except ImportError:
+    readers = None
+
+GENERAL = b"""%%MatrixMarket matrix coordinate real general
+% a comment
+
+3 4 5
+1 1 1.5
+2 3 -2e-3
+3 4 7
+1 4 0.25
+3 1 -1
+"""
+
+SYMMETRIC = b"""%%MatrixMarket matrix coordinate integer symmetric
+3 3 4
+1 1 2
+2 1 -1
+3 2 5
+3 3 9
+"""
+
+PATTERN = b"""%%MatrixMarket matrix coordinate pattern general
+2 2 2
+1 2
+2 1
+"""
+
+COMPLEX = b"""%%MatrixMarket matrix coordinate complex hermitian
+2 2 2
+1 1 1.0 0.0
+2 1 2.5 -1.5
+"""
+
+
+@unittest.skipIf(readers is None, "NumPy and SciPy are not installed")
+class TestReadMM(unittest.TestCase):
+    def assertMatchesScipy(self, text, **kwargs):
+        expected = scipy.io.mmread(io.BytesIO(text)).toarray()
+        actual = readers.read_mm(io.BytesIO(text), **kwargs)
+        np.testing.assert_array_equal(actual.toarray(), expected)
+        return actual
+
+    def test_general(self):
+        matrix = self.assertMatchesScipy(GENERAL)
+        self.assertEqual(matrix.format, "csr")
+
+    def test_symmetric_types(self):
+        for text in (SYMMETRIC, PATTERN, COMPLEX):
+            self.assertMatchesScipy(text, sparse="coo")
+
+    def test_small_chunks(self):
+        # Chunks end in the middle of lines and numbers
+        for chunk_size in (1, 7, 16):
+            self.assertMatchesScipy(GENERAL, chunk_size=chunk_size)
+
+    def test_large_integers(self):
+        text = (
+            b"%%%%MatrixMarket matrix coordinate integer general\n"
+            b"2 2 2\n1 1 %d\n2 2 -%d\n" % (2**53 + 1, 2**62 + 1)
+        )
+        matrix = readers.read_mm(io.BytesIO(text))
+        self.assertEqual(matrix.dtype, np.int64)
+        self.assertEqual(matrix[0, 0], 2**53 + 1)
+        self.assertEqual(matrix[1, 1], -(2**62) - 1)
+
+        with self.assertRaises(ValueError):
+            readers.read_mm(io.BytesIO(text.replace(b"1 1 ", b"1 1 0.5")))
+
+    def test_wrong_entry_count(self):
+        with self.assertRaises(ValueError):
+            readers.read_mm(io.BytesIO(GENERAL.replace(b"3 4 5", b"3 4 6")))
+
+    def test_malformed_entry(self):
+        lines = GENERAL.split(b"\n")
+        lines[-3] += b" x"
+        for chunk_size in (7, 1 << 16):
+            with self.assertRaises(ValueError):
+                readers.read_mm(
+                    io.BytesIO(b"\n".join(lines)), chunk_size=chunk_size
+                )
+
+
+# The SYMMETRIC matrix in Rutherford-Boeing format, with Fortran D exponents
+RB_SYMMETRIC = b"""Symmetric test matrix
+             3             1             1             2
+rsa                        3             3             4             0
+(4I3)           (4I3)           (2D12.4)
+  1  3  4  5
+  1  2  3  3
+  2.0000D+00 -1.0000D+00
+  5.0000D+00  9.0000D+00
+"""
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+@unittest.skipIf(readers is None, "NumPy and SciPy are not installed")
+class TestReadRB(unittest.TestCase):
+    def test_matches_mm(self):
+        expected = readers.read_mm(io.BytesIO(SYMMETRIC)).toarray()
+        actual = readers.read_rb(io.BytesIO(RB_SYMMETRIC))
+        np.testing.assert_array_equal(actual.toarray(), expected)
+
+    def test_harwell_boeing(self):
+        matrix = scipy.sparse.random(40, 30, density=0.2, random_state=0)
+        text = io.StringIO()
+        scipy.io.hb_write(text, matrix.tocsc())
+
+        actual = readers.read_rb(io.BytesIO(text.getvalue().encode()))
+
+        np.testing.assert_allclose(actual.toarray(), matrix.toarray())
+
+
+@unittest.skipIf(readers is None, "NumPy and SciPy are not installed")
+class TestProblem(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, "sym.mat")
+        self.A = readers.read_mm(io.BytesIO(SYMMETRIC), "csc")
+
+    def test_v5(self):
+        scipy.io.savemat(
+            self.path,
+            {
+                "Problem": {
+                    "A": self.A,
+                    "name": "HB/sym",
+                    "aux": {"coord": np.arange(6.0).reshape(3, 2)},
+                }
+            },
+        )
+
+        problem = readers.Problem(self.path)
+
+        self.assertEqual(problem.name, "HB/sym")
+        self.assertEqual(problem.A.format, "csr")
+        np.testing.assert_array_equal(problem.A.toarray(), self.A.toarray())
+        self.assertEqual(problem.aux.coord.shape, (3, 2))
+        self.assertEqual(set(problem.fields()), {"A", "name", "aux"})
+
+    @unittest.skipIf(h5py is None, "h5py is not installed")
+    def test_v73(self):
+        with h5py.File(self.path, "w", userblock_size=512) as f:
+            problem = f.create_group("Problem")
+            problem.attrs["MATLAB_class"] = np.bytes_("struct")
+            A = problem.create_group("A")
+            A.attrs["MATLAB_sparse"] = np.uint64(3)
+            A["data"], A["ir"], A["jc"] = (
+                self.A.data,
+                self.A.indices.astype(np.uint64),
+                self.A.indptr.astype(np.uint64),
+            )
+            name = np.array([[ord(c)] for c in "HB/sym"], dtype=np.uint16)
+            problem["name"] = name
+            problem["name"].attrs["MATLAB_class"] = np.bytes_("char")
+            aux = problem.create_group("aux")
+            aux["coord"] = np.arange(6.0).reshape(3, 2).T
+
+        problem = readers.Problem(self.path, "coo")
+
+        self.assertEqual(problem.name, "HB/sym")
+        self.assertEqual(problem.A.format, "coo")
+        np.testing.assert_array_equal(problem.A.toarray(), self.A.toarray())
+        np.testing.assert_array_equal(
+            problem.aux.coord, np.arange(6.0).reshape(3, 2)
+        )
+
+
+def assert_mapped(test, matrix):
+    # Checks that the arrays of the CSR `matrix` are views of memory maps
+    for array in (matrix.indptr, matrix.indices, matrix.data):
+        while isinstance(array, np.ndarray) and not isinstance(
+            array, np.memmap
+        ):
+            array = array.base
+        test.assertIsInstance(array, np.memmap)
+
+
+@unittest.skipIf(readers is None, "NumPy and SciPy are not installed")
+class TestBinary(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, "m.csr")
+
+    def test_round_trip(self):
+        for text in (GENERAL, COMPLEX):
+            expected = readers.read_mm(io.BytesIO(text))
+            readers.write_binary(self.path, expected)
+
+            actual = readers.read_binary(self.path)
+
+            # Read-only because it maps the file rather than a copy
+            self.assertFalse(actual.data.flags.writeable)
+            assert_mapped(self, actual)
+            self.assertEqual(actual.data.dtype, expected.data.dtype)
+            np.testing.assert_array_equal(actual.toarray(), expected.toarray())
+        self.assertEqual(os.listdir(self.root), ["m.csr"])
+
+    def test_empty_matrix(self):
+        readers.write_binary(self.path, scipy.sparse.csr_matrix((4, 2)))
+
+        self.assertEqual(readers.read_binary(self.path, "coo").shape, (4, 2))
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(GENERAL)
+        with self.assertRaises(ValueError):
+            readers.read_binary(self.path)
+
+
+@unittest.skipIf(readers is None, "NumPy and SciPy are not installed")
+class TestLoad(ServerTestCase):
+    def test_load_from_bundle(self):
+        make_bundle(self.server.root, "HB", "gen", GENERAL)
+        matrix = make_matrix(1, "gen")
+
+        loaded = matrix.load(destpath=self.destpath, sparse="csc")
+
+        self.assertEqual(loaded.format, "csc")
+        self.assertEqual(loaded.shape, (3, 4))
+        self.assertEqual(loaded[1, 2], -2e-3)
+
+    def test_load_from_extracted(self):
+        make_bundle(self.server.root, "HB", "sym", SYMMETRIC)
+        matrix = make_matrix(1, "sym")
+        matrix.download("MM", self.destpath, extract=True)
+
+        loaded = matrix.load(destpath=self.destpath)
+
+        self.assertEqual(loaded[0, 1], -1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_formats_agree(self):
+        make_bundle(self.server.root, "HB", "sym", SYMMETRIC)
+        make_bundle(self.server.root, "HB", "sym", RB_SYMMETRIC, "RB")
+        os.makedirs(os.path.join(self.server.root, "mat", "HB"))
+        scipy.io.savemat(
+            os.path.join(self.server.root, "mat", "HB", "sym.mat"),
+            {"Problem": {"A": readers.read_mm(io.BytesIO(SYMMETRIC))}},
+        )
+        matrix = make_matrix(1, "sym")
+
+        loaded = [
+            matrix.load(format, os.path.join(self.destpath, format))
+            for format in ("MM", "RB", "MAT")
+        ]
+
+        for other in loaded[1:]:
+            np.testing.assert_array_equal(other.toarray(), loaded[0].toarray())
+
+    def test_second_load_maps_binary_copy(self):
+        make_bundle(self.server.root, "HB", "gen", GENERAL)
+        matrix = make_matrix(1, "gen")
+        first = matrix.load(destpath=self.destpath)
+
+        with mock.patch.object(readers, "read_mm") as read_mm:
+            second = matrix.load(destpath=self.destpath, sparse="coo")
+            assert_mapped(self, matrix.load(destpath=self.destpath))
+
+        read_mm.assert_not_called()
+        self.assertTrue(os.path.exists(matrix.binarypath("MM", self.destpath)))
+        np.testing.assert_array_equal(first.toarray(), second.toarray())
+
+    def test_download_replaces_binary_copy(self):
+        make_bundle(self.server.root, "HB", "m", GENERAL)
+        matrix = make_matrix(1, "m")
+        path, _ = matrix.download("MM", self.destpath, extract=True)
+        self.assertEqual(matrix.load(destpath=self.destpath).shape, (3, 4))
+        shutil.rmtree(path)
+        make_bundle(self.server.root, "HB", "m", SYMMETRIC)
+
+        matrix.download("MM", self.destpath, extract=True)
+
+        self.assertEqual(matrix.load(destpath=self.destpath)[0, 1], -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from download_test import listdir
+from events_test import RecordingReporter
+from localserver import ServerTestCase, make_bundle
+
+from ssgetpy import schedule
+from ssgetpy.matrix import Matrix, MatrixList
+
+
+def make_matrix(identifier, group, nnz, dtype="real"):
+    return Matrix(
+        identifier,
+        group,
+        f"m{identifier}",
+        10,
+        10,
+        nnz,
+        dtype,
+        False,
+        False,
+        1.0,
+        1.0,
+        "kind",
+    )
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        self.destpath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destpath, ignore_errors=True)
+        self.matrices = MatrixList(
+            [
+                make_matrix(1, "A", 5000),
+                make_matrix(2, "A", 100),
+                make_matrix(3, "A", 200),
+                make_matrix(4, "B", 3000),
+                make_matrix(5, "C", 100, "binary"),
+            ]
+        )
+
+    def _ids(self, budget, policy):
+        plan = schedule.plan(
+            self.matrices, "MM", self.destpath, True, budget, policy
+        )
+        return [m.id for m in plan.matrices]
+
+    def test_policies(self):
+        size = schedule.estimate_size
+        self.assertLess(size(self.matrices[4]), size(self.matrices[1]))
+        self.assertEqual(self._ids(None, "smallest"), [5, 2, 3, 4, 1])
+        self.assertEqual(self._ids(None, "largest"), [1, 4, 3, 2, 5])
+        self.assertEqual(self._ids(None, "round-robin"), [5, 2, 4, 3, 1])
+        self.assertEqual(self._ids(None, "index"), [1, 2, 3, 4, 5])
+        with self.assertRaises(ValueError):
+            self._ids(None, "random")
+
+    def test_budget(self):
+        budget = sum(schedule.estimate_size(m) for m in self.matrices[1:])
+        self.assertEqual(self._ids(budget, "smallest"), [5, 2, 3, 4])
+        self.assertEqual(self._ids(budget, "largest"), [4, 3, 2, 5])
+        self.assertEqual(self._ids(budget, "index"), [2, 3, 4, 5])
+
+        plan = schedule.plan(self.matrices, "MM", self.destpath, True, budget)
+        self.assertLessEqual(plan.total, budget)
+        self.assertEqual([m.id for m, _ in plan.skipped], [1])
+        self.assertIn("A/m1 (over budget)", str(plan))
+
+    def test_matrices_on_disk_are_free(self):
+        os.makedirs(os.path.join(self.destpath, "m1"))
+        plan = schedule.plan(self.matrices, "MM", self.destpath, True, 0)
+        self.assertEqual([(m.id, size) for m, size in plan.selected], [(1, 0)])
+
+
+class TestScheduledDownload(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matrices = MatrixList(
+            make_matrix(i, "HB", 10) for i in range(1, 4)
+        )
+        self.sizes = {
+            m.id: os.path.getsize(
+                make_bundle(self.server.root, "HB", m.name, os.urandom(i))
+            )
+            for m, i in zip(self.matrices, (3000, 1000, 2000))
+        }
+
+    def test_sizes_from_head_requests(self):
+        plan = schedule.plan(
+            self.matrices, "MM", self.destpath, estimate="head"
+        )
+        self.assertEqual(dict((m.id, s) for m, s in plan.selected), self.sizes)
+        self.assertEqual(plan.matrices[0].id, 2)
+
+    def test_download_within_budget(self):
+        self.matrices.download(
+            "MM",
+            self.destpath,
+            extract=True,
+            reporter=RecordingReporter(),
+            budget=self.sizes[2] + self.sizes[3],
+            estimate="head",
+        )
+
+        self.assertEqual(sorted(listdir(self.destpath)), ["m2", "m3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,454 @@
+"""
+Benchmarks `ssgetpy` against a local stand-in for the SuiteSparse web
+site, so that results do not depend on the network or on sparse.tamu.edu.
+
+The stand-in serves a temporary directory laid out like `SS_ROOT_URL`:
+`files/ssstats.csv` with a synthetic collection of the requested size and
+`MM`, `RB` and `mat` bundles of matrices with a controlled number of
+non-zeros. The suite measures
+
+* index_build: downloading ssstats.csv and building the index,
+* search: the latency of typical searches at each collection size,
+* download: the throughput of `Matrix.download`,
+* extract: unpacking downloaded bundles,
+* load: parsing each format into `scipy.sparse` (if SciPy is installed),
+* fetch: end-to-end `ssgetpy.fetch` with one and several workers.
+
+Results are printed and optionally written as JSON with `--output`.
+`--compare` checks them against an earlier JSON file and exits with a
+non-zero status if any benchmark got slower by more than `--tolerance`:
+
+    python benchmarks/bench.py --output baseline.json
+    python benchmarks/bench.py --compare baseline.json
+
+Nothing under `SS_DIR` is touched; the index, the cache, the manifest
+and downloaded matrices all live in a temporary directory.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+# The stand-in server is shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "Tests"))
+
+from localserver import LocalServer  # noqa: E402
+
+from ssgetpy import (  # noqa: E402
+    bundle,
+    cache,
+    dbinstance,
+    events,
+    integrity,
+    query,
+)
+from ssgetpy.db import MatrixDB  # noqa: E402
+from ssgetpy.matrix import Matrix  # noqa: E402
+
+GROUPS = ["HB", "Boeing", "Schenk", "GHS_psdef", "Janna", "SNAP"]
+KINDS = ["structural problem", "circuit simulation problem", "graph"]
+
+# Collection sizes and matrix sizes (non-zeros) for the full and quick runs
+SIZES = {
+    "full": dict(collections=(1000, 3000, 10000), nnz=(10**4, 10**6)),
+    "quick": dict(collections=(200,), nnz=(1000,)),
+}
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def write_index(root, count, seed=0):
+    """
+    Writes `files/ssstats.csv` describing `count` synthetic matrices.
+    """
+    rng = random.Random(seed)
+    lines = [str(count), "01-Jan-2020 00:00:00"]
+    for i in range(1, count + 1):
+        rows = rng.randint(10, 10**6)
+        lines.append(
+            ",".join(
+                str(x)
+                for x in (
+                    rng.choice(GROUPS),
+                    f"mat{i}",
+                    rows,
+                    rng.choice((rows, rng.randint(10, 10**6))),
+                    rng.randint(rows, 50 * rows),
+                    int(rng.random() < 0.9),
+                    int(rng.random() < 0.1),
+                    int(rng.random() < 0.5),
+                    int(rng.random() < 0.3),
+                    round(rng.random(), 4),
+                    round(rng.random(), 4),
+                    rng.choice(KINDS),
+                )
+            )
+        )
+    os.makedirs(os.path.join(root, "files"), exist_ok=True)
+    with open(os.path.join(root, "files", "ssstats.csv"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _entries(n, nnz, seed):
+    # Random (row, col, value) triplets sorted by column, 1-based
+    rng = random.Random(seed)
+    triplets = {(rng.randint(1, n), rng.randint(1, n)) for _ in range(nnz)}
+    return sorted(
+        ((i, j, rng.uniform(-1, 1)) for i, j in triplets),
+        key=lambda t: (t[1], t[0]),
+    )
+
+
+def _mm_text(n, entries):
+    lines = ["%%MatrixMarket matrix coordinate real general"]
+    lines.append(f"{n} {n} {len(entries)}")
+    lines.extend(f"{i} {j} {v:.16e}" for i, j, v in entries)
+    return "\n".join(lines) + "\n"
+
+
+def _cards(values, per_card, width):
+    return [
+        "".join(v.rjust(width) for v in values[start:end])
+        for start, end in (
+            (k, k + per_card) for k in range(0, len(values), per_card)
+        )
+    ]
+
+
+def _rb_text(n, entries):
+    counts = [0] * (n + 1)
+    for _, j, _ in entries:
+        counts[j] += 1
+    pointers = [1]
+    for j in range(1, n + 1):
+        pointers.append(pointers[-1] + counts[j])
+    ptr = _cards([str(p) for p in pointers], 8, 10)
+    ind = _cards([str(i) for i, _, _ in entries], 8, 10)
+    val = _cards([f"{v:.16E}".replace("E", "D") for _, _, v in entries], 3, 26)
+    header = [
+        "Synthetic benchmark matrix".ljust(72) + "bench".ljust(8),
+        "".join(
+            str(x).rjust(14)
+            for x in (len(ptr) + len(ind) + len(val), len(ptr), len(ind))
+        )
+        + str(len(val)).rjust(14),
+        "rua".ljust(14)
+        + "".join(str(x).rjust(14) for x in (n, n, len(entries), 0)),
+        "(8I10)".ljust(16) + "(8I10)".ljust(16) + "(3D26.16)".ljust(20),
+    ]
+    return "\n".join(header + ptr + ind + val) + "\n"
+
+
+def _write_bundle(path, member, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = text.encode("ascii")
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def write_matrix(root, matrix, nnz, seed=0):
+    """
+    Writes MM, RB and (if SciPy is installed) MAT files for `matrix`,
+    a square matrix with about `nnz` random non-zeros.
+    """
+    n = max(10, int(nnz**0.5) * 4)
+    entries = _entries(n, nnz, seed)
+    name = matrix.name
+    _write_bundle(
+        os.path.join(root, "MM", matrix.group, name + ".tar.gz"),
+        f"{name}/{name}.mtx",
+        _mm_text(n, entries),
+    )
+    _write_bundle(
+        os.path.join(root, "RB", matrix.group, name + ".tar.gz"),
+        f"{name}/{name}.rb",
+        _rb_text(n, entries),
+    )
+    try:
+        import scipy.io
+        import scipy.sparse
+    except ImportError:
+        return
+    rows, cols, values = zip(*entries)
+    A = scipy.sparse.csc_matrix(
+        (values, ([i - 1 for i in rows], [j - 1 for j in cols])),
+        shape=(n, n),
+    )
+    directory = os.path.join(root, "mat", matrix.group)
+    os.makedirs(directory, exist_ok=True)
+    scipy.io.savemat(
+        os.path.join(directory, name + ".mat"),
+        {"Problem": {"A": A, "name": f"{matrix.group}/{name}"}},
+        do_compression=True,
+    )
+
+
+def _matrix(identifier, nnz):
+    return Matrix(
+        identifier, "Bench", f"b{nnz}", 0, 0, nnz, "real", 0, 0, 0, 0, ""
+    )
+
+
+class Suite:
+    """
+    Runs the benchmarks against `server`, keeping all state in `workdir`.
+    Each result is a dict with the benchmark `name`, its `params` and
+    its metrics; `seconds` is the figure compared between runs.
+    """
+
+    def __init__(self, server, workdir, sizes, repeat=5):
+        self.server = server
+        self.workdir = workdir
+        self.sizes = sizes
+        self.repeat = repeat
+        self.results = []
+
+    def record(self, name, params, seconds, **metrics):
+        result = dict(name=name, params=params, seconds=seconds, **metrics)
+        self.results.append(result)
+        print(
+            f"{name:12} {json.dumps(params):45} {seconds * 1000:10.2f} ms"
+            + "".join(f"  {k}={v:.4g}" for k, v in metrics.items()),
+            flush=True,
+        )
+
+    def _db(self, count):
+        write_index(self.server.root, count)
+        path = os.path.join(self.workdir, f"index-{count}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        return MatrixDB(path)
+
+    def index_and_search(self):
+        from ssgetpy import csvindex
+
+        searches = {
+            "id": dict(matid=42),
+            "group": dict(group="HB", limit=None),
+            "name": dict(name="at1", limit=None),
+            "bounds": dict(
+                rowbounds=(1000, 100000), nzbounds=(None, 10**6), limit=None
+            ),
+            "combined": dict(dtype="real", isspd=True, kind="graph"),
+        }
+        for count in self.sizes["collections"]:
+            db = self._db(count)
+            seconds = _timed(lambda: db.refresh(csvindex.generate()))
+            self.record(
+                "index_build",
+                dict(collection=count),
+                seconds,
+                rows_per_second=count / seconds,
+            )
+            for label, kwargs in searches.items():
+                timings = [
+                    _timed(db.search, **kwargs) for _ in range(self.repeat)
+                ]
+                self.record(
+                    "search",
+                    dict(collection=count, query=label),
+                    statistics.median(timings),
+                    max_seconds=max(timings),
+                )
+            db.conn.close()
+
+    def transfer(self):
+        destpath = os.path.join(self.workdir, "downloads")
+        for identifier, nnz in enumerate(self.sizes["nnz"], 1):
+            matrix = _matrix(identifier, nnz)
+            write_matrix(self.server.root, matrix, nnz)
+            for format in ("MM", "RB", "MAT"):
+                remote = os.path.join(
+                    self.server.root,
+                    "mat" if format == "MAT" else format,
+                    matrix.group,
+                    matrix._filename(format),
+                )
+                if not os.path.exists(remote):
+                    continue
+                size = os.path.getsize(remote)
+                params = dict(format=format, nnz=nnz, bytes=size)
+                target = os.path.join(destpath, format)
+                shutil.rmtree(target, ignore_errors=True)
+                seconds = _timed(
+                    matrix.download,
+                    format,
+                    target,
+                    reporter=events.Reporter(),
+                )
+                self.record(
+                    "download",
+                    params,
+                    seconds,
+                    mb_per_second=size / seconds / 1e6,
+                )
+                if format != "MAT":
+                    localdest = matrix.localpath(format, target)[1]
+                    seconds = _timed(bundle.extract, localdest)
+                    self.record("extract", params, seconds)
+                self.load(matrix, format, target, params)
+
+    def load(self, matrix, format, target, params):
+        try:
+            from ssgetpy import readers  # noqa: F401
+        except ImportError:
+            return
+        seconds = _timed(matrix.load, format, target, binary=True)
+        self.record("load", params, seconds)
+        seconds = _timed(matrix.load, format, target, binary=True)
+        self.record("load", dict(params, cached=True), seconds)
+
+    def fetch(self, workers=(1, 4), count=8):
+        nnz = self.sizes["nnz"][0]
+        db = self._db(max(self.sizes["collections"]))
+        db.refresh(
+            [
+                (i, "Fetch", f"f{i}", 0, 0, nnz, "real", 0, 0, 0, 0, "")
+                for i in range(1, count + 1)
+            ]
+        )
+        for i in range(1, count + 1):
+            write_matrix(self.server.root, db.search(matid=i)[0], nnz, i)
+        with mock.patch.object(dbinstance, "_instance", db):
+            for n in workers:
+                location = os.path.join(self.workdir, f"fetch-{n}")
+                seconds = _timed(
+                    query.fetch,
+                    group="Fetch",
+                    location=location,
+                    workers=n,
+                    limit=None,
+                )
+                self.record(
+                    "fetch",
+                    dict(matrices=count, nnz=nnz, workers=n),
+                    seconds,
+                )
+        db.conn.close()
+
+    def run(self):
+        self.index_and_search()
+        self.transfer()
+        self.fetch()
+        return self.results
+
+
+@contextlib.contextmanager
+def stand_in():
+    """
+    Starts the stand-in server and points `ssgetpy`, its cache and its
+    manifest at it and at a temporary directory. Yields
+    `(server, workdir)`.
+    """
+    workdir = tempfile.mkdtemp(prefix="ssgetpy-bench-")
+    try:
+        with LocalServer() as server, mock.patch(
+            "ssgetpy.config.SS_ROOT_URL", server.url
+        ), mock.patch(
+            "ssgetpy.config.SS_INDEX_URL",
+            server.url + "/files/ssstats.csv",
+        ), mock.patch.object(
+            cache,
+            "_cache",
+            cache.MatrixCache(os.path.join(workdir, "cache.db"), workdir),
+        ), mock.patch.object(
+            integrity,
+            "_manifest",
+            integrity.Manifest(os.path.join(workdir, "cache.db")),
+        ):
+            yield server, workdir
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(quick=False, repeat=5):
+    """
+    Runs the whole suite and returns a JSON-serializable report.
+    """
+    sizes = SIZES["quick" if quick else "full"]
+    with stand_in() as (server, workdir):
+        results = Suite(server, workdir, sizes, repeat).run()
+    return dict(
+        meta=dict(
+            time=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            quick=quick,
+        ),
+        results=results,
+    )
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns `(result, previous)` pairs for the benchmarks in `report`
+    that are more than `tolerance` (a fraction) slower than `baseline`.
+    """
+    previous = {_key(r): r for r in baseline["results"]}
+    return [
+        (result, previous[_key(result)])
+        for result in report["results"]
+        if _key(result) in previous
+        and result["seconds"]
+        > previous[_key(result)]["seconds"] * (1 + tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="Write the results to this file")
+    parser.add_argument("--compare", help="Compare with this results file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown when comparing, as a fraction (0.25)",
+    )
+    parser.add_argument("--quick", action="store_true", help="Small sizes")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Repetitions per search"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.quick, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for result, previous in regressions:
+            print(
+                f"REGRESSION {result['name']} {json.dumps(result['params'])}: "
+                + f"{previous['seconds']:.4f}s -> {result['seconds']:.4f}s"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
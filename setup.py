@@ -19,6 +19,11 @@ setup(
     entry_points={"console_scripts": ["ssgetpy = ssgetpy.query:cli", ], },
     python_requires=">3.5.2",
     install_requires=["requests>=2.22", "tqdm>=4.41"],
+    extras_require={
+        "numpy": ["numpy>=1.13"],
+        "scipy": ["numpy>=1.13", "scipy>=1.0"],
+        "aio": ["aiohttp>=3.5"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
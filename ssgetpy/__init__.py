@@ -39,16 +39,64 @@ The rules for specifying the search criteria in `ssgetpy.search` and
      - isspd: If true, only selects SPD matrices.
      - kind: A string describing the problem domain,
              see http://www.cise.ufl.edu/research/sparse/matrices/kind.html
+     - text: Words such as "circuit sim" that must start words in the
+             name, group or kind. The best matches are returned first.
+     - order_by: The columns to sort by, such as `"nnz desc"` or
+                 `["-nnz", "rows"]`. Ties are broken by ID, which is also
+                 the default order.
+     - after_id: Only return the matrices that sort after the one with
+                 this ID, e.g. the last one of the previous page.
      - limit: Number of matrices to return, defaults to 10.
+              Pass `None` to return every matching matrix.
+     - columnar: If true, returns a read-only `MatrixArray` that stores
+                 the results column by column and only creates `Matrix`
+                 objects as they are accessed.
+     - cache: If false, always queries the index. Otherwise the results
+              of the last `SSGETPY_SEARCH_CACHE_SIZE` (default 128)
+              distinct searches are reused until the index changes.
 
 If `name_or_id` is specified, it overrides any conflicting key-value settings
 in `**kwargs`.
 
+`ssgetpy.search_iter` takes the same arguments as `ssgetpy.search` but
+yields the matrices as they are read, returning every match by default.
+
 In `ssgetpy.fetch`, `format` can be one of 'MM', 'MAT' or 'RB'; 'MM'
 is the default if `format` is omitted.  Finally, `location` refers
 to the directory where the matrices will be downloaded on the local
 machine. It defaults to `%APPDATA%/`ssgetpy`` on Windows and
-`~/.ssgetpy` on Unix-like platforms.
+`~/.ssgetpy` on Unix-like platforms. Passing `workers=N` to
+`ssgetpy.fetch` downloads up to `N` matrices concurrently, and
+`rate_limit` caps their combined transfer rate in bytes per second.
+Passing `processes=N` unpacks bundles in `N` worker processes while the
+next matrices download, and `convert=True` also saves each matrix as a
+binary CSR file for `Matrix.load`. `budget` caps the total bytes
+downloaded, choosing matrices in the order set by `policy` (see
+`ssgetpy.schedule`).
+
+Matrices downloaded to the default location are kept in a cache that
+evicts the least recently used ones once it grows beyond the byte quota
+set by the `SSGETPY_CACHE_QUOTA` environment variable (e.g. `20G`).
+Use `ssgetpy.cache` to inspect, trim or pin entries in the cache.
+The size and checksum of every downloaded file are recorded so that
+damaged files are downloaded again; `ssgetpy.integrity.verify` checks
+them all.
+
+Several processes, including processes on other machines sharing
+`SS_DIR` over NFS, can download the same matrices at once: file locks
+ensure that each matrix is downloaded by one of them while the others
+wait for it, and that the index is refreshed by one process at a time.
+
+Matrices and the index are downloaded from `https://sparse.tamu.edu`
+unless the `SSGETPY_ROOT_URL` environment variable or
+`ssgetpy.set_root_url` points `ssgetpy` at a mirror. `ssget mirror DIR`
+copies the matrices selected by the usual search options into `DIR`,
+laid out like the original site, and `ssget serve DIR` serves it; see
+`ssgetpy.mirror`.
+
+Downloads report the time and bytes spent connecting, transferring,
+verifying and extracting each matrix to a `reporter`; see
+`ssgetpy.events` for progress bars, JSON-lines logs and StatsD metrics.
 
 In addition to its usage as a Python library, `ssgetpy` can be run from
 the command line as follows ::
@@ -63,6 +111,9 @@ the command line as follows ::
                           The matrix group.
     -n NAME, --name=NAME  The name or a pattern matching the name of the
                           matrix/matrices.
+    -t TEXT, --text=TEXT  Words that start words in the name, group or kind
+                          of the matrix/matrices, e.g. 'circuit sim'. Best
+                          matches come first.
     -d DTYPE, --data-type=DTYPE
                           The element type of the matrix/matrices,
                           can be one of 'real', 'complex' or 'binary'.
@@ -75,11 +126,53 @@ the command line as follows ::
     -l LIMIT, --limit=LIMIT
                           The maximum number of matrices to be downloaded.
                           Defaults to 10.
+    --order-by=ORDER_BY   Order the matrices by these columns, e.g.
+                          'nnz desc, rows'.
     -o LOCATION, --outdir=LOCATION
                           The directory in the local machine where matrices
                           will be downloaded to.
                           Defaults to `%AppData%/ssgetpy` on Windows
                           and `~/.ssgetpy` on Unix.
+    -j WORKERS, --jobs=WORKERS
+                          The number of matrices to download concurrently.
+                          Defaults to 1.
+    -p PROCESSES, --processes=PROCESSES
+                          Unpack bundles in this many worker processes while
+                          the next matrices download.
+    --convert             Also convert the matrices to binary CSR files for
+                          Matrix.load. Requires NumPy and SciPy.
+    --budget=BUDGET       Only download as many matrices as fit in this many
+                          bytes, e.g. 20G.
+    --policy={smallest,largest,round-robin,index}
+                          The order in which to download matrices within the
+                          budget. Defaults to 'smallest', which downloads the
+                          most matrices.
+    --estimate={nnz,head}
+                          Estimate download sizes from the number of
+                          non-zeros in the index (the default), or ask the
+                          server with HEAD requests.
+    --rate-limit=RATE_LIMIT
+                          Cap the combined download rate to this many bytes
+                          per second. Accepts suffixes such as 500K or 10M.
+    --events=EVENTS       Append the timing and byte counts of each download
+                          phase to this file as JSON lines.
+    --statsd=STATSD       Send download metrics to the StatsD server at
+                          HOST:PORT.
+    --root-url=ROOT_URL   Download the index and matrices from this URL,
+                          such as a mirror made with 'ssget mirror'.
+    --refresh-index       Update the local index of matrices from the
+                          SuiteSparse Matrix Collection and exit.
+    --cache-quota=CACHE_QUOTA
+                          The most bytes the cache may use, e.g. 20G.
+    --cache-info          List the cached matrices and exit.
+    --trim-cache          Evict matrices until the cache fits its quota
+                          and exit.
+    --verify              Check every downloaded file against its checksum,
+                          delete damaged matrices so that they are
+                          downloaded again and exit.
+    --pin                 Protect the selected matrices from eviction.
+    --unpin               Allow the selected matrices to be evicted again
+                          and exit.
 
     Size and Non-zero filters:
       These options may be used to restrict the shape or number of non-zero
@@ -100,6 +193,8 @@ the command line as follows ::
                           The maximum number of non-zero values in the
                           matrix/matrices.
 """
-from .query import fetch, search
 
-__all__ = ["fetch", "search"]
+from .config import set_root_url
+from .query import fetch, search, search_iter
+
+__all__ = ["fetch", "search", "search_iter", "set_root_url"]
@@ -1,3 +1,5 @@
+import sys
+
 from .query import cli
 
-cli()
+sys.exit(cli())
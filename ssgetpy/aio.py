@@ -0,0 +1,408 @@
+"""
+The `aio` module provides asyncio versions of `search`, `fetch` and
+`Matrix.download` that do not block the event loop.
+
+If `aiohttp` is installed, downloads are made with non-blocking HTTP so
+that many of them can be multiplexed on one event loop without a thread
+per transfer; only disk writes, unpacking and the SQLite index and cache
+are handed to the loop's default executor. Without `aiohttp`, each
+download runs `Matrix.download` in the executor instead.
+
+`as_completed` downloads a list of matrices and yields each one as soon
+as it is ready:
+
+    async for matrix in ssgetpy.aio.as_completed(matrices, workers=8):
+        ...
+"""
+
+import asyncio
+import functools
+import logging
+import os
+
+from . import events, integrity, locking, net, query, transfer
+from .cache import get_cache
+from .matrix import DownloadError
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes handed to the executor per disk write
+CHUNK_SIZE = 1024 * 1024
+
+
+def _run(func, *args, **kwargs):
+    # Runs a blocking call in the default executor of the running loop
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+    return aiohttp
+
+
+class _Session:
+    # Uses `session`, or an aiohttp session for the duration of the block
+
+    def __init__(self, session=None):
+        self.session = session
+        self.owned = None
+
+    async def __aenter__(self):
+        aiohttp = _aiohttp()
+        if self.session is None and aiohttp is not None:
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=net.CONNECT_TIMEOUT,
+                sock_read=net.READ_TIMEOUT,
+            )
+            self.owned = self.session = aiohttp.ClientSession(timeout=timeout)
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        if self.owned is not None:
+            await self.owned.close()
+
+
+async def search(name_or_id=None, **kwargs):
+    """
+    Runs `ssgetpy.search` in an executor and returns its result.
+    """
+    return await _run(query.search, name_or_id, **kwargs)
+
+
+class _PartFile:
+    # The .part file of one `_download_file` and what has been learned
+    # about the body across its attempts
+
+    def __init__(self, outfile, tracker, bucket, on_open):
+        self.outfile = outfile
+        self.tracker = tracker
+        self.bucket = bucket
+        self.on_open = on_open
+        self.digest = integrity.new_hash()
+        self.opened = False
+        self.total = None
+
+    async def restart(self):
+        await _run(self.outfile.truncate, 0)
+        self.outfile.seek(0)
+        self.digest = integrity.new_hash()
+
+    async def fill(self, session, url):
+        # Requests the rest of `url` and appends it to the file
+        offset = self.outfile.tell()
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        async with session.get(url, headers=headers) as response:
+            if response.status == 416 and offset:
+                return await self._past_end(url, response, offset)
+            response.raise_for_status()
+            start, length = transfer._content_range(response)
+            if response.status != 206 or start != offset:
+                # The server ignored the range, so start over
+                await self.restart()
+                offset = 0
+                length = response.content_length
+            await self._open(length, offset)
+            await self._stream(response)
+            if length is not None and self.outfile.tell() < length:
+                raise transfer.IncompleteDownload(
+                    f"Received {self.outfile.tell()} of {length} bytes "
+                    + f"from {url}"
+                )
+
+    async def _past_end(self, url, response, offset):
+        # The file already holds `offset` bytes, which should be all of it
+        _, length = transfer._content_range(response)
+        if length == offset:
+            self.total = length
+            return
+        await self.restart()
+        raise transfer.IncompleteDownload(
+            f"{url} has {length} bytes, expected {offset}"
+        )
+
+    async def _open(self, length, offset):
+        if self.opened:
+            return
+        self.opened = True
+        self.total = length
+        self.tracker.add_total(length or 0)
+        if offset:
+            self.tracker.update(offset)
+        self.tracker.enter("transfer")
+        await self.on_open(length)
+
+    async def _stream(self, response):
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            await _run(self.outfile.write, chunk)
+            self.digest.update(chunk)
+            self.tracker.update(len(chunk))
+            if self.bucket is not None:
+                delay = self.bucket.take(len(chunk))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+async def _download_file(
+    session, url, localdest, bucket, retries, tracker, on_open
+):
+    # Streams `url` into a .part file that is renamed when complete,
+    # resuming with Range requests like `transfer.download`, and returns
+    # its size and checksum
+    aiohttp = _aiohttp()
+    retries = transfer.RETRIES if retries is None else retries
+    partfile = localdest + transfer.PART_SUFFIX
+    attempt = 0
+    with open(partfile, "ab") as outfile:
+        part = _PartFile(outfile, tracker, bucket, on_open)
+        if outfile.tell():
+            await _run(integrity.hash_file, partfile, part.digest)
+        while True:
+            try:
+                await part.fill(session, url)
+                break
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                transfer.IncompleteDownload,
+            ) as exc:
+                status = getattr(exc, "status", None)
+                if attempt >= retries or (status is not None and status < 500):
+                    raise
+                attempt += 1
+                tracker.retry(attempt, exc)
+                logger.warning(
+                    f"Download of {url} interrupted ({exc}), resuming "
+                    + f"(attempt {attempt}/{retries})"
+                )
+                await asyncio.sleep(
+                    transfer.RETRY_BACKOFF * 2 ** (attempt - 1)
+                )
+    os.replace(partfile, localdest)
+    return part.total, part.digest
+
+
+async def download(
+    matrix,
+    format="MM",
+    destpath=None,
+    extract=False,
+    session=None,
+    rate_limit=None,
+    reporter=None,
+    retries=None,
+):
+    """
+    Downloads `matrix` like `Matrix.download` without blocking the event
+    loop and returns `(localdestpath, localdest)`.
+
+    `session` is an `aiohttp.ClientSession` to make the request with; by
+    default one is created for the download. `rate_limit` is a number of
+    bytes per second or a shared `transfer.TokenBucket`. `reporter`, if
+    given, receives the events of the download as described in the
+    `events` module; its methods are called from the event loop.
+    """
+    reporter = reporter or events.Reporter()
+    if _aiohttp() is None:
+        return await _run(
+            matrix.download,
+            format,
+            destpath,
+            extract,
+            reporter,
+            rate_limit=rate_limit,
+        )
+
+    destpath = destpath or matrix._defaultdestpath(format)
+    localdestpath, localdest = matrix.localpath(format, destpath, extract)
+    cache = await _run(get_cache)
+    if not cache.manages(localdestpath):
+        cache = None
+    manifest = await _run(integrity.get_manifest)
+    if await _run(matrix._reusable, format, localdestpath, manifest, cache):
+        return localdestpath, localdest
+
+    os.makedirs(destpath, exist_ok=True)
+    # Poll for the lock rather than tie up an executor thread waiting
+    lock = locking.matrix_lock(destpath, matrix.name, format)
+    while not await _run(lock.acquire, False):
+        await asyncio.sleep(locking.POLL_INTERVAL)
+    try:
+        if await _run(
+            matrix._reusable, format, localdestpath, manifest, cache
+        ):
+            return localdestpath, localdest
+        await _run(matrix._discard, format, destpath, localdestpath, manifest)
+
+        tracker = events.Tracker(reporter, matrix)
+        try:
+            await _download(
+                matrix,
+                format,
+                localdestpath,
+                localdest,
+                session,
+                transfer.as_bucket(rate_limit),
+                retries,
+                tracker,
+                cache,
+            )
+        except BaseException as exc:
+            tracker.close(exc)
+            raise
+        tracker.close()
+
+        if cache is not None:
+            await _run(cache.add, matrix, format, localdestpath)
+    finally:
+        lock.release()
+    return localdestpath, localdest
+
+
+async def _download(
+    matrix,
+    format,
+    localdestpath,
+    localdest,
+    session,
+    bucket,
+    retries,
+    tracker,
+    cache,
+):
+    from . import bundle
+
+    async def opened(total):
+        # Make room for the download before any of it is written
+        if cache is not None:
+            await _run(cache.reserve, total or 0, keep=localdestpath)
+
+    manifest = integrity.get_manifest()
+    if localdest != localdestpath and not await _run(
+        manifest.check, localdest
+    ):
+        # A bundle left by an earlier download has been damaged
+        await _run(integrity.remove, localdest)
+        await _run(manifest.forget, localdest)
+    if not os.access(localdest, os.F_OK):
+        tracker.enter("connect")
+        async with _Session(session) as session:
+            total, digest = await _download_file(
+                session,
+                matrix.url(format),
+                localdest,
+                bucket,
+                retries,
+                tracker,
+                opened,
+            )
+        tracker.enter("verify")
+        received = os.path.getsize(localdest)
+        if total is not None and received != total:
+            raise transfer.IncompleteDownload(
+                f"Received {received} of {total} bytes "
+                + f"from {matrix.url(format)}"
+            )
+        await _run(manifest.record, localdest, digest)
+    if localdest != localdestpath:
+        tracker.enter("extract")
+        files = await _run(bundle.extract, localdest)
+        await _run(manifest.forget, localdest)
+        for path, digest in files:
+            await _run(manifest.record, path, digest, localdestpath)
+
+
+async def as_completed(
+    matrices,
+    format="MM",
+    destpath=None,
+    extract=False,
+    workers=8,
+    rate_limit=None,
+    session=None,
+    reporter=None,
+):
+    """
+    Downloads `matrices`, up to `workers` at a time, and yields each
+    `Matrix` as soon as its download has finished. A failure to download
+    one matrix does not stop the others; the errors are raised together
+    as a `DownloadError` once every download has been attempted.
+    `rate_limit` caps the combined download rate in bytes per second
+    and `reporter` receives the events of every download.
+    """
+    semaphore = asyncio.Semaphore(workers)
+    bucket = transfer.as_bucket(rate_limit)
+
+    async def attempt(matrix, session):
+        async with semaphore:
+            try:
+                await download(
+                    matrix,
+                    format,
+                    destpath,
+                    extract,
+                    session=session,
+                    rate_limit=bucket,
+                    reporter=reporter,
+                )
+            except Exception as exc:
+                logger.error(f"{matrix.group}/{matrix.name}: {exc}")
+                return matrix, exc
+        return matrix, None
+
+    errors = []
+    async with _Session(session) as session:
+        tasks = [
+            asyncio.ensure_future(attempt(matrix, session))
+            for matrix in matrices
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                matrix, exc = await future
+                if exc is None:
+                    yield matrix
+                else:
+                    errors.append((matrix, exc))
+        finally:
+            # The caller may stop iterating before everything is done
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    if errors:
+        raise DownloadError(errors)
+
+
+async def fetch(
+    name_or_id=None,
+    format="MM",
+    location=None,
+    dry_run=False,
+    workers=8,
+    rate_limit=None,
+    reporter=None,
+    **kwargs,
+):
+    """
+    Searches for matrices like `search` and downloads them to `location`
+    like `ssgetpy.fetch`, extracting any TAR.GZ bundles, with up to
+    `workers` downloads in flight at once.
+    """
+    matrices = await search(name_or_id, **kwargs)
+    if not dry_run:
+        async for _ in as_completed(
+            matrices,
+            format,
+            location,
+            True,
+            workers,
+            rate_limit,
+            reporter=reporter,
+        ):
+            pass
+    return matrices
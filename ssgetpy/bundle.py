@@ -1,18 +1,70 @@
-import gzip
 import os
 import shutil
 import tarfile
+import tempfile
+
+from . import integrity
+
+# Size of the compressed reads made by the streaming tar reader
+BUFSIZE = 1024 * 1024
+
+
+def extract_stream(fileobj, basedir, bufsize=BUFSIZE):
+    """
+    Unpacks the TAR.GZ data read sequentially from `fileobj` into
+    `basedir`. Members are written out as the data arrives, so `fileobj`
+    can be a network stream and no intermediate TAR file is created.
+
+    The contents are unpacked into a temporary directory and only moved
+    into place once complete, so an interrupted extraction never leaves a
+    partial matrix directory behind.
+
+    Returns a list of `(path, digest)` pairs, one per file unpacked,
+    where `digest` is the checksum computed as the file was written.
+    Only regular files and directories are unpacked.
+    """
+    tmpdir = tempfile.mkdtemp(prefix=".extract-", dir=basedir)
+    root = os.path.abspath(tmpdir)
+    files = []
+    try:
+        with tarfile.open(
+            fileobj=fileobj, mode="r|gz", bufsize=bufsize
+        ) as tar:
+            for member in tar:
+                target = os.path.abspath(os.path.join(tmpdir, member.name))
+                if os.path.commonpath((root, target)) != root:
+                    raise tarfile.TarError(
+                        f"Refusing to unpack {member.name} outside {basedir}"
+                    )
+                if member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    digest = integrity.new_hash()
+                    with tar.extractfile(member) as source, open(
+                        target, "wb"
+                    ) as outfile:
+                        shutil.copyfileobj(
+                            source,
+                            integrity.HashingWriter(outfile, digest),
+                            bufsize,
+                        )
+                    files.append((member.name, digest))
+        for entry in os.listdir(tmpdir):
+            os.replace(
+                os.path.join(tmpdir, entry), os.path.join(basedir, entry)
+            )
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return [(os.path.join(basedir, name), digest) for name, digest in files]
 
 
 def extract(bundle):
-    basedir, filename = os.path.split(bundle)
-    tarfilename = os.path.join(
-        basedir, ".".join((filename.split(".")[0], "tar"))
-    )
-    gzfile = gzip.open(bundle, "rb")
-    with open(tarfilename, "wb") as outtarfile:
-        shutil.copyfileobj(gzfile, outtarfile)
-    gzfile.close()
-    tarfile.open(tarfilename).extractall(basedir)
-    os.unlink(tarfilename)
+    """
+    Unpacks the TAR.GZ file `bundle` into the directory containing it and
+    then deletes it. Returns the files unpacked like `extract_stream`.
+    """
+    with open(bundle, "rb") as fileobj:
+        files = extract_stream(fileobj, os.path.dirname(bundle))
     os.unlink(bundle)
+    return files
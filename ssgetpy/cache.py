@@ -0,0 +1,257 @@
+"""
+The `cache` module keeps track of the matrices downloaded under `SS_DIR`
+and evicts the least recently used ones once their combined size exceeds
+a byte quota.
+
+The quota defaults to `config.SS_CACHE_QUOTA`, which is read from the
+`SSGETPY_CACHE_QUOTA` environment variable (e.g. `20G`), and is unlimited
+if that is not set. Matrices can be pinned so that they are never evicted.
+The bookkeeping lives in the `CACHE` and `CACHE_PINS` tables of the index
+database.
+"""
+
+import collections
+import logging
+import os
+import shutil
+import threading
+import time
+
+from .config import SS_CACHE_QUOTA, SS_DB, SS_DIR
+
+logger = logging.getLogger(__name__)
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", "path format group name size last_access pinned"
+)
+
+
+def disk_usage(path):
+    """
+    Returns the number of bytes used by the file or directory `path`.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+class MatrixCache:
+    def __init__(self, db=SS_DB, root=SS_DIR, quota=SS_CACHE_QUOTA):
+        import sqlite3
+
+        self.root = os.path.abspath(root)
+        self.quota = quota
+        os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        # Concurrent downloads share this connection
+        self.lock = threading.RLock()
+        self._create_table()
+
+    def _create_table(self):
+        with self.lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS CACHE (
+                                 path TEXT PRIMARY KEY,
+                                 format TEXT,
+                                 matrixgroup TEXT,
+                                 name TEXT,
+                                 size INTEGER,
+                                 last_access REAL)""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS CACHE_PINS (
+                                 format TEXT,
+                                 matrixgroup TEXT,
+                                 name TEXT,
+                                 PRIMARY KEY (format, matrixgroup, name))""")
+            self.conn.commit()
+
+    def manages(self, path):
+        """
+        Returns True if `path` lies inside the cache directory.
+        """
+        path = os.path.abspath(path)
+        return os.path.commonpath((self.root, path)) == self.root
+
+    def _record(self, matrix, format, path):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO CACHE VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                format,
+                matrix.group,
+                matrix.name,
+                disk_usage(path),
+                time.time(),
+            ),
+        )
+
+    def add(self, matrix, format, path):
+        """
+        Records `path`, the downloaded copy of `matrix` in `format`, and
+        evicts other entries if the cache has outgrown its quota.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            self._record(matrix, format, path)
+            self.conn.commit()
+            self.trim(keep=path)
+
+    def touch(self, path, matrix=None, format=None):
+        """
+        Marks `path` as recently used. If the cache does not know `path`
+        yet, for instance because it was downloaded before the cache
+        existed, it is recorded as the copy of `matrix` in `format` so
+        that it counts towards the quota.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE CACHE SET last_access = ? WHERE path = ?",
+                (time.time(), path),
+            )
+            if cursor.rowcount == 0 and matrix is not None:
+                self._record(matrix, format, path)
+            self.conn.commit()
+
+    def reserve(self, nbytes, keep=None):
+        """
+        Evicts entries until `nbytes` more bytes fit within the quota.
+        """
+        if self.quota is not None:
+            self.trim(max(self.quota - nbytes, 0), keep)
+
+    def pin(self, matrix, format="MM"):
+        """
+        Protects `matrix` in `format` from eviction, whether or not it has
+        been downloaded yet.
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO CACHE_PINS VALUES (?, ?, ?)",
+                (format, matrix.group, matrix.name),
+            )
+            self.conn.commit()
+
+    def unpin(self, matrix, format="MM"):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM CACHE_PINS WHERE format = ? "
+                + "AND matrixgroup = ? AND name = ?",
+                (format, matrix.group, matrix.name),
+            )
+            self.conn.commit()
+
+    def _forget_missing(self):
+        paths = [row[0] for row in self.conn.execute("SELECT path FROM CACHE")]
+        missing = [(path,) for path in paths if not os.path.exists(path)]
+        if missing:
+            self.conn.executemany("DELETE FROM CACHE WHERE path = ?", missing)
+            self.conn.commit()
+
+    def entries(self):
+        """
+        Returns a list of `CacheEntry` tuples, least recently used first.
+        """
+        with self.lock:
+            self._forget_missing()
+            rows = self.conn.execute(
+                """SELECT c.path, c.format, c.matrixgroup, c.name, c.size,
+                          c.last_access, p.name IS NOT NULL
+                   FROM CACHE c LEFT JOIN CACHE_PINS p
+                   ON c.format = p.format
+                   AND c.matrixgroup = p.matrixgroup AND c.name = p.name
+                   ORDER BY c.last_access"""
+            ).fetchall()
+        return [CacheEntry(*row[:6], bool(row[6])) for row in rows]
+
+    def usage(self):
+        """
+        Returns the number of bytes used by all cached matrices.
+        """
+        return sum(entry.size for entry in self.entries())
+
+    def trim(self, quota=None, keep=None):
+        """
+        Deletes least recently used, unpinned matrices until the cache
+        fits within `quota` bytes (the cache quota by default) and
+        returns the evicted entries. `keep` is a path that is never
+        evicted, such as the matrix that has just been downloaded.
+        Matrices locked by another download are skipped.
+        """
+        from .locking import matrix_lock
+
+        quota = self.quota if quota is None else quota
+        if quota is None:
+            return []
+        keep = keep and os.path.abspath(keep)
+        with self.lock:
+            entries = self.entries()
+            usage = sum(entry.size for entry in entries)
+            evicted = []
+            for entry in entries:
+                if usage <= quota:
+                    break
+                if entry.pinned or entry.path == keep:
+                    continue
+                lock = matrix_lock(
+                    os.path.dirname(entry.path), entry.name, entry.format
+                )
+                if not lock.acquire(blocking=False):
+                    continue
+                logger.info(f"Evicting {entry.path} from the cache")
+                try:
+                    if os.path.isdir(entry.path):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    elif os.path.exists(entry.path):
+                        os.unlink(entry.path)
+                finally:
+                    lock.release()
+                self.conn.execute(
+                    "DELETE FROM CACHE WHERE path = ?", (entry.path,)
+                )
+                usage -= entry.size
+                evicted.append(entry)
+            self.conn.commit()
+        if usage > quota:
+            logger.warning(
+                f"Cache uses {usage} bytes, more than its quota of {quota}, "
+                + "but everything left is pinned or in use"
+            )
+        return evicted
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the `MatrixCache` for `SS_DIR`, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MatrixCache()
+    return _cache
+
+
+def entries():
+    return get_cache().entries()
+
+
+def usage():
+    return get_cache().usage()
+
+
+def trim(quota=None):
+    return get_cache().trim(quota)
+
+
+def pin(matrix, format="MM"):
+    get_cache().pin(matrix, format)
+
+
+def unpin(matrix, format="MM"):
+    get_cache().unpin(matrix, format)
@@ -0,0 +1,225 @@
+"""
+The `colindex` module provides `ColumnarIndex`, an in-memory copy of the
+matrix database held as NumPy arrays.
+
+Searches are evaluated as vectorized boolean masks over whole columns
+instead of SQL queries, which makes it cheap to run thousands of searches
+against the full collection, e.g. when selecting benchmark test sets.
+`masks` evaluates a batch of searches at once, broadcasting the size
+bounds of every search against the columns in a single operation.
+
+`ColumnarIndex` takes the column criteria of `MatrixDB.search`, but not
+`text`, `order_by` or `after_id`, plus `psymbounds` and `nsymbounds` for
+the pattern and numerical symmetry. Other criteria raise `TypeError`.
+This module requires NumPy, which can be installed with
+`pip install ssgetpy[numpy]`.
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "ssgetpy.colindex requires NumPy; "
+        + "install it with `pip install ssgetpy[numpy]`"
+    )
+
+from .matrix import MatrixArray
+
+# Numeric columns that can be restricted with (min, max) bounds
+_BOUNDS = (
+    ("rowbounds", "rows"),
+    ("colbounds", "cols"),
+    ("nzbounds", "nnz"),
+    ("psymbounds", "psym"),
+    ("nsymbounds", "nsym"),
+)
+
+# Criteria that are compared with a column as they are
+_EXACT = ("matid", "group", "name", "dtype", "is2d3d", "isspd", "kind")
+
+
+def _check_criteria(query):
+    # Rejects criteria that would otherwise be ignored, like `search` does
+    known = set(_EXACT).union(key for key, _ in _BOUNDS)
+    unknown = sorted(set(query) - known)
+    if unknown:
+        raise TypeError("Unsupported search criteria: %s" % ", ".join(unknown))
+
+
+def _categorical(values):
+    categories, codes = np.unique(
+        np.array(values, dtype=str), return_inverse=True
+    )
+    return list(categories), codes.astype(np.int32)
+
+
+def _like(values, pattern):
+    # Mirrors SQLite's case-insensitive `LIKE '%pattern%'`
+    if "%" not in pattern and "_" not in pattern:
+        return np.char.find(values, pattern.lower()) >= 0
+    regex = re.compile(
+        "".join(
+            ".*" if c == "%" else "." if c == "_" else re.escape(c)
+            for c in pattern.lower()
+        ),
+        re.DOTALL,
+    )
+    return np.array([regex.search(v) is not None for v in values], dtype=bool)
+
+
+class ColumnarIndex:
+    """
+    Column arrays built from `rows`, a sequence of tuples in the layout of
+    `MatrixDB.dump()`. Use `ColumnarIndex.from_db()` to load the index of
+    the local database.
+    """
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) or [()] * 12
+        self.id = np.array(columns[0], dtype=np.int64)
+        self.rows = np.array(columns[3], dtype=np.int64)
+        self.cols = np.array(columns[4], dtype=np.int64)
+        self.nnz = np.array(columns[5], dtype=np.int64)
+        self.is2d3d = np.array(columns[7], dtype=bool)
+        self.isspd = np.array(columns[8], dtype=bool)
+        self.psym = np.array(columns[9], dtype=np.float64)
+        self.nsym = np.array(columns[10], dtype=np.float64)
+        self.groups, self.group_codes = _categorical(columns[1])
+        self.dtypes, self.dtype_codes = _categorical(columns[6])
+        self.kinds, self.kind_codes = _categorical(columns[11])
+        self.names = np.array(columns[2], dtype=object)
+        self._names = np.char.lower(np.array(columns[2], dtype=str))
+        self._kinds = np.char.lower(np.array(self.kinds, dtype=str))
+
+    @classmethod
+    def from_db(cls, db=None):
+        """
+        Loads the rows of `db`, the shared `MatrixDB` by default.
+        """
+        if db is None:
+            from .dbinstance import get_instance
+
+            db = get_instance()
+        return cls(db.dump())
+
+    def __len__(self):
+        return len(self.id)
+
+    @staticmethod
+    def _code_mask(categories, codes, value):
+        try:
+            return codes == categories.index(value)
+        except ValueError:
+            return np.zeros(len(codes), dtype=bool)
+
+    def _exact_mask(self, query):
+        # Mask for everything except the numeric bounds
+        mask = np.ones(len(self), dtype=bool)
+        if query.get("matid"):
+            mask &= self.id == query["matid"]
+        if query.get("group"):
+            mask &= self._code_mask(
+                self.groups, self.group_codes, query["group"]
+            )
+        if query.get("name"):
+            mask &= _like(self._names, query["name"])
+        if query.get("dtype"):
+            mask &= self._code_mask(
+                self.dtypes, self.dtype_codes, query["dtype"]
+            )
+        for field in ("is2d3d", "isspd"):
+            if query.get(field) is not None:
+                mask &= getattr(self, field) == bool(query[field])
+        if query.get("kind"):
+            mask &= _like(self._kinds, query["kind"])[self.kind_codes]
+        return mask
+
+    def mask(self, **query):
+        """
+        Returns a boolean array that is True for every matrix matching the
+        search criteria in `query`.
+        """
+        return self.masks([query])[0]
+
+    def masks(self, queries):
+        """
+        Evaluates a batch of searches and returns a 2-D boolean array with
+        one row per query in `queries`, a sequence of keyword dictionaries.
+        Raises `TypeError` for criteria that are not supported.
+        """
+        queries = list(queries)
+        for query in queries:
+            _check_criteria(query)
+        result = np.ones((len(queries), len(self)), dtype=bool)
+        for key, column in _BOUNDS:
+            bounds = [query.get(key) or (None, None) for query in queries]
+            if all(b[0] is None and b[1] is None for b in bounds):
+                continue
+            values = getattr(self, column)
+            lows = np.array(
+                [-np.inf if b[0] is None else b[0] for b in bounds]
+            )
+            highs = np.array(
+                [np.inf if b[1] is None else b[1] for b in bounds]
+            )
+            result &= (values >= lows[:, None]) & (values <= highs[:, None])
+        for i, query in enumerate(queries):
+            result[i] &= self._exact_mask(query)
+        return result
+
+    def _select(self, mask, limit):
+        positions = np.flatnonzero(mask)
+        if limit is not None:
+            positions = positions[:limit]
+
+        def categorical(categories, codes):
+            return np.array(categories, dtype=object)[codes[positions]]
+
+        return MatrixArray(
+            (
+                self.id[positions],
+                categorical(self.groups, self.group_codes),
+                self.names[positions],
+                self.rows[positions],
+                self.cols[positions],
+                self.nnz[positions],
+                categorical(self.dtypes, self.dtype_codes),
+                self.is2d3d[positions],
+                self.isspd[positions],
+                self.psym[positions],
+                self.nsym[positions],
+                categorical(self.kinds, self.kind_codes),
+            )
+        )
+
+    def search(self, limit=10, **query):
+        """
+        Returns a `MatrixArray` with the first `limit` matrices (all of
+        them if `limit` is None) that match the search criteria in
+        `query`. `Matrix` objects are only created as they are accessed.
+        """
+        return self._select(self.mask(**query), limit)
+
+    def search_many(self, queries, limit=10):
+        """
+        Runs `search` for every keyword dictionary in `queries` and
+        returns the results in the same order. A `limit` key in a query
+        overrides `limit` for that query.
+        """
+        queries = list(queries)
+        masks = self.masks(
+            {k: v for k, v in query.items() if k != "limit"}
+            for query in queries
+        )
+        return [
+            self._select(mask, query.get("limit", limit))
+            for query, mask in zip(queries, masks)
+        ]
+
+    def count(self, **query):
+        """
+        Returns the number of matrices that match the search criteria.
+        """
+        return int(np.count_nonzero(self.mask(**query)))
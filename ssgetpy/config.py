@@ -7,7 +7,16 @@ logger = logging.getLogger(__name__)
 SS_DIR = None
 SS_DB = "index.db"
 SS_TABLE = "MATRICES"
-SS_ROOT_URL = "https://sparse.tamu.edu"
+# The rollback journal works wherever SS_DIR is, including NFS. Set
+# SSGETPY_JOURNAL_MODE=WAL if SS_DIR is on a local disk to let searches
+# proceed while the index is refreshed; a write-ahead log relies on shared
+# memory that network file systems do not provide.
+SS_JOURNAL_MODE = os.environ.get("SSGETPY_JOURNAL_MODE", "DELETE")
+# The web site of the SuiteSparse Matrix Collection
+SS_SITE_URL = "https://sparse.tamu.edu"
+# Where the index and matrices are downloaded from, the site itself or a
+# mirror of it; see set_root_url
+SS_ROOT_URL = os.environ.get("SSGETPY_ROOT_URL", SS_SITE_URL).rstrip("/")
 SS_INDEX_URL = "/".join((SS_ROOT_URL, "files", "ssstats.csv"))
 
 if sys.platform == "win32":
@@ -17,7 +26,36 @@ else:
 
 SS_DB = os.path.join(SS_DIR, SS_DB)
 
-os.makedirs(SS_DIR, exist_ok=True)
+
+def set_root_url(url=None):
+    """
+    Downloads the index and matrices from `url`, such as a mirror made
+    with `ssget mirror`, from now on, or from the SuiteSparse Matrix
+    Collection itself if `url` is None.
+    """
+    global SS_ROOT_URL, SS_INDEX_URL
+    SS_ROOT_URL = (url or SS_SITE_URL).rstrip("/")
+    SS_INDEX_URL = "/".join((SS_ROOT_URL, "files", "ssstats.csv"))
+
+
+def parse_size(value):
+    """
+    Parses a byte count such as `1500`, `500K`, `10M` or `2G`.
+    """
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+# The most bytes the matrices under SS_DIR may use; None means no limit
+SS_CACHE_QUOTA = None
+if os.environ.get("SSGETPY_CACHE_QUOTA"):
+    SS_CACHE_QUOTA = parse_size(os.environ["SSGETPY_CACHE_QUOTA"])
+
+# The number of distinct search results MatrixDB keeps; 0 disables caching
+SS_SEARCH_CACHE_SIZE = int(os.environ.get("SSGETPY_SEARCH_CACHE_SIZE", 128))
 
 
 def dump():
@@ -26,7 +64,11 @@ def dump():
             SS_DIR=SS_DIR,
             SS_DB=SS_DB,
             SS_TABLE=SS_TABLE,
+            SS_JOURNAL_MODE=SS_JOURNAL_MODE,
+            SS_SITE_URL=SS_SITE_URL,
             SS_ROOT_URL=SS_ROOT_URL,
             SS_INDEX_URL=SS_INDEX_URL,
+            SS_CACHE_QUOTA=SS_CACHE_QUOTA,
+            SS_SEARCH_CACHE_SIZE=SS_SEARCH_CACHE_SIZE,
         )
     )
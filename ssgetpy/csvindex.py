@@ -3,15 +3,17 @@ The `csvindex` module parses the SSStats.csv file and
 generates entries for each row in a Matrix database
 """
 
+import collections
 import csv
 import logging
 
-import requests
-
-from .config import SS_INDEX_URL
+from . import config, net
 
 logger = logging.getLogger(__name__)
 
+# The rows of a freshly downloaded index and the validators of the file
+IndexUpdate = collections.namedtuple("IndexUpdate", "rows etag last_modified")
+
 
 def getdtype(real, logical):
     """
@@ -46,8 +48,21 @@ def gen_rows(csvrows):
         ), is2d3d, isspd, psym, nsym, kind
 
 
-def generate():
-    response = requests.get(SS_INDEX_URL)
+def download_index(etag=None, last_modified=None):
+    """
+    Downloads the CSV file and returns an `IndexUpdate`. If `etag` or
+    `last_modified` are given, the request is conditional and `None` is
+    returned if the file has not changed since.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = net.get(config.SS_INDEX_URL, headers=headers)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
     lines = response.iter_lines()
 
     # Read the number of entries
@@ -55,4 +70,12 @@ def generate():
     # Read the last modified date
     logger.info(f"Last modified date: {next(lines)}")
 
-    return gen_rows(line.decode("utf-8") for line in lines)
+    return IndexUpdate(
+        gen_rows(line.decode("utf-8") for line in lines),
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+    )
+
+
+def generate():
+    return download_index().rows
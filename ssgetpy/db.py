@@ -1,11 +1,44 @@
+import collections
 import datetime
 import logging
+import os
+import re
+import threading
 
-from .config import SS_DB, SS_TABLE
-from .matrix import Matrix, MatrixList
+from .config import SS_DB, SS_JOURNAL_MODE, SS_SEARCH_CACHE_SIZE, SS_TABLE
+from .matrix import Matrix, MatrixArray
 
 logger = logging.getLogger(__name__)
 
+# Columns with a B-tree index for equality and range constraints
+INDEXED_COLUMNS = ("rows", "cols", "nnz", "matrixgroup", "dtype", "kind")
+
+# Columns that searches may be ordered by
+ORDER_COLUMNS = (
+    "id",
+    "matrixgroup",
+    "name",
+    "rows",
+    "cols",
+    "nnz",
+    "dtype",
+    "is2d3d",
+    "isspd",
+    "psym",
+    "nsym",
+    "kind",
+)
+
+# Rows fetched from the cursor at a time by `MatrixDB.search_iter`
+BATCH_SIZE = 1000
+
+# Columns covered by the `text` search of `MatrixDB.search`
+TEXT_COLUMNS = ("name", "matrixgroup", "kind")
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+
 
 def _from_timestamp(timestamp):
     if hasattr(datetime.datetime, "fromisoformat"):
@@ -13,29 +46,86 @@ def _from_timestamp(timestamp):
     return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
 
 
+def _bounds(bounds):
+    if bounds is None:
+        return None
+    return tuple(None if b is None else int(b) for b in bounds)
+
+
+def _order(order_by):
+    """
+    Parses `order_by`, e.g. "nnz desc, rows" or ["-nnz", "rows"], into a
+    tuple of (column, descending) pairs.
+    """
+    if order_by is None:
+        return ()
+    if isinstance(order_by, str):
+        order_by = order_by.split(",")
+    keys = []
+    for item in order_by:
+        if isinstance(item, tuple):
+            column, descending = item
+        else:
+            words = item.lower().split()
+            descending = words[1:] == ["desc"]
+            if len(words) > 1 and not descending and words[1:] != ["asc"]:
+                raise ValueError(f"Invalid ordering: {item!r}")
+            column = words[0] if words else ""
+            if column.startswith("-"):
+                column, descending = column[1:], True
+        if column not in ORDER_COLUMNS:
+            raise ValueError(
+                f"Cannot order by {column!r}, must be one of "
+                + ", ".join(ORDER_COLUMNS)
+            )
+        keys.append((column, bool(descending)))
+    return tuple(keys)
+
+
 class MatrixDB:
-    def __init__(self, db=SS_DB, table=SS_TABLE):
+    def __init__(
+        self, db=SS_DB, table=SS_TABLE, cache_size=SS_SEARCH_CACHE_SIZE
+    ):
         import sqlite3
 
         self.db = db
+        os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
         self.matrix_table = table
         self.update_table = "update_table"
-        self.conn = sqlite3.connect(self.db)
-        self._create_table()
+        # Searches may run on other threads, e.g. in the executor of the
+        # aio module, so the connection is shared behind a lock
+        self.conn = sqlite3.connect(self.db, check_same_thread=False)
+        self.lock = threading.RLock()
+        # See config.SS_JOURNAL_MODE
+        self.conn.execute(f"PRAGMA journal_mode={SS_JOURNAL_MODE}")
+        # INSERT ... ON CONFLICT DO UPDATE needs SQLite 3.24
+        self.upsert = sqlite3.sqlite_version_info >= (3, 24, 0)
+        self.fts_table = f"{table}_fts"
+        with self.lock:
+            self._create_table()
+        # Search results by query, most recently used last, valid as long
+        # as the version of the table they were read from is current
+        self.cache_size = cache_size
+        self._results = collections.OrderedDict()
+        self._results_version = None
+        self._results_lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _fetchall(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
 
     def _get_nrows(self):
         return int(
-            self.conn.execute(
-                "SELECT COUNT(*) FROM %s" % self.matrix_table
-            ).fetchall()[0][0]
+            self._fetchall("SELECT COUNT(*) FROM %s" % self.matrix_table)[0][0]
         )
 
     nrows = property(_get_nrows)
 
     def _get_last_update(self):
-        last_update = self.conn.execute(
+        last_update = self._fetchall(
             "SELECT MAX(update_date) " + f"from {self.update_table}"
-        ).fetchall()[0][0]
+        )[0][0]
         return (
             _from_timestamp(last_update)
             if last_update
@@ -44,10 +134,60 @@ class MatrixDB:
 
     last_update = property(_get_last_update)
 
+    def _get_validators(self):
+        rows = self._fetchall(
+            f"SELECT etag, last_modified FROM {self.update_table} "
+            + "ORDER BY update_date DESC, rowid DESC LIMIT 1"
+        )
+        return tuple(rows[0]) if rows else (None, None)
+
+    # The ETag and Last-Modified headers of the CSV file last loaded
+    validators = property(_get_validators)
+
+    def _get_version(self):
+        # Every insert, refresh or check adds a row to the update table,
+        # including those made by other processes sharing the database
+        return tuple(
+            self._fetchall(
+                f"SELECT MAX(rowid), MAX(update_date) FROM {self.update_table}"
+            )[0]
+        )
+
+    def _get_data_version(self):
+        # Bumped by every change to the rows of the table, by this or any
+        # other process, but not by checks that find it up to date
+        return self._fetchall("PRAGMA user_version")[0][0]
+
+    def _bump_data_version(self):
+        # Runs inside the transaction that changes the table
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.conn.execute(f"PRAGMA user_version = {version + 1}")
+
+    def cache_info(self):
+        """
+        Returns the hits, misses, maximum and current size of the search
+        result cache.
+        """
+        with self._results_lock:
+            return CacheInfo(
+                self.hits, self.misses, self.cache_size, len(self._results)
+            )
+
+    def cache_clear(self):
+        """
+        Empties the search result cache and resets its statistics.
+        """
+        with self._results_lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
     def _drop_table(self):
-        self.conn.execute("DROP TABLE IF EXISTS %s" % self.matrix_table)
-        self.conn.execute(f"DROP TABLE IF EXISTS {self.update_table}")
-        self.conn.commit()
+        with self.lock:
+            self.conn.execute("DROP TABLE IF EXISTS %s" % self.matrix_table)
+            self.conn.execute(f"DROP TABLE IF EXISTS {self.update_table}")
+            self.conn.execute(f"DROP TABLE IF EXISTS {self.fts_table}")
+            self._bump_data_version()
+            self.conn.commit()
 
     def _create_table(self):
         self.conn.execute(
@@ -67,62 +207,278 @@ class MatrixDB:
             % self.matrix_table
         )
 
+        for column in INDEXED_COLUMNS:
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.matrix_table}_{column} "
+                + f"ON {self.matrix_table} ({column})"
+            )
+
         self.conn.execute(
             f"CREATE TABLE IF NOT EXISTS {self.update_table} "
-            + "(update_date TIMESTAMP)"
+            + "(update_date TIMESTAMP, etag TEXT, last_modified TEXT)"
         )
+        # Indexes created by older versions lack the validator columns
+        columns = [
+            row[1]
+            for row in self.conn.execute(
+                f"PRAGMA table_info({self.update_table})"
+            )
+        ]
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                self.conn.execute(
+                    f"ALTER TABLE {self.update_table} "
+                    + f"ADD COLUMN {column} TEXT"
+                )
+        self.has_fts = self._create_fts_table()
         self.conn.commit()
 
-    def insert(self, values):
-        self.conn.executemany(
-            "INSERT INTO %s VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"
-            % self.matrix_table,
-            values,
+    def _create_fts_table(self):
+        """
+        Creates the full-text index over `TEXT_COLUMNS` and the triggers
+        that keep it in sync with the matrix table. Returns False if
+        SQLite was built without FTS5.
+        """
+        import sqlite3
+
+        table, fts = self.matrix_table, self.fts_table
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)
+        ).fetchone()
+        columns = ", ".join(TEXT_COLUMNS)
+        old = ", ".join(f"old.{c}" for c in TEXT_COLUMNS)
+        new = ", ".join(f"new.{c}" for c in TEXT_COLUMNS)
+        try:
+            self.conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                + f"{columns}, content={table}, content_rowid=id)"
+            )
+        except sqlite3.OperationalError as exc:
+            logger.debug(f"Full-text search is not available: {exc}")
+            return False
+        self.conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert "
+            + f"AFTER INSERT ON {table} BEGIN "
+            + f"INSERT INTO {fts} (rowid, {columns}) VALUES (new.id, {new}); "
+            + "END"
         )
         self.conn.execute(
-            f"INSERT INTO {self.update_table} " + "VALUES (datetime('now'))"
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete "
+            + f"AFTER DELETE ON {table} BEGIN "
+            + f"INSERT INTO {fts} ({fts}, rowid, {columns}) "
+            + f"VALUES ('delete', old.id, {old}); "
+            + "END"
         )
-        self.conn.commit()
+        self.conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update "
+            + f"AFTER UPDATE OF {columns} ON {table} BEGIN "
+            + f"INSERT INTO {fts} ({fts}, rowid, {columns}) "
+            + f"VALUES ('delete', old.id, {old}); "
+            + f"INSERT INTO {fts} (rowid, {columns}) VALUES (new.id, {new}); "
+            + "END"
+        )
+        if not exists:
+            # Index the rows of a database created by an older version
+            self.conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        return True
+
+    def _record_update(self, etag=None, last_modified=None):
+        self.conn.execute(
+            f"INSERT INTO {self.update_table} "
+            + "VALUES (datetime('now'), ?, ?)",
+            (etag, last_modified),
+        )
+
+    def insert(self, values):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO %s VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"
+                % self.matrix_table,
+                values,
+            )
+            self._bump_data_version()
+            self._record_update()
+            self.conn.commit()
+
+    def refresh(self, values, etag=None, last_modified=None):
+        """
+        Brings the table in line with `values`, the complete list of rows,
+        in a single transaction: rows are upserted by id, only changed rows
+        are rewritten and rows that no longer exist are deleted. Readers
+        never see a partially refreshed table. `etag` and `last_modified`
+        identify the CSV file the rows came from. SQLite versions before
+        3.24, which lack upserts, update and insert in separate passes.
+        """
+        with self.lock:
+            columns = self._columns()[1:]
+            values = list(values)
+            try:
+                self.conn.execute("DROP TABLE IF EXISTS temp.refreshed_ids")
+                self.conn.execute(
+                    "CREATE TEMP TABLE refreshed_ids (id INTEGER PRIMARY KEY)"
+                )
+                if self.upsert:
+                    updates = ", ".join(f"{c} = excluded.{c}" for c in columns)
+                    changed = " OR ".join(
+                        f"{c} IS NOT excluded.{c}" for c in columns
+                    )
+                    self.conn.executemany(
+                        f"INSERT INTO {self.matrix_table} "
+                        + "VALUES(?,?,?,?,?,?,?,?,?,?,?,?) "
+                        + "ON CONFLICT(id) DO UPDATE "
+                        + f"SET {updates} WHERE {changed}",
+                        values,
+                    )
+                else:
+                    # Changed rows are updated in place rather than
+                    # replaced, so that the FTS triggers see an update
+                    updates = ", ".join(f"{c} = ?" for c in columns)
+                    changed = " OR ".join(f"{c} IS NOT ?" for c in columns)
+                    self.conn.executemany(
+                        f"UPDATE {self.matrix_table} SET {updates} "
+                        + f"WHERE id = ? AND ({changed})",
+                        (
+                            tuple(row[1:]) + (row[0],) + tuple(row[1:])
+                            for row in values
+                        ),
+                    )
+                    self.conn.executemany(
+                        f"INSERT OR IGNORE INTO {self.matrix_table} "
+                        + "VALUES(?,?,?,?,?,?,?,?,?,?,?,?)",
+                        values,
+                    )
+                self.conn.executemany(
+                    "INSERT INTO refreshed_ids VALUES (?)",
+                    ((row[0],) for row in values),
+                )
+                self.conn.execute(
+                    f"DELETE FROM {self.matrix_table} "
+                    + "WHERE id NOT IN (SELECT id FROM refreshed_ids)"
+                )
+                self._bump_data_version()
+                self._record_update(etag, last_modified)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self.conn.execute("DROP TABLE IF EXISTS temp.refreshed_ids")
 
-    def refresh(self, values):
-        self._drop_table()
-        self._create_table()
-        self.insert(values)
+    def mark_current(self, etag=None, last_modified=None):
+        """
+        Records that the table was found to be up to date.
+        """
+        with self.lock:
+            self._record_update(etag, last_modified)
+            self.conn.commit()
+
+    def _columns(self):
+        return [
+            row[1]
+            for row in self._fetchall(
+                f"PRAGMA table_info({self.matrix_table})"
+            )
+        ]
 
     def dump(self):
-        return self.conn.execute(
-            "SELECT * from %s" % self.matrix_table
-        ).fetchall()
+        return self._fetchall("SELECT * from %s" % self.matrix_table)
 
+    # Constraint helpers return a (clause, parameters) pair, or None if
+    # the constraint is not set. Values are always bound as parameters.
     @staticmethod
     def _is_constraint(field, value):
-        return value and "(%s = '%s')" % (field, value)
+        if not value:
+            return None
+        return "(%s = ?)" % field, [value]
 
     @staticmethod
     def _like_constraint(field, value):
-        return value and "(%s LIKE '%%%s%%')" % (field, value)
+        if not value:
+            return None
+        return "(%s LIKE ?)" % field, ["%" + value + "%"]
+
+    @staticmethod
+    def _text_constraint(words):
+        # Substring matches for SQLite builds without FTS5
+        if not words:
+            return None
+        clause = "(" + " OR ".join(f"{c} LIKE ?" for c in TEXT_COLUMNS) + ")"
+        return " AND ".join([clause] * len(words)), [
+            "%" + word + "%" for word in words for _ in TEXT_COLUMNS
+        ]
+
+    @staticmethod
+    def _after_constraint(keys, after_id):
+        # Keyset pagination: rows that sort after the row `after_id`. NULLs
+        # sort first in ascending order and last in descending order.
+        if after_id is None:
+            return None
+        clauses = []
+        params = []
+        for i, (column, descending, value) in enumerate(keys):
+            terms = [f"{c} IS ?" for c, _, _ in keys[:i]]
+            if value is None:
+                if descending:
+                    continue
+                terms.append(f"{column} IS NOT NULL")
+            elif descending:
+                terms.append(f"({column} < ? OR {column} IS NULL)")
+            else:
+                terms.append(f"{column} > ?")
+            clauses.append("(" + " AND ".join(terms) + ")")
+            params.extend(v for _, _, v in keys[:i])
+            if value is not None:
+                params.append(value)
+        return "(" + " OR ".join(clauses) + ")", params
 
     @staticmethod
     def _sz_constraint(field, bounds):
         if bounds is None or (bounds[0] is None and bounds[1] is None):
             return None
         constraints = []
+        params = []
         if bounds[0] is not None:
-            constraints.append("%s >= %d" % (field, bounds[0]))
+            constraints.append("%s >= ?" % field)
+            params.append(int(bounds[0]))
         if bounds[1] is not None:
-            constraints.append("%s <= %d" % (field, bounds[1]))
-        return " ( " + " AND ".join(constraints) + " ) "
+            constraints.append("%s <= ?" % field)
+            params.append(int(bounds[1]))
+        return " ( " + " AND ".join(constraints) + " ) ", params
 
     @staticmethod
     def _bool_constraint(field, value):
         if value is None:
             return None
         elif value:
-            return "(%s = 1)" % field
+            return "(%s = 1)" % field, []
         else:
-            return "(%s = 0)" % field
+            return "(%s = 0)" % field, []
 
-    def search(
+    def _after_values(self, columns, after_id, match=None):
+        # Returns the values of `columns` in the row `after_id`
+        selected = [
+            (
+                f"(SELECT rank FROM {self.fts_table} "
+                + f"WHERE {self.fts_table} MATCH ? AND rowid = id)"
+                if column == "fts_rank"
+                else column
+            )
+            for column in columns
+        ]
+        params = [match] if "fts_rank" in columns else []
+        rows = self._fetchall(
+            f"SELECT {', '.join(selected)} FROM {self.matrix_table} "
+            + "WHERE id = ?",
+            params + [after_id],
+        )
+        if not rows:
+            raise ValueError(f"No matrix has id {after_id}")
+        values = rows[0]
+        if "fts_rank" in columns and values[columns.index("fts_rank")] is None:
+            raise ValueError(f"Matrix {after_id} does not match the text")
+        return values
+
+    def _build_query(
         self,
         matid=None,
         group=None,
@@ -135,9 +491,47 @@ class MatrixDB:
         isspd=None,
         kind=None,
         limit=10,
+        text=None,
+        order_by=None,
+        after_id=None,
     ):
-
         querystring = "SELECT * FROM %s" % self.matrix_table
+        params = []
+
+        # Words of `text` match words in TEXT_COLUMNS that start with them
+        words = re.findall(r"[^\W_]+", text or "")
+        ranked = bool(words) and self.has_fts
+        if ranked:
+            # Join the ranks of the matching rows to order by relevance
+            querystring = (
+                f"SELECT {self.matrix_table}.* FROM {self.matrix_table} "
+                + "JOIN (SELECT rowid AS fts_id, rank AS fts_rank "
+                + f"FROM {self.fts_table} WHERE {self.fts_table} MATCH ?) "
+                + "ON fts_id = id"
+            )
+            match = " ".join('"%s"*' % word for word in words)
+            params.append(match)
+            words = None
+
+        # Rows are ordered by `order_by`, or by relevance when searching
+        # for text, with ties broken by id so that the order is stable.
+        columns = list(_order(order_by))
+        if ranked and not columns:
+            columns.append(("fts_rank", False))
+        if "id" not in (column for column, _ in columns):
+            columns.append(("id", False))
+        # Each key is a (column, descending, value in row `after_id`) tuple
+        values = [None] * len(columns)
+        if after_id is not None:
+            values = self._after_values(
+                [column for column, _ in columns],
+                after_id,
+                match if ranked else None,
+            )
+        keys = [
+            (column, descending, value)
+            for (column, descending), value in zip(columns, values)
+        ]
 
         mid_constraint = MatrixDB._is_constraint("id", matid)
         grp_constraint = MatrixDB._is_constraint("matrixgroup", group)
@@ -149,6 +543,8 @@ class MatrixDB:
         geo_constraint = MatrixDB._bool_constraint("is2d3d", is2d3d)
         spd_constraint = MatrixDB._bool_constraint("isspd", isspd)
         knd_constraint = MatrixDB._like_constraint("kind", kind)
+        txt_constraint = MatrixDB._text_constraint(words)
+        aft_constraint = MatrixDB._after_constraint(keys, after_id)
 
         constraints = list(
             filter(
@@ -164,17 +560,142 @@ class MatrixDB:
                     geo_constraint,
                     spd_constraint,
                     knd_constraint,
+                    txt_constraint,
+                    aft_constraint,
                 ),
             )
         )
 
-        if any(constraints):
-            querystring += " WHERE " + " AND ".join(constraints)
+        if constraints:
+            querystring += " WHERE " + " AND ".join(c for c, _ in constraints)
+            for _, values in constraints:
+                params.extend(values)
+
+        order = ", ".join(
+            f"{column} DESC" if descending else column
+            for column, descending, _ in keys
+        )
+        filtered = any(c is not aft_constraint for c in constraints)
+        if order == "id" and filtered:
+            # Sort the few matching rows rather than let the planner walk
+            # the whole table in id order instead of using an index
+            order = "+id"
+        querystring += " ORDER BY " + order
 
-        querystring += " LIMIT (%s)" % limit
+        if limit is not None:
+            querystring += " LIMIT ?"
+            params.append(int(limit))
 
-        logger.debug(querystring)
+        return querystring, params
 
-        return MatrixList(
-            Matrix(*x) for x in self.conn.execute(querystring).fetchall()
+    def search(
+        self,
+        matid=None,
+        group=None,
+        name=None,
+        rowbounds=None,
+        colbounds=None,
+        nzbounds=None,
+        dtype=None,
+        is2d3d=None,
+        isspd=None,
+        kind=None,
+        limit=10,
+        columnar=False,
+        text=None,
+        order_by=None,
+        after_id=None,
+        cache=True,
+    ):
+        """
+        Returns the matrices that match the given criteria as a
+        `MatrixList`, or as a `MatrixArray` if `columnar` is True, which
+        avoids creating a `Matrix` object per row up front.
+
+        `text` selects matrices whose name, group or kind contain words
+        starting with each of its words, e.g. "circuit sim", most
+        relevant first.
+
+        Results are ordered by `order_by`, such as "nnz desc" or
+        ["-nnz", "rows"], and then by id. Passing the id of the last
+        matrix of a page as `after_id` returns the next page, and raises
+        `ValueError` if no matrix has that id.
+
+        Results of recent searches are reused until the table changes,
+        though each call returns new `Matrix` objects. Pass `cache=False`
+        to always query the database.
+        """
+        key = (
+            int(matid) if matid else None,
+            group or None,
+            name or None,
+            _bounds(rowbounds),
+            _bounds(colbounds),
+            _bounds(nzbounds),
+            dtype or None,
+            None if is2d3d is None else bool(is2d3d),
+            None if isspd is None else bool(isspd),
+            kind or None,
+            None if limit is None else int(limit),
+            text or None,
+            _order(order_by),
+            None if after_id is None else int(after_id),
         )
+        if cache and self.cache_size:
+            version = self._get_data_version()
+            with self._results_lock:
+                if version != self._results_version:
+                    self._results.clear()
+                    self._results_version = version
+                result = self._results.get(key)
+                if result is not None:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return result if columnar else result.to_list()
+                self.misses += 1
+
+        # Results are kept as a MatrixArray, whose columns are tuples, so
+        # callers cannot modify the cached copy
+        result = self._search(*key)
+
+        if cache and self.cache_size:
+            with self._results_lock:
+                if version == self._results_version:
+                    self._results[key] = result
+                    while len(self._results) > self.cache_size:
+                        self._results.popitem(last=False)
+        return result if columnar else result.to_list()
+
+    def _search(self, *args):
+        querystring, params = self._build_query(*args)
+
+        logger.debug("%s %s" % (querystring, params))
+
+        return MatrixArray.from_rows(self._fetchall(querystring, params))
+
+    def search_iter(self, batch_size=BATCH_SIZE, limit=None, **kwargs):
+        """
+        Like `search`, but yields the matching matrices one by one,
+        fetching `batch_size` rows from the database at a time, so that
+        even the whole collection is read in constant memory and the
+        database is not kept locked between batches. Unlike
+        `search`, the number of matrices is not limited by default.
+        """
+        # Each batch is a separate keyset query, so that no cursor, and
+        # with it no lock on the database, is held while the caller works
+        # on the matrices, e.g. downloading them
+        after_id = kwargs.pop("after_id", None)
+        while limit is None or limit > 0:
+            size = batch_size if limit is None else min(batch_size, limit)
+            querystring, params = self._build_query(
+                limit=size, after_id=after_id, **kwargs
+            )
+            logger.debug("%s %s" % (querystring, params))
+            rows = self._fetchall(querystring, params)
+            for row in rows:
+                yield Matrix(*row)
+            if len(rows) < size:
+                break
+            after_id = rows[-1][0]
+            if limit is not None:
+                limit -= len(rows)
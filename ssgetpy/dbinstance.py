@@ -1,20 +1,88 @@
 """
-The `dbinstance` module creates a singleton `MatrixDB` database
+The `dbinstance` module provides the singleton `MatrixDB` database
 instance, populating it from ssstats.csv if necessary.
+
+The database is opened by `get_instance` on first use rather than when
+`ssgetpy` is imported, so importing the package never touches the disk
+or the network.
 """
+
 import datetime
 import logging
+import sys
+import threading
+import types
 
-from . import csvindex
+from .config import SS_DB
 from .db import MatrixDB
+from .locking import FileLock
 
 logger = logging.getLogger(__name__)
 
 
-instance = MatrixDB()
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_instance():
+    """
+    Returns the shared `MatrixDB`, creating it and (re)building the index
+    from the CSV file if it is empty or more than 90 days old.
+    """
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            # Another process may be creating the same database
+            with FileLock(SS_DB + ".lock"):
+                instance = MatrixDB()
+            if instance.nrows == 0:
+                refresh_index(instance, force=True)
+            elif (
+                datetime.datetime.utcnow() - instance.last_update
+            ) > datetime.timedelta(days=90):
+                refresh_index(instance)
+            _instance = instance
+    return _instance
+
+
+def refresh_index(instance=None, force=False):
+    """
+    Brings the index up to date with the CSV file on the server.
+
+    Unless `force` is set, the download is conditional on the file having
+    changed since it was last loaded, so an unchanged index costs a single
+    round trip. Changed rows are upserted in one transaction. Returns True
+    if the index was updated.
+
+    Only one process refreshes the index at a time. Processes that find
+    a refresh in progress wait for it and then use its result.
+    """
+    from . import csvindex
+
+    instance = instance or get_instance()
+    version = instance._get_version()
+    with FileLock(instance.db + ".lock"):
+        if instance._get_version() != version:
+            logger.info("Index was refreshed by another process")
+            return False
+        etag, last_modified = (None, None) if force else instance.validators
+        update = csvindex.download_index(etag, last_modified)
+        if update is None:
+            logger.info("Index is up to date")
+            instance.mark_current(etag, last_modified)
+            return False
+        logger.info("Updating index from CSV file...")
+        instance.refresh(update.rows, update.etag, update.last_modified)
+    return True
+
+
+class _Module(types.ModuleType):
+    # Keeps `dbinstance.instance` working now that it is created lazily;
+    # a property on the module's class, since module `__getattr__` needs
+    # Python 3.7
+    @property
+    def instance(self):
+        return get_instance()
+
 
-if instance.nrows == 0 or (
-    datetime.datetime.utcnow() - instance.last_update
-) > datetime.timedelta(days=90):
-    logger.info("{Re}creating index from CSV file...")
-    instance.refresh(csvindex.generate())
+sys.modules[__name__].__class__ = _Module
@@ -0,0 +1,293 @@
+"""
+The `events` module reports what happens while matrices are downloaded.
+
+Each download goes through up to five phases:
+
+* `connect`: from sending the request until the response headers arrive
+  (the time to first byte),
+* `transfer`: receiving the body, which includes unpacking it when a
+  bundle is extracted as it streams in,
+* `verify`: checking that the complete file was received,
+* `extract`: unpacking a bundle that was saved to disk first,
+* `convert`: saving the matrix as a binary CSR file, when downloading
+  with `pipeline`.
+
+`Matrix.download`, `MatrixList.download` and `ssgetpy.fetch` accept a
+`reporter`, an object with the methods of `Reporter`, that is told when
+each download and phase starts and finishes, how many bytes arrive and
+when a transfer is retried. `TqdmReporter` draws the usual progress bar,
+`JSONLinesReporter` logs one JSON object per event and `StatsDReporter`
+sends timers and counters to a StatsD server. `MultiReporter` combines
+several of them.
+"""
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("connect", "transfer", "verify", "extract", "convert")
+
+
+def _label(matrix):
+    return f"{matrix.group}/{matrix.name}"
+
+
+class Reporter:
+    """
+    Receives download events. Every method does nothing by default, so
+    subclasses only override the events they are interested in. Methods
+    may be called from several threads at once when matrices are
+    downloaded concurrently.
+    """
+
+    def started(self, matrix):
+        """Called when the download of `matrix` starts."""
+
+    def phase_started(self, matrix, phase):
+        """Called when `matrix` enters `phase`."""
+
+    def total(self, matrix, nbytes):
+        """Called with the size of the file once the server reports it."""
+
+    def progress(self, matrix, phase, nbytes):
+        """Called as `nbytes` more bytes of `matrix` are received."""
+
+    def retry(self, matrix, phase, attempt, error):
+        """Called when `phase` is retried after `error`."""
+
+    def phase_finished(self, matrix, phase, seconds, nbytes):
+        """Called when `phase` ends after `seconds` and `nbytes` bytes."""
+
+    def finished(self, matrix, seconds, error=None):
+        """Called when the download ends, with the `error` if it failed."""
+
+    def close(self):
+        """Called once a batch of downloads is over."""
+
+
+class MultiReporter(Reporter):
+    """
+    Passes every event on to each of `reporters`.
+    """
+
+    def __init__(self, *reporters):
+        self.reporters = [r for r in reporters if r is not None]
+
+    def _each(name):
+        def method(self, *args, **kwargs):
+            for reporter in self.reporters:
+                getattr(reporter, name)(*args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    started = _each("started")
+    phase_started = _each("phase_started")
+    total = _each("total")
+    progress = _each("progress")
+    retry = _each("retry")
+    phase_finished = _each("phase_finished")
+    finished = _each("finished")
+    close = _each("close")
+    del _each
+
+
+class TqdmReporter(Reporter):
+    """
+    Shows the bytes received by all downloads it is given in a single
+    `tqdm` progress bar labelled `desc`. If `count` is given, the bar
+    also shows how many of the `count` matrices are done.
+    """
+
+    def __init__(self, desc=None, count=None):
+        self.desc = desc
+        self.count = count
+        self.done = 0
+        self.pbar = None
+        self.lock = threading.Lock()
+
+    def _bar(self):
+        if self.pbar is None:
+            from tqdm.auto import tqdm
+
+            self.pbar = tqdm(
+                total=0, desc=self.desc, unit="B", unit_scale=True
+            )
+        return self.pbar
+
+    def total(self, matrix, nbytes):
+        with self.lock:
+            pbar = self._bar()
+            pbar.total = (pbar.total or 0) + (nbytes or 0)
+            pbar.refresh()
+
+    def progress(self, matrix, phase, nbytes):
+        with self.lock:
+            self._bar().update(nbytes)
+
+    def finished(self, matrix, seconds, error=None):
+        if self.count is not None:
+            with self.lock:
+                self.done += 1
+                self._bar().set_postfix_str(
+                    f"{self.done}/{self.count} matrices"
+                )
+
+    def close(self):
+        with self.lock:
+            if self.pbar is not None:
+                self.pbar.close()
+                self.pbar = None
+
+
+class JSONLinesReporter(Reporter):
+    """
+    Writes one JSON object per line to `output`, a file name or a text
+    stream, for every phase, retry and finished download. Byte counts
+    are reported per phase rather than as they arrive.
+    """
+
+    def __init__(self, output):
+        self.owned = isinstance(output, str)
+        self.stream = open(output, "a") if self.owned else output
+        self.lock = threading.Lock()
+
+    def _write(self, event, matrix, **fields):
+        record = dict(
+            event=event,
+            time=time.time(),
+            id=matrix.id,
+            matrix=_label(matrix),
+            **fields,
+        )
+        with self.lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+
+    def retry(self, matrix, phase, attempt, error):
+        self._write(
+            "retry", matrix, phase=phase, attempt=attempt, error=str(error)
+        )
+
+    def phase_finished(self, matrix, phase, seconds, nbytes):
+        fields = dict(phase=phase, seconds=seconds, bytes=nbytes)
+        if phase == "transfer" and seconds > 0:
+            fields["bytes_per_second"] = nbytes / seconds
+        self._write("phase", matrix, **fields)
+
+    def finished(self, matrix, seconds, error=None):
+        self._write(
+            "finished",
+            matrix,
+            seconds=seconds,
+            error=None if error is None else str(error),
+        )
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+
+class StatsDReporter(Reporter):
+    """
+    Sends metrics to the StatsD server at `host`:`port` over UDP, named
+    `<prefix>.<phase>.time` (timers, in milliseconds),
+    `<prefix>.<phase>.bytes` and `<prefix>.retries`, `<prefix>.downloads`
+    and `<prefix>.errors` (counters) and
+    `<prefix>.transfer.bytes_per_second` (a gauge). Metrics that cannot
+    be sent are dropped.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="ssgetpy"):
+        import socket
+
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, *metrics):
+        payload = "\n".join(f"{self.prefix}.{m}" for m in metrics)
+        try:
+            self.socket.sendto(payload.encode("ascii"), self.address)
+        except OSError as exc:
+            logger.debug(f"Could not send metrics to StatsD: {exc}")
+
+    def retry(self, matrix, phase, attempt, error):
+        self._send("retries:1|c")
+
+    def phase_finished(self, matrix, phase, seconds, nbytes):
+        metrics = [f"{phase}.time:{seconds * 1000:.3f}|ms"]
+        if nbytes:
+            metrics.append(f"{phase}.bytes:{nbytes}|c")
+        if phase == "transfer" and seconds > 0:
+            metrics.append(
+                f"transfer.bytes_per_second:{nbytes / seconds:.0f}|g"
+            )
+        self._send(*metrics)
+
+    def finished(self, matrix, seconds, error=None):
+        self._send("downloads:1|c" if error is None else "errors:1|c")
+
+    def close(self):
+        self.socket.close()
+
+
+class Tracker:
+    """
+    Times the phases of the download of `matrix` and reports them to
+    `reporter`. It also serves as the `progress` object of
+    `transfer.RemoteFile`.
+    """
+
+    def __init__(self, reporter, matrix):
+        self.reporter = reporter
+        self.matrix = matrix
+        self.phase = None
+        self.nbytes = 0
+        self.start = self.phase_start = time.monotonic()
+        reporter.started(matrix)
+
+    def enter(self, phase):
+        """
+        Ends the current phase, if any, and starts `phase`.
+        """
+        self.end_phase()
+        self.phase = phase
+        self.nbytes = 0
+        self.phase_start = time.monotonic()
+        self.reporter.phase_started(self.matrix, phase)
+
+    def end_phase(self):
+        """
+        Ends the current phase, if any, without starting another.
+        """
+        if self.phase is not None:
+            self.reporter.phase_finished(
+                self.matrix,
+                self.phase,
+                time.monotonic() - self.phase_start,
+                self.nbytes,
+            )
+            self.phase = None
+
+    def add_total(self, nbytes):
+        self.reporter.total(self.matrix, nbytes)
+
+    def update(self, nbytes):
+        self.nbytes += nbytes
+        self.reporter.progress(self.matrix, self.phase, nbytes)
+
+    def retry(self, attempt, error):
+        self.reporter.retry(self.matrix, self.phase, attempt, error)
+
+    def close(self, error=None):
+        """
+        Ends the current phase and the download.
+        """
+        self.end_phase()
+        self.reporter.finished(
+            self.matrix, time.monotonic() - self.start, error
+        )
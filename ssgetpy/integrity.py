@@ -0,0 +1,232 @@
+"""
+The `integrity` module keeps a manifest of the size and checksum of every
+file `ssgetpy` downloads or unpacks, so that damaged files are noticed.
+
+Checksums are computed as the data is written, so recording them costs
+no extra reads. Before reusing a file, `Matrix.download` makes a cheap
+check that it still has the size and modification time recorded in the
+manifest, and downloads it again if not. `verify` goes further and
+hashes every file in the manifest, in parallel, deleting the ones whose
+contents no longer match so that they are downloaded again when next
+needed.
+
+The manifest is stored in the same SQLite database as the index.
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+from .config import SS_DB
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "sha256"
+
+# Bytes read at a time when hashing a file
+BUFSIZE = 1024 * 1024
+
+# `root` is the downloaded file itself, or the directory that the file
+# was unpacked into
+Entry = collections.namedtuple(
+    "Entry", ["path", "root", "size", "mtime_ns", "algorithm", "digest"]
+)
+
+
+def new_hash():
+    return hashlib.new(ALGORITHM)
+
+
+def hash_file(path, digest=None):
+    """
+    Feeds the contents of `path` to `digest`, a new hash by default, and
+    returns it.
+    """
+    digest = digest or new_hash()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(BUFSIZE)
+            if not chunk:
+                return digest
+            digest.update(chunk)
+
+
+class HashingWriter:
+    """
+    Wraps the file `fileobj`, passing everything written to it through
+    `digest` as well.
+    """
+
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.fileobj.write(data)
+
+
+def remove(path):
+    """
+    Deletes the file or directory `path`, if it exists.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.unlink(path)
+
+
+class Manifest:
+    def __init__(self, db=SS_DB):
+        import sqlite3
+
+        os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        # Concurrent downloads share this connection
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS MANIFEST (
+                                 path TEXT PRIMARY KEY,
+                                 root TEXT,
+                                 size INTEGER,
+                                 mtime_ns INTEGER,
+                                 algorithm TEXT,
+                                 digest TEXT)""")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS MANIFEST_root ON MANIFEST (root)"
+            )
+            self.conn.commit()
+
+    def record(self, path, digest, root=None):
+        """
+        Records the checksum `digest` (a hash object or hex string) of the
+        file `path`, unpacked into the directory `root` if given, along
+        with its current size and modification time.
+        """
+        path = os.path.abspath(path)
+        root = os.path.abspath(root or path)
+        if not isinstance(digest, str):
+            digest = digest.hexdigest()
+        stat = os.stat(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO MANIFEST VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    root,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    ALGORITHM,
+                    digest,
+                ),
+            )
+            self.conn.commit()
+
+    def forget(self, root):
+        """
+        Removes the file `root`, or the files unpacked into the directory
+        `root`, from the manifest.
+        """
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM MANIFEST WHERE root = ?", (os.path.abspath(root),)
+            )
+            self.conn.commit()
+
+    def entries(self, root=None):
+        """
+        Returns the entries for the file `root`, or for the files unpacked
+        into the directory `root`, or for every file if `root` is None.
+        """
+        query, params = "SELECT * FROM MANIFEST", ()
+        if root is not None:
+            query, params = query + " WHERE root = ?", (os.path.abspath(root),)
+        with self.lock:
+            return [Entry(*row) for row in self.conn.execute(query, params)]
+
+    def check(self, root):
+        """
+        Returns False if the file `root`, or any file unpacked into the
+        directory `root`, has gone missing or changed size or modification
+        time since it was recorded, without reading any files. Paths that
+        are not in the manifest pass.
+        """
+        for entry in self.entries(root):
+            try:
+                stat = os.stat(entry.path)
+            except OSError:
+                return False
+            if (stat.st_size, stat.st_mtime_ns) != (
+                entry.size,
+                entry.mtime_ns,
+            ):
+                return False
+        return True
+
+    def _verify(self, entry):
+        # Returns True if `entry` is intact and None if its whole matrix
+        # has been deleted
+        if not os.path.exists(entry.path):
+            return None if not os.path.exists(entry.root) else False
+        if os.path.getsize(entry.path) != entry.size:
+            return False
+        digest = hash_file(entry.path, hashlib.new(entry.algorithm))
+        if digest.hexdigest() != entry.digest:
+            return False
+        if os.stat(entry.path).st_mtime_ns != entry.mtime_ns:
+            # Touched or copied but intact, so the quick check can pass
+            self.record(entry.path, entry.digest, entry.root)
+        return True
+
+    def verify(self, root=None, workers=None):
+        """
+        Hashes the files in the manifest for `root` (every file by
+        default) with up to `workers` threads and returns the entries of
+        the ones that do not match. Matrices that have been deleted are
+        dropped from the manifest.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        entries = self.entries(root)
+        with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+            results = list(executor.map(self._verify, entries))
+        for entry, intact in zip(entries, results):
+            if intact is None:
+                self.forget(entry.root)
+        return [e for e, intact in zip(entries, results) if intact is False]
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """
+    Returns the `Manifest` in the index database, creating it on first
+    use.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = Manifest()
+    return _manifest
+
+
+def verify(root=None, workers=None, repair=True):
+    """
+    Checks every downloaded file, or those of the matrix at `root`,
+    against its checksum with up to `workers` threads and returns the
+    entries of the damaged ones. With `repair`, damaged matrices are
+    deleted so that they are downloaded again when next needed.
+    """
+    manifest = get_manifest()
+    corrupt = manifest.verify(root, workers)
+    for entry in corrupt:
+        logger.warning(f"{entry.path} does not match its checksum")
+        if repair:
+            remove(entry.root)
+            manifest.forget(entry.root)
+    return corrupt
@@ -0,0 +1,158 @@
+"""
+The `locking` module provides the advisory file locks that let several
+processes, on one machine or on several machines sharing `SS_DIR` over
+NFS, download into the same directories without getting in each other's
+way.
+
+Each matrix has a lock file next to its download, `.<name>.<format>.lock`,
+which is held while the matrix is checked, downloaded and unpacked. The
+first process to take it downloads the matrix; the others wait and then
+find it on disk. The index has one too, `index.db.lock`, which is held
+while the index is refreshed.
+
+Locks are taken with `fcntl.lockf`, which NFS forwards to the server's
+lock manager, or with `msvcrt.locking` on Windows. These locks belong to
+the whole process, so the threads of one process are kept apart by an
+ordinary lock first. Lock files are never deleted, since deleting one
+while another process waits on it would let two processes take it.
+
+The index database itself relies on SQLite's own locking, which is why
+it keeps a rollback journal by default: SQLite's write-ahead log
+(`SSGETPY_JOURNAL_MODE=WAL`) needs memory shared between the processes,
+so it is only safe when `SS_DIR` is on a local disk.
+"""
+
+import errno
+import os
+import sys
+import threading
+import time
+
+# Seconds between attempts to take a lock that is held elsewhere, when
+# the platform cannot wait for it
+POLL_INTERVAL = 0.05
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(path):
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(path, threading.Lock())
+
+
+def _lock_file(fd, wait):
+    # Returns False if another process holds the lock and `wait` is unset
+    if sys.platform == "win32":
+        import msvcrt
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    import fcntl
+
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+    except OSError as exc:
+        if exc.errno in (errno.EACCES, errno.EAGAIN):
+            return False
+        raise
+    return True
+
+
+def _unlock_file(fd):
+    if sys.platform == "win32":
+        import msvcrt
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """
+    An exclusive advisory lock on the file `path`, which is created along
+    with its directory if it does not exist. Use it as a context manager,
+    or call `acquire` and `release`, possibly from different threads.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = _thread_lock(self.path)
+        self._fd = None
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Takes the lock and returns True. If another thread or process
+        holds it, waits for up to `timeout` seconds (forever if None), or
+        returns False at once if `blocking` is unset.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not (
+            self._lock.acquire(True, timeout)
+            if blocking and timeout is not None
+            else self._lock.acquire(blocking)
+        ):
+            return False
+        try:
+            # The lock may be the first thing created under SS_DIR
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                # Block in the kernel when possible, otherwise poll
+                wait = (
+                    blocking and deadline is None and sys.platform != "win32"
+                )
+                while not _lock_file(fd, wait):
+                    if not blocking or (
+                        deadline is not None and time.monotonic() >= deadline
+                    ):
+                        os.close(fd)
+                        self._lock.release()
+                        return False
+                    time.sleep(POLL_INTERVAL)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._lock.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            raise RuntimeError(f"{self.path} is not locked")
+        try:
+            _unlock_file(fd)
+        finally:
+            os.close(fd)
+            self._lock.release()
+
+    @property
+    def locked(self):
+        """True while this `FileLock` holds the lock."""
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def matrix_lock(destpath, name, format):
+    """
+    Returns the `FileLock` for the matrix `name` downloaded in `format`
+    to the directory `destpath`.
+    """
+    return FileLock(os.path.join(destpath, f".{name}.{format}.lock"))
@@ -1,27 +1,230 @@
+import collections.abc
+import logging
 import os
-import time
 
-import requests
-from tqdm.auto import tqdm
+from . import config, events, integrity, locking, transfer
+from .cache import get_cache
+from .config import SS_DIR
+from .transfer import as_bucket
 
-from . import bundle
-from .config import SS_DIR, SS_ROOT_URL
+logger = logging.getLogger(__name__)
 
 
-class MatrixList(list):
+class DownloadError(Exception):
+    """
+    Raised by `MatrixList.download` when one or more matrices in a batch
+    could not be downloaded. The `errors` attribute is a list of
+    `(matrix, exception)` pairs, one per failed matrix.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(
+            "Failed to download %d matri%s: %s"
+            % (
+                len(errors),
+                "x" if len(errors) == 1 else "ces",
+                ", ".join(f"{m.group}/{m.name}" for m, _ in errors),
+            )
+        )
+
+
+class _MatrixSequence:
+    # Rendering and downloading shared by MatrixList and MatrixArray
+
     def _repr_html_(self):
         body = "".join(r.to_html_row() for r in self)
         return f"<table>{Matrix.html_header()}<tbody>{body}</tbody></table>"
 
+    def download(
+        self,
+        format="MM",
+        destpath=None,
+        extract=False,
+        workers=1,
+        chunk_size=None,
+        rate_limit=None,
+        reporter=None,
+        processes=0,
+        convert=False,
+        budget=None,
+        policy=None,
+        estimate="nnz",
+    ):
+        """
+        Downloads every matrix in this list. If `workers` is greater than
+        one, up to `workers` matrices are transferred concurrently.
+        `chunk_size` and `rate_limit` are passed on to `Matrix.download`;
+        the rate limit applies to the combined throughput of the batch.
+
+        `reporter` receives the events of every download, as described
+        in the `events` module. By default the progress of the whole
+        batch is shown in a single progress bar.
+
+        A failure to download one matrix does not abort the others; the
+        errors are collected and raised together as a `DownloadError`
+        once the whole batch has been attempted.
+
+        Given `processes` or `convert`, bundles are instead saved and then
+        unpacked, and converted to binary CSR files if `convert` is set,
+        by that many worker processes while the next ones download; see
+        the `pipeline` module. This always extracts bundles and returns
+        the throughput of each stage.
+
+        Given a `budget` in bytes or a scheduling `policy`, only the
+        matrices that fit in the budget are downloaded, in the order set
+        by the policy, with sizes estimated as set by `estimate`; see the
+        `schedule` module. The policy defaults to "smallest", which
+        downloads the most matrices.
+        """
+        if budget is not None or policy is not None:
+            from . import schedule
+
+            plan = schedule.plan(
+                self,
+                format,
+                destpath,
+                extract or bool(processes or convert),
+                budget,
+                policy or "smallest",
+                estimate,
+            )
+            for matrix, size in plan.skipped:
+                logger.info(
+                    f"Skipping {matrix.group}/{matrix.name} "
+                    + f"({size} bytes), which is over budget"
+                )
+            return plan.matrices.download(
+                format,
+                destpath,
+                extract,
+                workers,
+                chunk_size,
+                rate_limit,
+                reporter,
+                processes,
+                convert,
+            )
+
+        if processes or convert:
+            from . import pipeline
+
+            return pipeline.download(
+                self,
+                format,
+                destpath,
+                workers,
+                processes,
+                convert,
+                chunk_size,
+                rate_limit,
+                reporter,
+            )
+
+        options = dict(chunk_size=chunk_size, rate_limit=as_bucket(rate_limit))
+        owned = reporter is None
+        if owned:
+            reporter = events.TqdmReporter("Overall progress", len(self))
+        try:
+            if workers > 1:
+                errors = self._download_concurrent(
+                    format, destpath, extract, workers, reporter, **options
+                )
+            else:
+                errors = self._download_serial(
+                    format, destpath, extract, reporter, **options
+                )
+        finally:
+            if owned:
+                reporter.close()
+
+        if errors:
+            raise DownloadError(errors)
+
+    def _download_serial(self, format, destpath, extract, reporter, **options):
+        errors = []
+        for matrix in self:
+            try:
+                matrix.download(format, destpath, extract, reporter, **options)
+            except Exception as exc:
+                logger.error(f"{matrix.group}/{matrix.name}: {exc}")
+                errors.append((matrix, exc))
+        return errors
+
+    def _download_concurrent(
+        self, format, destpath, extract, workers, reporter, **options
+    ):
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    matrix.download,
+                    format,
+                    destpath,
+                    extract,
+                    reporter,
+                    **options,
+                ): matrix
+                for matrix in self
+            }
+            for future in as_completed(futures):
+                matrix = futures[future]
+                try:
+                    future.result()
+                except Exception as exc:
+                    logger.error(f"{matrix.group}/{matrix.name}: {exc}")
+                    errors.append((matrix, exc))
+        return errors
+
+
+class MatrixList(_MatrixSequence, list):
     def __getitem__(self, expr):
         result = super().__getitem__(expr)
         return MatrixList(result) if isinstance(expr, slice) else result
 
-    def download(self, format="MM", destpath=None, extract=False):
-        with tqdm(total=len(self), desc="Overall progress") as pbar:
-            for matrix in self:
-                matrix.download(format, destpath, extract)
-                pbar.update(1)
+
+def _scalar(value):
+    # Converts NumPy scalars so that matrices print like any other
+    return value.item() if hasattr(value, "item") else value
+
+
+class MatrixArray(_MatrixSequence, collections.abc.Sequence):
+    """
+    A read-only list of matrices stored as one array per `Matrix` field,
+    in the column order of the matrix database. `Matrix` objects are only
+    created when elements are accessed, which keeps large result sets
+    compact. The columns may be lists or NumPy arrays.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds a `MatrixArray` from tuples in the layout of `MatrixDB`.
+        """
+        columns = tuple(zip(*rows))
+        return cls(columns or ((),) * len(Matrix.__slots__))
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, expr):
+        if isinstance(expr, slice):
+            return MatrixArray(column[expr] for column in self.columns)
+        return Matrix(*(_scalar(column[expr]) for column in self.columns))
+
+    def to_list(self):
+        """
+        Returns the matrices as a `MatrixList`.
+        """
+        return MatrixList(self)
+
+    def __repr__(self):
+        return "MatrixArray(%r)" % list(self)
 
 
 class Matrix:
@@ -40,6 +243,21 @@ class Matrix:
     `kind`  : The underlying problem domain
     """
 
+    __slots__ = (
+        "id",
+        "group",
+        "name",
+        "rows",
+        "cols",
+        "nnz",
+        "dtype",
+        "is2d3d",
+        "isspd",
+        "psym",
+        "nsym",
+        "kind",
+    )
+
     attr_list = [
         "Id",
         "Group",
@@ -148,21 +366,31 @@ class Matrix:
         return os.path.join(SS_DIR, format, self.group)
 
     def icon_url(self):
-        return "/".join((SS_ROOT_URL, "files", self.group, self.name + ".png"))
+        return "/".join(
+            (config.SS_SITE_URL, "files", self.group, self.name + ".png")
+        )
 
     def group_info_url(self):
-        return "/".join((SS_ROOT_URL, self.group))
+        return "/".join((config.SS_SITE_URL, self.group))
 
     def matrix_info_url(self):
-        return "/".join((SS_ROOT_URL, self.group, self.name))
+        return "/".join((config.SS_SITE_URL, self.group, self.name))
 
-    def url(self, format="MM"):
+    def urlpath(self, format="MM"):
         """
-        Returns the URL for this `Matrix` instance.
+        Returns the path of this `Matrix` instance in `format` relative to
+        the root URL, such as `MM/HB/ash85.tar.gz`.
         """
         fname = self._filename(format)
         directory = format.lower() if format == "MAT" else format
-        return "/".join((SS_ROOT_URL, directory, self.group, fname))
+        return "/".join((directory, self.group, fname))
+
+    def url(self, format="MM"):
+        """
+        Returns the URL for this `Matrix` instance, under the root URL
+        set by `config.set_root_url` at the time of the call.
+        """
+        return "/".join((config.SS_ROOT_URL, self.urlpath(format)))
 
     def localpath(self, format="MM", destpath=None, extract=False):
         destpath = destpath or self._defaultdestpath(format)
@@ -179,10 +407,27 @@ class Matrix:
 
         return localdestpath, localdest
 
-    def download(self, format="MM", destpath=None, extract=False):
+    def download(
+        self,
+        format="MM",
+        destpath=None,
+        extract=False,
+        reporter=None,
+        chunk_size=None,
+        rate_limit=None,
+    ):
         """
         Downloads this `Matrix` instance to the local machine,
         optionally unpacking any TAR.GZ files.
+
+        Interrupted transfers are resumed, files are checked against the
+        checksums recorded by the `integrity` module before being reused,
+        and concurrent downloads of the same matrix wait for each other.
+        Downloads under `SS_DIR` count towards the `cache` quota.
+
+        `chunk_size` fixes the read size, `rate_limit` caps the transfer
+        in bytes per second and `reporter` receives the events described
+        in the `events` module; by default a progress bar is shown.
         """
         # destpath is the directory containing the matrix
         # It is of the form ~/.PyUFGet/MM/HB
@@ -193,25 +438,224 @@ class Matrix:
         # containing the unzipped matrix
         localdestpath, localdest = self.localpath(format, destpath, extract)
 
-        if not os.access(localdestpath, os.F_OK):
-            # Create the destination path if necessary
-            os.makedirs(destpath, exist_ok=True)
+        cache = get_cache()
+        if not cache.manages(localdestpath):
+            cache = None
+        manifest = integrity.get_manifest()
+        if self._reusable(format, localdestpath, manifest, cache):
+            return localdestpath, localdest
+
+        # Create the destination path if necessary
+        os.makedirs(destpath, exist_ok=True)
+
+        # Only one thread or process downloads a matrix at a time; the
+        # others wait here and then find it on disk
+        with locking.matrix_lock(destpath, self.name, format):
+            if self._reusable(format, localdestpath, manifest, cache):
+                return localdestpath, localdest
+            self._discard(format, destpath, localdestpath, manifest)
+
+            owned = reporter is None
+            if owned:
+                reporter = events.TqdmReporter(self.name)
+            tracker = events.Tracker(reporter, self)
+            try:
+                self._download(
+                    format,
+                    destpath,
+                    extract,
+                    tracker,
+                    chunk_size,
+                    rate_limit,
+                    cache,
+                )
+            except BaseException as exc:
+                tracker.close(exc)
+                raise
+            else:
+                tracker.close()
+            finally:
+                if owned:
+                    reporter.close()
+
+            if cache is not None:
+                cache.add(self, format, localdestpath)
+        return localdestpath, localdest
 
-            response = requests.get(self.url(format), stream=True)
-            content_length = int(response.headers["content-length"])
+    def _reusable(self, format, localdestpath, manifest, cache):
+        # Returns True, and records the use in `cache`, if `localdestpath`
+        # is already there and intact
+        if not (
+            os.access(localdestpath, os.F_OK) and manifest.check(localdestpath)
+        ):
+            return False
+        if cache is not None:
+            cache.touch(localdestpath, self, format)
+        return True
+
+    def _discard(self, format, destpath, localdestpath, manifest):
+        # Removes what is left of an earlier download of this matrix
+        if os.access(localdestpath, os.F_OK):
+            logger.warning(
+                f"{localdestpath} is damaged or incomplete, "
+                + "downloading it again"
+            )
+            integrity.remove(localdestpath)
+        manifest.forget(localdestpath)
+        # A binary copy parsed from an earlier download may differ
+        integrity.remove(self.binarypath(format, destpath))
 
-            with open(localdest, "wb") as outfile, tqdm(
-                total=content_length, desc=self.name, unit="B"
-            ) as pbar:
-                for chunk in response.iter_content(chunk_size=4096):
-                    outfile.write(chunk)
-                    pbar.update(4096)
-                    time.sleep(0.1)
+    def _download(
+        self, format, destpath, extract, tracker, chunk_size, rate_limit, cache
+    ):
+        from . import bundle
 
-            if extract and (format == "MM" or format == "RB"):
-                bundle.extract(localdest)
+        localdestpath, localdest = self.localpath(format, destpath, extract)
+        remotes = []
+
+        def opened(remote):
+            tracker.enter("transfer")
+            remotes.append(remote)
+            # Make room for the download before any of it is written
+            if cache is not None:
+                cache.reserve(remote.total or 0, keep=localdestpath)
+
+        manifest = integrity.get_manifest()
+        streaming = extract and (format == "MM" or format == "RB")
+        if streaming and not manifest.check(localdest):
+            # A bundle left by an earlier download has been damaged
+            integrity.remove(localdest)
+            manifest.forget(localdest)
+        if not (streaming and os.access(localdest, os.F_OK)):
+            tracker.enter("connect")
+            if streaming:
+                # Unpack the bundle as it arrives instead of saving it
+                with transfer.RemoteFile(
+                    self.url(format), 0, rate_limit, tracker
+                ) as remote:
+                    opened(remote)
+                    files = bundle.extract_stream(
+                        remote, destpath, chunk_size or bundle.BUFSIZE
+                    )
+                    received = remote.offset
+            else:
+                digest = integrity.new_hash()
+                received = transfer.download(
+                    self.url(format),
+                    localdest,
+                    chunk_size,
+                    rate_limit,
+                    tracker,
+                    on_open=opened,
+                    digest=digest,
+                )
+                files = [(localdest, digest)]
+
+            tracker.enter("verify")
+            expected = remotes[0].total
+            if expected is not None and received != expected:
+                raise transfer.IncompleteDownload(
+                    f"Received {received} of {expected} bytes "
+                    + f"from {self.url(format)}"
+                )
+
+        if streaming and os.access(localdest, os.F_OK):
+            # The bundle was downloaded earlier without extract
+            tracker.enter("extract")
+            files = bundle.extract(localdest)
+            manifest.forget(localdest)
+
+        for path, digest in files:
+            manifest.record(path, digest, localdestpath)
+
+    def binarypath(self, format="MM", destpath=None):
+        """
+        Returns the path of the binary CSR copy of this `Matrix` that
+        `load` keeps next to the file downloaded in `format`.
+        """
+        destpath = destpath or self._defaultdestpath(format)
+        return os.path.join(destpath, self.name + ".csr")
 
-        return localdestpath, localdest
+    async def download_async(
+        self,
+        format="MM",
+        destpath=None,
+        extract=False,
+        session=None,
+        rate_limit=None,
+        reporter=None,
+    ):
+        """
+        Coroutine version of `download` that does not block the event
+        loop. See `ssgetpy.aio.download` for the details.
+        """
+        from . import aio
+
+        return await aio.download(
+            self, format, destpath, extract, session, rate_limit, reporter
+        )
+
+    def _parse(self, format, destpath, sparse):
+        # Parses the downloaded file without unpacking TAR.GZ bundles
+        from . import readers
+
+        if format == "MAT":
+            _, localdest = self.download(format, destpath)
+            return readers.read_mat(localdest, sparse)
+
+        read = readers.read_mm if format == "MM" else readers.read_rb
+        filename = self.name + (".mtx" if format == "MM" else ".rb")
+        extracted, _ = self.localpath(format, destpath, extract=True)
+        if os.access(extracted, os.F_OK):
+            with open(os.path.join(extracted, filename), "rb") as f:
+                return read(f, sparse)
+        _, localdest = self.download(format, destpath)
+        with readers.open_member(localdest, filename) as f:
+            return read(f, sparse)
+
+    def load(self, format="MM", destpath=None, sparse="csr", binary=True):
+        """
+        Returns this `Matrix` as a SciPy sparse matrix in the `sparse`
+        format ("csr", "csc" or "coo"), downloading it in `format` first
+        if needed. Every format gives the same result.
+
+        The `.mtx` or `.rb` file is parsed straight out of the TAR.GZ
+        bundle without extracting it, unless an extracted copy already
+        exists. With `binary`, the parsed matrix is also saved in a
+        binary CSR layout at `binarypath()`, and later loads memory-map
+        that file instead of parsing it again. Requires NumPy and SciPy.
+        """
+        from . import readers
+
+        self._filename(format)  # Validates format
+        binarypath = self.binarypath(format, destpath)
+        cache = get_cache()
+        cached = cache.manages(binarypath)
+        if binary and os.access(binarypath, os.F_OK):
+            if cached:
+                cache.touch(binarypath, self, format)
+            return readers.read_binary(binarypath, sparse)
+
+        matrix = self._parse(format, destpath, "csr" if binary else sparse)
+        if not binary:
+            return matrix
+
+        readers.write_binary(binarypath, matrix)
+        if cached:
+            cache.add(self, format, binarypath)
+        return readers.read_binary(binarypath, sparse)
+
+    def problem(self, destpath=None, sparse="csr"):
+        """
+        Downloads this `Matrix` in the MAT format if needed and returns
+        its SuiteSparse `Problem` struct as a `readers.Problem`, whose
+        fields, including any auxiliary data in `aux`, are read when
+        first accessed. Requires NumPy and SciPy.
+        """
+        from . import readers
+
+        _, localdest = self.download("MAT", destpath)
+        return readers.Problem(localdest, sparse)
 
     def __str__(self):
         return str(self.to_tuple())
@@ -0,0 +1,332 @@
+"""
+The `mirror` module copies part of the SuiteSparse Matrix Collection into
+a directory laid out like the collection's web site, and serves that
+directory over HTTP, so that the machines of a cluster can download
+matrices from a server on their own network:
+
+    ssget mirror /srv/suitesparse -g HB -f MM -f MAT
+    ssget serve /srv/suitesparse --port 8080
+
+and then, on each machine,
+
+    SSGETPY_ROOT_URL=http://mirror-host:8080 ssget -g HB
+
+or `ssgetpy.set_root_url("http://mirror-host:8080")` from Python.
+
+The mirror always holds the whole index, since matrix IDs are row numbers
+in it, so matrices that were not mirrored are still found by `search`
+but fail to download. Running `ssget mirror` again only downloads the
+files that are missing.
+"""
+
+import argparse
+import http.server
+import logging
+import os
+import re
+import socketserver
+import sys
+
+from . import config, events, query, transfer
+from .matrix import DownloadError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("MM", "MAT", "RB")
+PORT = 8000
+
+
+def index_path(directory):
+    """
+    Returns the path of the index in the mirror `directory`.
+    """
+    return os.path.join(directory, "files", "ssstats.csv")
+
+
+def matrix_path(directory, matrix, format="MM"):
+    """
+    Returns the path of `matrix` in `format` in the mirror `directory`.
+    """
+    return os.path.join(directory, *matrix.urlpath(format).split("/"))
+
+
+def sync(
+    directory,
+    matrices,
+    formats=("MM",),
+    workers=4,
+    rate_limit=None,
+    reporter=None,
+):
+    """
+    Copies the index and `matrices`, in each of `formats`, from the root
+    URL into the mirror `directory`, skipping the files already there.
+    Up to `workers` files are downloaded at a time, at no more than
+    `rate_limit` bytes per second in total. `reporter` receives the
+    events of every download as described in the `events` module.
+
+    Raises `DownloadError` once every file has been attempted if any of
+    them failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    for format in formats:
+        if format not in FORMATS:
+            raise ValueError("Format must be 'MM', 'MAT' or 'RB'")
+
+    index = index_path(directory)
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    logger.info(f"Copying the index from {config.SS_INDEX_URL}")
+    # A partial copy of an older index cannot be resumed
+    if os.path.exists(index + transfer.PART_SUFFIX):
+        os.unlink(index + transfer.PART_SUFFIX)
+    transfer.download(config.SS_INDEX_URL, index)
+
+    jobs = [(matrix, format) for format in formats for matrix in matrices]
+    bucket = transfer.as_bucket(rate_limit)
+    owned = reporter is None
+    if owned:
+        reporter = events.TqdmReporter("Mirroring", len(jobs))
+    errors = []
+    try:
+        with ThreadPoolExecutor(max(workers, 1)) as executor:
+            futures = {
+                executor.submit(
+                    matrix.download,
+                    format,
+                    os.path.dirname(matrix_path(directory, matrix, format)),
+                    False,
+                    reporter,
+                    rate_limit=bucket,
+                ): matrix
+                for matrix, format in jobs
+            }
+            for future in as_completed(futures):
+                matrix = futures[future]
+                try:
+                    future.result()
+                except Exception as exc:
+                    logger.error(f"{matrix.group}/{matrix.name}: {exc}")
+                    errors.append((matrix, exc))
+    finally:
+        if owned:
+            reporter.close()
+    if errors:
+        raise DownloadError(errors)
+
+
+class MirrorRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the files of a mirror, answering the `Range: bytes=N-` requests
+    with which `ssgetpy` resumes interrupted downloads. Files are served
+    from `root`, which `make_server` sets on a subclass.
+    """
+
+    root = os.curdir
+
+    def translate_path(self, path):
+        # Maps the URL into `root` instead of the working directory
+        path = os.path.relpath(super().translate_path(path), os.getcwd())
+        return os.path.join(os.path.abspath(self.root), path)
+
+    def send_head(self):
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        f = open(path, "rb")
+        stat = os.fstat(f.fileno())
+        start = int(match.group(1))
+        if start >= stat.st_size:
+            f.close()
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{stat.st_size}")
+            self.end_headers()
+            return None
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header(
+            "Content-Range", f"bytes {start}-{stat.st_size - 1}/{stat.st_size}"
+        )
+        self.send_header("Content-Length", str(stat.st_size - start))
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        return f
+
+    def end_headers(self):
+        if self.command in ("GET", "HEAD"):
+            self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def make_server(directory, port=PORT, bind=""):
+    """
+    Returns an HTTP server for the mirror `directory` listening on `port`
+    of the address `bind` (all addresses by default). Call its
+    `serve_forever` method to start serving.
+    """
+    handler = type(
+        "MirrorRequestHandler", (MirrorRequestHandler,), {"root": directory}
+    )
+    return _Server((bind, port), handler)
+
+
+def serve(directory, port=PORT, bind=""):
+    """
+    Serves the mirror `directory` over HTTP until interrupted.
+    """
+    with make_server(directory, port, bind) as server:
+        host, port = server.server_address[:2]
+        logger.info(f"Serving {directory} at http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _add_logging(parser):
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Enable debug diagnostics.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        dest="quiet",
+        default=False,
+        help="Do not print any messages to the console.",
+    )
+
+
+def cli(argv=sys.argv[1:]):
+    """
+    Runs `ssget mirror` and `ssget serve`.
+    """
+    parser = argparse.ArgumentParser(prog="ssget")
+    commands = parser.add_subparsers(dest="command")
+
+    mp = commands.add_parser(
+        "mirror",
+        help="Copy matrices into a mirror directory.",
+        description="Copy the index and the selected matrices into a "
+        + "directory laid out like the SuiteSparse Matrix Collection, "
+        + "skipping the files already there. Every matching matrix is "
+        + "copied unless a limit is given.",
+    )
+    mp.add_argument("directory", help="The directory of the mirror.")
+    query._add_filters(mp, limit=None)
+    mp.add_argument(
+        "-f",
+        "--format",
+        action="append",
+        choices=FORMATS,
+        dest="formats",
+        help="A format to mirror the matrices in; may be repeated. \
+              Defaults to 'MM'.",
+    )
+    mp.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=4,
+        dest="workers",
+        help="The number of files to download concurrently.",
+    )
+    mp.add_argument(
+        "--rate-limit",
+        action="store",
+        type=query._size,
+        dest="rate_limit",
+        help="Cap the combined download rate to this many bytes per second. \
+              Accepts suffixes such as 500K or 10M.",
+    )
+    query._add_root_url(mp)
+    mp.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dry_run",
+        default=False,
+        help="Only print the matrices that would be mirrored.",
+    )
+    _add_logging(mp)
+
+    sp = commands.add_parser(
+        "serve",
+        help="Serve a mirror directory over HTTP.",
+        description="Serve a directory made by 'ssget mirror' over HTTP. "
+        + "Point ssgetpy at it with --root-url or SSGETPY_ROOT_URL.",
+    )
+    sp.add_argument("directory", help="The directory of the mirror.")
+    sp.add_argument(
+        "--port",
+        action="store",
+        type=int,
+        default=PORT,
+        dest="port",
+        help=f"The port to listen on. Defaults to {PORT}.",
+    )
+    sp.add_argument(
+        "--bind",
+        action="store",
+        type=str,
+        default="",
+        dest="bind",
+        help="The address to listen on. Defaults to all addresses.",
+    )
+    _add_logging(sp)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("a command, 'mirror' or 'serve', is required")
+    if args.quiet:
+        pass
+    elif args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    if args.command == "serve":
+        serve(args.directory, args.port, args.bind)
+        return
+
+    from .schedule import estimate_size
+
+    if args.root_url:
+        config.set_root_url(args.root_url)
+    formats = args.formats or ["MM"]
+    name_or_id, optdict = query._filters(args)
+    matrices = query.search(name_or_id, **optdict)
+    logger.info(
+        f"Mirroring {len(matrices)} matrices in {', '.join(formats)}, about "
+        + "%d bytes"
+        % sum(estimate_size(m, f) for m in matrices for f in formats)
+    )
+    if args.dry_run:
+        for matrix in matrices:
+            logger.info(f"{matrix.group}/{matrix.name}")
+        return
+    try:
+        sync(
+            args.directory,
+            matrices,
+            formats,
+            args.workers,
+            args.rate_limit,
+        )
+    except DownloadError as exc:
+        logger.error(str(exc))
+        return 1
@@ -0,0 +1,119 @@
+"""
+The `net` module owns the HTTP session shared by all network I/O in
+`ssgetpy`, so that requests to the SuiteSparse web site reuse pooled
+keep-alive connections.
+
+Every request made through `get` has connect and read timeouts, and
+requests that fail to connect, are reset or return a 5xx status are
+retried with exponential backoff. Interrupted response bodies are
+resumed separately by `transfer.RemoteFile`.
+
+`set_session` replaces the shared session, and `mount` installs a
+transport adapter for a URL prefix on it, e.g. to send requests to a
+local stand-in server in tests.
+"""
+
+import threading
+
+# Seconds to wait for a connection and between bytes of a response
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+# Requests are retried this many times, waiting BACKOFF, 2 * BACKOFF,
+# 4 * BACKOFF, ... seconds in between
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Connections kept open per host; concurrent downloads use one each
+POOL_SIZE = 16
+
+_session = None
+_lock = threading.Lock()
+
+
+def _retry(retries, backoff):
+    from urllib3.util.retry import Retry
+
+    options = dict(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        # Hand the last response to `raise_for_status` instead
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=frozenset(("GET", "HEAD")), **options)
+    except TypeError:  # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(("GET", "HEAD")), **options)
+
+
+def create_session(retries=None, backoff=None, pool_size=None):
+    """
+    Returns a new `requests.Session` that pools up to `pool_size`
+    connections per host and retries failed requests `retries` times
+    with exponential backoff. The defaults are the module constants.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    retries = RETRIES if retries is None else retries
+    backoff = BACKOFF if backoff is None else backoff
+    pool_size = pool_size or POOL_SIZE
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=_retry(retries, backoff),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns the shared session, creating it on first use.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def set_session(session):
+    """
+    Makes `session`, which may be any object with a `requests`-style
+    `get` method, the shared session and returns the previous one.
+    Passing `None` reverts to a default session on next use.
+    """
+    global _session
+    with _lock:
+        previous, _session = _session, session
+    return previous
+
+
+def mount(prefix, adapter):
+    """
+    Sends requests for URLs starting with `prefix` through the
+    `requests` transport adapter `adapter`.
+    """
+    get_session().mount(prefix, adapter)
+
+
+def get(url, **kwargs):
+    """
+    Makes a GET request with the shared session. `timeout` defaults to
+    `(CONNECT_TIMEOUT, READ_TIMEOUT)`.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    """
+    Makes a HEAD request with the shared session, like `get`.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().head(url, **kwargs)
@@ -0,0 +1,336 @@
+"""
+The `pipeline` module downloads matrices in two overlapping stages, so
+that the network and the CPUs are kept busy at the same time:
+
+* network threads save each TAR.GZ bundle or MAT file to disk, and
+* worker processes then unpack each bundle and, optionally, convert the
+  matrix to the binary CSR layout used by `Matrix.load`.
+
+Decompression holds the GIL, so unpacking bundles as they stream in, as
+`Matrix.download` does, leaves the network idle while it runs. Here the
+stages are connected by a bounded queue: once it is full, the network
+threads wait for the worker processes to catch up instead of filling the
+disk with bundles.
+
+`download` is used by `MatrixList.download` and `ssgetpy.fetch` when they
+are given `processes`. The throughput of each stage is logged at the end.
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from . import events, integrity, locking
+from .cache import get_cache
+from .matrix import DownloadError
+from .transfer import as_bucket
+
+logger = logging.getLogger(__name__)
+
+# Bundles that may wait for a worker process, per process
+QUEUE_DEPTH = 2
+
+
+class StageStats:
+    """
+    Counts the matrices and bytes handled by one stage of the pipeline,
+    the time spent on them (`busy`) and the wall-clock time from the
+    start of the first to the end of the last (`elapsed`).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.nbytes = 0
+        self.busy = 0.0
+        self.first = self.last = None
+        self.lock = threading.Lock()
+
+    def add(self, start, end, nbytes):
+        with self.lock:
+            self.items += 1
+            self.nbytes += nbytes
+            self.busy += end - start
+            self.first = (
+                start if self.first is None else min(self.first, start)
+            )
+            self.last = end if self.last is None else max(self.last, end)
+
+    @property
+    def elapsed(self):
+        return 0.0 if self.first is None else self.last - self.first
+
+    @property
+    def throughput(self):
+        """Bytes per second over the elapsed time of the stage."""
+        return self.nbytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.items} matrices, {self.nbytes} bytes "
+            + f"in {self.elapsed:.2f}s ({self.throughput / 1e6:.2f} MB/s, "
+            + f"{self.busy:.2f}s busy)"
+        )
+
+
+def _extract(localdest):
+    # Runs in a worker process; returns the size of the bundle and the
+    # checksums of the files unpacked
+    from . import bundle
+
+    nbytes = os.path.getsize(localdest)
+    files = bundle.extract(localdest)
+    return nbytes, [(path, digest.hexdigest()) for path, digest in files]
+
+
+def _convert(format, source, filename, binarypath):
+    # Runs in a worker process; returns the size of the parsed file
+    from . import readers
+
+    if format == "MAT":
+        nbytes = os.path.getsize(source)
+        matrix = readers.read_mat(source, "csr")
+    else:
+        source = os.path.join(source, filename)
+        nbytes = os.path.getsize(source)
+        read = readers.read_mm if format == "MM" else readers.read_rb
+        with open(source, "rb") as f:
+            matrix = read(f, "csr")
+    readers.write_binary(binarypath, matrix)
+    return nbytes
+
+
+def _remove_damaged(*paths):
+    # Removes the files in `paths` that no longer match the manifest
+    manifest = integrity.get_manifest()
+    for path in set(paths):
+        if os.access(path, os.F_OK) and not manifest.check(path):
+            logger.warning(f"{path} is damaged, downloading it again")
+            integrity.remove(path)
+            manifest.forget(path)
+
+
+class _Pipeline:
+    def __init__(
+        self, format, destpath, convert, reporter, chunk_size, rate_limit
+    ):
+        self.format = format
+        self.destpath = destpath
+        self.convert = convert
+        self.reporter = reporter
+        self.options = (chunk_size, as_bucket(rate_limit))
+        self.cache = get_cache()
+        self.stats = [
+            StageStats("download"),
+            StageStats("extract"),
+            StageStats("convert"),
+        ]
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _failed(self, matrix, exc):
+        logger.error(f"{matrix.group}/{matrix.name}: {exc}")
+        with self.lock:
+            self.errors.append((matrix, exc))
+
+    def paths(self, matrix):
+        destpath = self.destpath or matrix._defaultdestpath(self.format)
+        extracted, localdest = matrix.localpath(self.format, destpath, True)
+        return destpath, extracted, localdest
+
+    def fetch(self, matrix, work):
+        """
+        Downloads `matrix` unless it is already on disk and queues it for
+        the worker processes if it needs unpacking or converting. The lock
+        on the matrix is held until the worker processes are done with it.
+        """
+        lock = None
+        queued = False
+        try:
+            destpath = self.paths(matrix)[0]
+            os.makedirs(destpath, exist_ok=True)
+            lock = locking.matrix_lock(destpath, matrix.name, self.format)
+            lock.acquire()
+            queued = self._fetch(matrix, work, lock)
+        except Exception as exc:
+            self._failed(matrix, exc)
+        finally:
+            if lock is not None and lock.locked and not queued:
+                lock.release()
+
+    def _fetch(self, matrix, work, lock):
+        # Returns True once `matrix` is queued
+        destpath, extracted, localdest = self.paths(matrix)
+        binarypath = matrix.binarypath(self.format, destpath)
+        _remove_damaged(extracted, localdest)
+        missing = not os.access(extracted, os.F_OK)
+        if missing:
+            # A binary copy parsed from an earlier download may differ
+            integrity.remove(binarypath)
+        extract = self.format != "MAT" and missing
+        convert = self.convert and not os.access(binarypath, os.F_OK)
+        if not (missing or convert):
+            if self.cache.manages(extracted):
+                self.cache.touch(extracted, matrix, self.format)
+            return False
+
+        tracker = events.Tracker(self.reporter, matrix)
+        try:
+            if not os.access(localdest if extract else extracted, os.F_OK):
+                cache = self.cache if self.cache.manages(extracted) else None
+                start = time.monotonic()
+                matrix._download(
+                    self.format,
+                    destpath,
+                    False,
+                    tracker,
+                    *self.options,
+                    cache,
+                )
+                self.stats[0].add(
+                    start, time.monotonic(), os.path.getsize(localdest)
+                )
+            tracker.end_phase()
+            if not (extract or convert):
+                # A MAT file needs no more work
+                tracker.close()
+                if self.cache.manages(extracted):
+                    self.cache.add(matrix, self.format, extracted)
+                return False
+            # Blocks while the worker processes are behind
+            work.put((matrix, tracker, extract, convert, lock))
+            return True
+        except BaseException as exc:
+            tracker.close(exc)
+            self._failed(matrix, exc)
+            return False
+
+    def process(self, pool, work):
+        """
+        Hands queued matrices to `pool` one at a time until it receives
+        `None`.
+        """
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            matrix, tracker, extract, convert, lock = item
+            try:
+                self._process(pool, matrix, tracker, extract, convert)
+            finally:
+                lock.release()
+
+    def _process(self, pool, matrix, tracker, extract, convert):
+        # Unpacks and converts `matrix` in `pool`
+        try:
+            destpath, extracted, localdest = self.paths(matrix)
+            binarypath = matrix.binarypath(self.format, destpath)
+            filename = matrix.name + (".rb" if self.format == "RB" else ".mtx")
+            if extract:
+                tracker.enter("extract")
+                start = time.monotonic()
+                nbytes, files = pool.submit(_extract, localdest).result()
+                self.stats[1].add(start, time.monotonic(), nbytes)
+                manifest = integrity.get_manifest()
+                manifest.forget(localdest)
+                for path, digest in files:
+                    manifest.record(path, digest, extracted)
+            if convert:
+                tracker.enter("convert")
+                start = time.monotonic()
+                nbytes = pool.submit(
+                    _convert, self.format, extracted, filename, binarypath
+                ).result()
+                self.stats[2].add(start, time.monotonic(), nbytes)
+        except BaseException as exc:
+            tracker.close(exc)
+            self._failed(matrix, exc)
+            return
+        tracker.close()
+        if self.cache.manages(extracted):
+            self.cache.add(matrix, self.format, extracted)
+            if convert:
+                self.cache.add(matrix, self.format, binarypath)
+
+
+def _process_pool(processes):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if sys.version_info >= (3, 7):
+        # Forking while the network threads run could copy held locks
+        return ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn")
+        )
+    # Python 3.6 cannot choose how the workers start, so start them all
+    # now, before there are any network threads to copy
+    pool = ProcessPoolExecutor(processes)
+    pool.submit(int).result()
+    return pool
+
+
+def download(
+    matrices,
+    format="MM",
+    destpath=None,
+    workers=1,
+    processes=None,
+    convert=False,
+    chunk_size=None,
+    rate_limit=None,
+    reporter=None,
+    queue_depth=QUEUE_DEPTH,
+):
+    """
+    Downloads and unpacks `matrices` with `workers` network threads and
+    `processes` worker processes (by default, one per CPU), converting
+    them to binary CSR files as well if `convert` is set, which requires
+    NumPy and SciPy. Up to `queue_depth` bundles per process wait to be
+    unpacked before the downloads pause.
+
+    `chunk_size`, `rate_limit` and `reporter` are as in
+    `MatrixList.download`; the reporter also receives the `extract` and
+    `convert` phases. Returns the `StageStats` of the download, extract
+    and convert stages, and raises `DownloadError` once every matrix has
+    been attempted if any of them failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    processes = processes or os.cpu_count() or 1
+    owned = reporter is None
+    if owned:
+        reporter = events.TqdmReporter("Overall progress", len(matrices))
+    pipeline = _Pipeline(
+        format, destpath, convert, reporter, chunk_size, rate_limit
+    )
+    work = queue.Queue(maxsize=max(processes * queue_depth, 1))
+    try:
+        with _process_pool(processes) as pool:
+            feeders = [
+                threading.Thread(target=pipeline.process, args=(pool, work))
+                for _ in range(processes)
+            ]
+            for feeder in feeders:
+                feeder.start()
+            try:
+                with ThreadPoolExecutor(max(workers, 1)) as network:
+                    for matrix in matrices:
+                        network.submit(pipeline.fetch, matrix, work)
+            finally:
+                for feeder in feeders:
+                    work.put(None)
+                for feeder in feeders:
+                    feeder.join()
+    finally:
+        if owned:
+            reporter.close()
+
+    for stage in pipeline.stats:
+        if stage.items:
+            logger.info(str(stage))
+    if pipeline.errors:
+        raise DownloadError(pipeline.errors)
+    return pipeline.stats
@@ -1,19 +1,17 @@
 import argparse
 import logging
 import sys
+import time
 
-from .config import SS_DIR
-from .dbinstance import instance
+from . import dbinstance, events, integrity
+from .cache import get_cache
+from .config import SS_DIR, SS_ROOT_URL, parse_size, set_root_url
+from .matrix import DownloadError
 
 logger = logging.getLogger(__name__)
 
 
-def search(name_or_id=None, **kwargs):
-    """
-    Search for matrix/matrices with a given name pattern or numeric ID.
-    Optionally, limit search to matrices of a specific data type or
-    with the specified range of rows, columns and non-zero values.
-    """
+def _criteria(name_or_id, kwargs):
     logger.debug("Name or ID = " + str(name_or_id))
     if name_or_id is not None:
         if isinstance(name_or_id, str):
@@ -30,14 +28,78 @@ def search(name_or_id=None, **kwargs):
             raise ValueError(
                 "First argument to search " + "must be a string or an integer"
             )
+    return kwargs
+
+
+def search(name_or_id=None, **kwargs):
+    """
+    Search for matrix/matrices with a given name pattern or numeric ID.
+    Optionally, limit search to matrices of a specific data type or
+    with the specified range of rows, columns and non-zero values.
+    """
+    return dbinstance.get_instance().search(**_criteria(name_or_id, kwargs))
 
-    return instance.search(**kwargs)
+
+def search_iter(name_or_id=None, **kwargs):
+    """
+    Like `search`, but yields the matching matrices one at a time as
+    they are read from the index, and returns every match unless a
+    `limit` is given.
+    """
+    return dbinstance.get_instance().search_iter(
+        **_criteria(name_or_id, kwargs)
+    )
 
 
 def fetch(
-    name_or_id=None, format="MM", location=None, dry_run=False, **kwargs
+    name_or_id=None,
+    format="MM",
+    location=None,
+    dry_run=False,
+    workers=1,
+    rate_limit=None,
+    reporter=None,
+    processes=0,
+    convert=False,
+    budget=None,
+    policy=None,
+    estimate="nnz",
+    **kwargs,
 ):
+    """
+    Search for matrices like `search` and download them to `location`,
+    extracting any TAR.GZ bundles. If `workers` is greater than one,
+    up to that many matrices are downloaded concurrently. `rate_limit`
+    caps the combined download rate in bytes per second. `reporter`
+    receives the events of each download (see `ssgetpy.events`) in
+    place of the default progress bar. With `processes`, bundles are
+    unpacked by that many worker processes while the next ones download,
+    and with `convert` they are also converted to binary CSR files; see
+    `ssgetpy.pipeline`.
+
+    Given a `budget` in bytes or a scheduling `policy` ("smallest",
+    "largest", "round-robin" or "index"), only the matrices that fit in
+    the budget are downloaded, in the order set by the policy, with
+    sizes estimated from the index or, if `estimate` is "head", asked of
+    the server. The schedule is logged, also in a `dry_run`, and only
+    the scheduled matrices are returned. See `ssgetpy.schedule`.
+    """
     matrices = search(name_or_id, **kwargs)
+    if budget is not None or policy is not None:
+        from . import schedule
+
+        plan = schedule.plan(
+            matrices,
+            format,
+            location,
+            True,
+            budget,
+            policy or "smallest",
+            estimate,
+        )
+        for line in str(plan).split("\n"):
+            logger.info(line)
+        matrices = plan.matrices
     if len(matrices) > 0:
         logger.info(
             "Found %d %s"
@@ -52,14 +114,63 @@ def fetch(
                     matrix.localpath(format, location, extract=True)[0],
                 )
             )
-            if not dry_run:
-                matrix.download(format, location, extract=True)
+        if not dry_run:
+            matrices.download(
+                format,
+                location,
+                extract=True,
+                workers=workers,
+                rate_limit=rate_limit,
+                reporter=reporter,
+                processes=processes,
+                convert=convert,
+            )
     return matrices
 
 
-def cli(argv=sys.argv[1:]):
-    parser = argparse.ArgumentParser(prog="ssget")
+def _size(value):
+    try:
+        return parse_size(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+
+
+def _address(value):
+    host, _, port = value.rpartition(":")
+    try:
+        return host or "localhost", int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid address: {value}")
+
 
+def _print_cache(cache):
+    entries = cache.entries()
+    for entry in reversed(entries):
+        print(
+            "%s %12d  %s/%s (%s)%s"
+            % (
+                time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(entry.last_access)
+                ),
+                entry.size,
+                entry.group,
+                entry.name,
+                entry.format,
+                " [pinned]" if entry.pinned else "",
+            )
+        )
+    print(
+        "%d matrices, %d bytes used, quota %s"
+        % (
+            len(entries),
+            sum(entry.size for entry in entries),
+            "unlimited" if cache.quota is None else "%d bytes" % cache.quota,
+        )
+    )
+
+
+def _add_filters(parser, limit=10):
+    # Adds the search criteria shared by the commands
     parser.add_argument(
         "-i",
         "--id",
@@ -84,6 +195,15 @@ def cli(argv=sys.argv[1:]):
         dest="name",
         help="The name or a pattern matching the name of the matrix/matrices.",
     )
+    parser.add_argument(
+        "-t",
+        "--text",
+        action="store",
+        type=str,
+        dest="text",
+        help="Words that start words in the name, group or kind of the \
+              matrix/matrices, e.g. 'circuit sim'. Best matches come first.",
+    )
     parser.add_argument(
         "-d",
         "--data-type",
@@ -93,45 +213,22 @@ def cli(argv=sys.argv[1:]):
         help="The element type of the matrix/matrices"
         ", can be one of 'real', 'complex' or 'binary'.",
     )
-    parser.add_argument(
-        "-f",
-        "--format",
-        action="store",
-        type=str,
-        dest="format",
-        default="MM",
-        help="The format in which to download the matrix/matrices.\
-              Can be one of 'MM', 'MAT' or 'RB' for MatrixMarket, \
-              MATLAB or Rutherford-Boeing formats respectively.",
-    )
     parser.add_argument(
         "-l",
         "--limit",
         action="store",
         type=int,
-        default=10,
+        default=limit,
         dest="limit",
         help="The maximum number of matrices to be downloaded.",
     )
     parser.add_argument(
-        "-o",
-        "--outdir",
+        "--order-by",
         action="store",
         type=str,
-        dest="location",
-        help="The directory in the local machine where matrices will be \
-              downloaded to. Defaults to "
-        + SS_DIR,
+        dest="order_by",
+        help="Order the matrices by these columns, e.g. 'nnz desc, rows'.",
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        dest="dry_run",
-        default=False,
-        help="If True, only print the matrices that will be downloaded \
-              but do not actually download them.",
-    )
-
     g = parser.add_argument_group(
         "Size and Non-zero filters",
         "These options may be used to restrict the shape or number "
@@ -181,6 +278,213 @@ def cli(argv=sys.argv[1:]):
         help="The maximum number of non-zero values in the matrix/matrices.",
     )
 
+
+def _filters(args):
+    # Returns the name or ID and search criteria given on the command line
+    optdict = dict(
+        matid=args.matid,
+        group=args.group,
+        name=args.name,
+        rowbounds=(args.min_rows, args.max_rows),
+        colbounds=(args.min_cols, args.max_cols),
+        nzbounds=(args.min_nnzs, args.max_nnzs),
+        dtype=args.dtype,  # isspd     = args.isspd,\
+        text=args.text,
+        order_by=args.order_by,
+        limit=args.limit,
+    )
+
+    name_or_id = None
+    if args.matid:
+        name_or_id = args.matid
+    elif args.name:
+        name_or_id = args.matid
+
+    return name_or_id, optdict
+
+
+def _add_root_url(parser):
+    parser.add_argument(
+        "--root-url",
+        action="store",
+        type=str,
+        dest="root_url",
+        help="Download the index and matrices from this URL, such as a \
+              mirror made with 'ssget mirror', instead of " + SS_ROOT_URL,
+    )
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="ssget",
+        epilog="Run 'ssget mirror -h' and 'ssget serve -h' to copy matrices "
+        + "into a local mirror and serve it.",
+    )
+    _add_filters(parser)
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        type=str,
+        dest="format",
+        default="MM",
+        help="The format in which to download the matrix/matrices.\
+              Can be one of 'MM', 'MAT' or 'RB' for MatrixMarket, \
+              MATLAB or Rutherford-Boeing formats respectively.",
+    )
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        action="store",
+        type=str,
+        dest="location",
+        help="The directory in the local machine where matrices will be \
+              downloaded to. Defaults to " + SS_DIR,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        dest="workers",
+        help="The number of matrices to download concurrently.",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        action="store",
+        type=int,
+        default=0,
+        dest="processes",
+        help="Unpack bundles in this many worker processes while the next \
+              matrices download.",
+    )
+    parser.add_argument(
+        "--convert",
+        action="store_true",
+        dest="convert",
+        default=False,
+        help="Also convert the matrices to binary CSR files for \
+              Matrix.load. Requires NumPy and SciPy.",
+    )
+    parser.add_argument(
+        "--budget",
+        action="store",
+        type=_size,
+        dest="budget",
+        help="Only download as many matrices as fit in this many bytes, \
+              e.g. 20G.",
+    )
+    parser.add_argument(
+        "--policy",
+        action="store",
+        choices=("smallest", "largest", "round-robin", "index"),
+        dest="policy",
+        help="The order in which to download matrices within the budget. \
+              Defaults to 'smallest', which downloads the most matrices.",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store",
+        choices=("nnz", "head"),
+        default="nnz",
+        dest="estimate",
+        help="Estimate download sizes from the number of non-zeros in the \
+              index (the default), or ask the server with HEAD requests.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="store",
+        type=_size,
+        dest="rate_limit",
+        help="Cap the combined download rate to this many bytes per second. \
+              Accepts suffixes such as 500K or 10M.",
+    )
+    parser.add_argument(
+        "--events",
+        action="store",
+        type=str,
+        dest="events",
+        help="Append the timing and byte counts of each download phase \
+              to this file as JSON lines.",
+    )
+    parser.add_argument(
+        "--statsd",
+        action="store",
+        type=_address,
+        dest="statsd",
+        help="Send download metrics to the StatsD server at HOST:PORT.",
+    )
+    _add_root_url(parser)
+    parser.add_argument(
+        "--refresh-index",
+        action="store_true",
+        dest="refresh_index",
+        default=False,
+        help="Update the local index of matrices from the SuiteSparse \
+              Matrix Collection and exit.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dry_run",
+        default=False,
+        help="If True, only print the matrices that will be downloaded \
+              but do not actually download them.",
+    )
+
+    cg = parser.add_argument_group(
+        "Cache options",
+        "Matrices downloaded to the default location are kept in a cache "
+        + "that evicts the least recently used ones once it grows beyond "
+        + "its quota (set by the SSGETPY_CACHE_QUOTA environment variable).",
+    )
+    cg.add_argument(
+        "--cache-quota",
+        action="store",
+        type=_size,
+        dest="cache_quota",
+        help="The most bytes the cache may use, e.g. 20G.",
+    )
+    cg.add_argument(
+        "--cache-info",
+        action="store_true",
+        dest="cache_info",
+        default=False,
+        help="List the cached matrices and exit.",
+    )
+    cg.add_argument(
+        "--trim-cache",
+        action="store_true",
+        dest="trim_cache",
+        default=False,
+        help="Evict matrices until the cache fits its quota and exit.",
+    )
+    cg.add_argument(
+        "--verify",
+        action="store_true",
+        dest="verify",
+        default=False,
+        help="Check every downloaded file against its checksum, delete \
+              damaged matrices so that they are downloaded again and exit.",
+    )
+    cg.add_argument(
+        "--pin",
+        action="store_true",
+        dest="pin",
+        default=False,
+        help="Protect the selected matrices from eviction and exit.",
+    )
+    cg.add_argument(
+        "--unpin",
+        action="store_true",
+        dest="unpin",
+        default=False,
+        help="Allow the selected matrices to be evicted again and exit.",
+    )
+
     lg = parser.add_argument_group(
         "Logging and verbosity options",
         "These options govern the level of spew from ssgetpy. "
@@ -206,24 +510,10 @@ def cli(argv=sys.argv[1:]):
         default=False,
         help="Do not print any messages to the console.",
     )
+    return parser
 
-    if len(argv) == 0:
-        parser.print_help()
-        return
-
-    args = parser.parse_args(argv)
-
-    optdict = dict(
-        matid=args.matid,
-        group=args.group,
-        name=args.name,
-        rowbounds=(args.min_rows, args.max_rows),
-        colbounds=(args.min_cols, args.max_cols),
-        nzbounds=(args.min_nnzs, args.max_nnzs),
-        dtype=args.dtype,  # isspd     = args.isspd,\
-        limit=args.limit,
-    )
 
+def _configure_logging(args):
     if args.quiet:
         pass
     elif args.verbose:
@@ -231,10 +521,103 @@ def cli(argv=sys.argv[1:]):
     else:
         logging.basicConfig(level=logging.INFO)
 
-    name_or_id = None
-    if args.matid:
-        name_or_id = args.matid
-    elif args.name:
-        name_or_id = args.matid
 
-    fetch(name_or_id, args.format, args.location, args.dry_run, **optdict)
+def _cache_info(args, cache, name_or_id, optdict):
+    _print_cache(cache)
+
+
+def _trim_cache(args, cache, name_or_id, optdict):
+    evicted = cache.trim()
+    logger.info(
+        f"Evicted {len(evicted)} matrices, freeing "
+        + f"{sum(entry.size for entry in evicted)} bytes"
+    )
+
+
+def _verify(args, cache, name_or_id, optdict):
+    damaged = integrity.verify(
+        workers=args.workers if args.workers > 1 else None
+    )
+    logger.info(f"Found {len(damaged)} damaged files")
+    return 1 if damaged else None
+
+
+def _pin(args, cache, name_or_id, optdict):
+    for matrix in search(name_or_id, **optdict):
+        if args.pin:
+            cache.pin(matrix, args.format)
+        else:
+            cache.unpin(matrix, args.format)
+
+
+def _cache_command(args):
+    # Returns the cache option given in `args` that replaces downloading
+    commands = (
+        (args.cache_info, _cache_info),
+        (args.trim_cache, _trim_cache),
+        (args.verify, _verify),
+        (args.pin or args.unpin, _pin),
+    )
+    return next((command for given, command in commands if given), None)
+
+
+def _download(args, name_or_id, optdict):
+    reporter = None
+    if args.events or args.statsd:
+        reporter = events.MultiReporter(
+            events.TqdmReporter("Overall progress"),
+            args.events and events.JSONLinesReporter(args.events),
+            args.statsd and events.StatsDReporter(*args.statsd),
+        )
+    try:
+        fetch(
+            name_or_id,
+            args.format,
+            args.location,
+            args.dry_run,
+            args.workers,
+            args.rate_limit,
+            reporter,
+            args.processes,
+            args.convert,
+            args.budget,
+            args.policy,
+            args.estimate,
+            **optdict,
+        )
+    except DownloadError as exc:
+        logger.error(str(exc))
+        return 1
+    finally:
+        if reporter is not None:
+            reporter.close()
+
+
+def cli(argv=sys.argv[1:]):
+    if argv[:1] in (["mirror"], ["serve"]):
+        from . import mirror
+
+        return mirror.cli(argv)
+
+    parser = _parser()
+    if len(argv) == 0:
+        parser.print_help()
+        return
+
+    args = parser.parse_args(argv)
+    name_or_id, optdict = _filters(args)
+    _configure_logging(args)
+
+    if args.root_url:
+        set_root_url(args.root_url)
+    if args.refresh_index:
+        dbinstance.refresh_index()
+        return
+
+    cache = get_cache()
+    if args.cache_quota is not None:
+        cache.quota = args.cache_quota
+    command = _cache_command(args)
+    if command is not None:
+        return command(args, cache, name_or_id, optdict)
+    return _download(args, name_or_id, optdict)
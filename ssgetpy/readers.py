@@ -0,0 +1,498 @@
+"""
+The `readers` module turns downloaded matrix files into SciPy sparse
+matrices without extracting them first.
+
+`read_mm` parses MatrixMarket coordinate data in fixed-size chunks with
+vectorized NumPy conversions, writing straight into preallocated index
+and value arrays, so the memory used on top of the result is bounded by
+the chunk size. `open_member` streams a single file out of a TAR.GZ
+bundle produced by `Matrix.download`.
+
+`read_rb` parses Rutherford-Boeing files the same way, slicing each
+block of fixed-width Fortran cards into whole columns of numbers at a
+time. `Problem` reads the SuiteSparse `Problem` struct of a `.mat` file,
+using SciPy for MATLAB v5 files and `h5py`, if installed, for v7.3
+(HDF5) files. All readers return the same sparse matrices.
+
+`write_binary` stores a CSR matrix as a small header followed by the raw
+`indptr`, `indices` and `data` arrays, and `read_binary` maps those
+arrays back into memory with `np.memmap`. Opening a binary file does not
+copy or parse anything, and processes that open the same file share its
+pages in the page cache.
+
+This module requires NumPy and SciPy, which can be installed with
+`pip install ssgetpy[scipy]`.
+"""
+
+import contextlib
+import os
+import re
+import struct
+import tarfile
+import tempfile
+
+try:
+    import numpy as np
+    import scipy.sparse
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "ssgetpy.readers requires NumPy and SciPy; "
+        + "install them with `pip install ssgetpy[scipy]`"
+    )
+
+# Number of bytes of text parsed at a time
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Layout of the header of binary CSR files: magic, version, shape, nnz and
+# the dtypes of indptr, indices and data. Every array starts on a multiple
+# of ALIGNMENT bytes.
+BINARY_MAGIC = b"SSGETCSR"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<8sIqqq8s8s8s")
+ALIGNMENT = 64
+
+# Type the tokens are parsed as, type of the values and number of tokens
+# on each line of coordinate data, by field type. Integers never go
+# through float64, which would round those above 2**53.
+_FIELDS = {
+    "real": (np.float64, np.float64, 3),
+    "double": (np.float64, np.float64, 3),
+    "integer": (np.int64, np.int64, 3),
+    "complex": (np.float64, np.complex128, 4),
+    "pattern": (np.int64, np.float64, 2),
+}
+
+# Number of Rutherford-Boeing cards parsed at a time
+CARDS = 65536
+
+# Symmetry of Rutherford-Boeing matrices, by the second letter of MXTYPE
+_RB_SYMMETRY = {
+    "s": "symmetric",
+    "z": "skew-symmetric",
+    "h": "hermitian",
+    "u": "general",
+    "r": "general",
+}
+
+# Fortran writes double precision exponents as 1.0D+00
+_EXPONENTS = bytes.maketrans(b"Dd", b"Ee")
+
+_HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+
+
+@contextlib.contextmanager
+def open_member(bundle, filename):
+    """
+    Opens the member of the TAR.GZ file `bundle` whose name ends with
+    `/filename` for reading, decompressing it as it is read.
+    """
+    with tarfile.open(bundle, "r|gz") as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith("/" + filename):
+                yield tar.extractfile(member)
+                return
+    raise KeyError(f"{bundle} has no member named {filename}")
+
+
+def _index_dtype(*sizes):
+    return np.int32 if max(sizes) < 2**31 else np.int64
+
+
+def _chunks(fileobj, chunk_size):
+    # Yields blocks of whole lines of text
+    leftover = b""
+    while True:
+        block = fileobj.read(chunk_size)
+        if not block:
+            break
+        block = leftover + block
+        cut = block.rfind(b"\n") + 1
+        leftover = block[cut:]
+        if cut:
+            yield block[:cut]
+    if leftover.strip():
+        yield leftover
+
+
+def _count_tokens(text):
+    # Counts the tokens in the bytes `text`, treating every control
+    # character as whitespace
+    space = np.frombuffer(text, dtype=np.uint8) <= ord(" ")
+    starts = np.count_nonzero(space[:-1] & ~space[1:])
+    return int(starts) + int(space.size > 0 and not space[0])
+
+
+def to_sparse(shape, rows, cols, values, sparse="csr"):
+    """
+    Builds a SciPy sparse matrix of the given `sparse` format ("csr",
+    "csc" or "coo") from zero-based coordinate arrays.
+    """
+    matrix = scipy.sparse.coo_matrix((values, (rows, cols)), shape=shape)
+    return _convert(matrix, sparse)
+
+
+def _convert(matrix, sparse):
+    if sparse not in ("csr", "csc", "coo"):
+        raise ValueError("Sparse format must be 'csr', 'csc' or 'coo'")
+    return matrix.asformat(sparse)
+
+
+def _expand_symmetric(rows, cols, values, symmetry):
+    # Adds the mirror image of the strictly lower (or upper) triangle
+    off = rows != cols
+    mirrored = values[off]
+    if symmetry == "skew-symmetric":
+        mirrored = -mirrored
+    elif symmetry == "hermitian":
+        mirrored = np.conj(mirrored)
+    return (
+        np.concatenate((rows, cols[off])),
+        np.concatenate((cols, rows[off])),
+        np.concatenate((values, mirrored)),
+    )
+
+
+def _read_mm_header(fileobj):
+    # Returns the field, symmetry and size line of a MatrixMarket file
+    header = fileobj.readline().decode("ascii").lower().split()
+    if len(header) != 5 or header[0] != "%%matrixmarket":
+        raise ValueError("Not a MatrixMarket file")
+    _, obj, layout, field, symmetry = header
+    if obj != "matrix" or layout != "coordinate":
+        raise ValueError(f"Unsupported MatrixMarket layout: {obj} {layout}")
+    if field not in _FIELDS:
+        raise ValueError(f"Unsupported MatrixMarket field: {field}")
+
+    line = fileobj.readline()
+    while line.startswith(b"%") or not line.strip():
+        line = fileobj.readline()
+    nrows, ncols, nnz = (int(x) for x in line.split())
+    return field, symmetry, nrows, ncols, nnz
+
+
+def _parse_entries(text, dtype, width):
+    # Parses whole lines of coordinate data into rows of `width` tokens;
+    # fromstring stops quietly at the first token it cannot parse
+    entries = np.fromstring(text.decode("ascii"), dtype=dtype, sep=" ")
+    if entries.size % width or entries.size != _count_tokens(text):
+        raise ValueError("Malformed MatrixMarket coordinate data")
+    return entries.reshape(-1, width)
+
+
+def read_mm(fileobj, sparse="csr", chunk_size=CHUNK_SIZE):
+    """
+    Reads a MatrixMarket coordinate matrix from the binary file object
+    `fileobj` and returns it as a SciPy sparse matrix in the `sparse`
+    format ("csr", "csc" or "coo"). Symmetric, skew-symmetric and
+    Hermitian matrices are expanded to include both triangles.
+    """
+    field, symmetry, nrows, ncols, nnz = _read_mm_header(fileobj)
+    token_dtype, value_dtype, width = _FIELDS[field]
+
+    index_dtype = _index_dtype(nrows, ncols, 2 * nnz)
+    rows = np.empty(nnz, dtype=index_dtype)
+    cols = np.empty(nnz, dtype=index_dtype)
+    values = np.ones(nnz, dtype=value_dtype)
+
+    count = 0
+    for text in _chunks(fileobj, chunk_size):
+        entries = _parse_entries(text, token_dtype, width)
+        end = count + len(entries)
+        if end > nnz:
+            raise ValueError(f"Expected {nnz} entries, found more")
+        rows[count:end] = entries[:, 0] - 1
+        cols[count:end] = entries[:, 1] - 1
+        if width == 4:
+            values[count:end] = entries[:, 2] + 1j * entries[:, 3]
+        elif width == 3:
+            values[count:end] = entries[:, 2]
+        count = end
+    if count != nnz:
+        raise ValueError(f"Expected {nnz} entries, found {count}")
+
+    if symmetry != "general":
+        rows, cols, values = _expand_symmetric(rows, cols, values, symmetry)
+    return to_sparse((nrows, ncols), rows, cols, values, sparse)
+
+
+def _fortran_format(format):
+    # Returns the values per card and field width of e.g. (1P,4E20.12)
+    format = re.sub(r"\d*P,?", "", format.upper())
+    match = re.search(r"(\d*)([IEDFG])(\d+)", format)
+    if not match:
+        raise ValueError(f"Unsupported Fortran format: {format}")
+    return int(match.group(1) or 1), int(match.group(3))
+
+
+def _read_cards(fileobj, ncards, format, count, out):
+    # Parses `count` fixed-width values spread over `ncards` cards into
+    # `out`, a block of cards at a time
+    per_card, width = _fortran_format(format)
+    length = per_card * width
+    done = 0
+    while ncards > 0:
+        block = [fileobj.readline() for _ in range(min(ncards, CARDS))]
+        ncards -= len(block)
+        text = b"".join(card.rstrip(b"\r\n").ljust(length) for card in block)
+        fields = np.frombuffer(text, dtype=f"S{width}")
+        fields = fields[: count - done]
+        if out.dtype.kind in "fc":
+            fields = np.char.translate(fields, _EXPONENTS)
+        end = done + len(fields)
+        out[done:end] = fields.astype(out.dtype)
+        done = end
+    if done != count:
+        raise ValueError(f"Expected {count} values, found {done}")
+
+
+def read_rb(fileobj, sparse="csr"):
+    """
+    Reads an assembled Rutherford-Boeing (or Harwell-Boeing) matrix from
+    the binary file object `fileobj` and returns it as a SciPy sparse
+    matrix in the `sparse` format ("csr", "csc" or "coo"). Symmetric,
+    skew-symmetric and Hermitian matrices are expanded to include both
+    triangles.
+    """
+    fileobj.readline()  # Title and key
+    _, ptrcrd, indcrd, valcrd = (
+        int(x) for x in fileobj.readline().split()[:4]
+    )
+    line = fileobj.readline().decode("ascii")
+    mxtype = line[:3].lower()
+    nrows, ncols, nnz = (int(x) for x in line[3:].split()[:3])
+    if len(mxtype) != 3 or mxtype[2] != "a":
+        raise ValueError(f"Unsupported Rutherford-Boeing type: {mxtype}")
+    if mxtype[1] not in _RB_SYMMETRY or mxtype[0] not in "rcip":
+        raise ValueError(f"Unsupported Rutherford-Boeing type: {mxtype}")
+    line = fileobj.readline().decode("ascii")
+    ptrfmt, indfmt, valfmt = line[:16], line[16:32], line[32:52]
+
+    index_dtype = _index_dtype(nrows, ncols, 2 * nnz)
+    indptr = np.empty(ncols + 1, dtype=np.int64)
+    _read_cards(fileobj, ptrcrd, ptrfmt, ncols + 1, indptr)
+    rows = np.empty(nnz, dtype=index_dtype)
+    _read_cards(fileobj, indcrd, indfmt, nnz, rows)
+    rows -= 1
+
+    field = mxtype[0]
+    if field == "p" or valcrd == 0:
+        values = np.ones(nnz, dtype=np.float64)
+    elif field == "c":
+        parts = np.empty(2 * nnz, dtype=np.float64)
+        _read_cards(fileobj, valcrd, valfmt, 2 * nnz, parts)
+        values = parts[0::2] + 1j * parts[1::2]
+    else:
+        values = np.empty(nnz, np.int64 if field == "i" else np.float64)
+        _read_cards(fileobj, valcrd, valfmt, nnz, values)
+
+    cols = np.repeat(np.arange(ncols, dtype=index_dtype), np.diff(indptr))
+    symmetry = _RB_SYMMETRY[mxtype[1]]
+    if symmetry != "general":
+        rows, cols, values = _expand_symmetric(rows, cols, values, symmetry)
+    return to_sparse((nrows, ncols), rows, cols, values, sparse)
+
+
+def is_hdf5(path):
+    """
+    Returns True if `path` is an HDF5 file, such as a MATLAB v7.3 file.
+    """
+    with open(path, "rb") as f:
+        head = f.read(512 + len(_HDF5_SIGNATURE))
+    return _HDF5_SIGNATURE in (head[:8], head[512:])
+
+
+class Problem:
+    """
+    The SuiteSparse `Problem` struct stored in the `.mat` file `path`,
+    whose fields (`A`, `name`, `title`, `kind`, `aux`, ...) are read when
+    they are first accessed. The sparse matrix `A` is returned in the
+    `sparse` format.
+
+    Fields of MATLAB v7.3 files are read individually with `h5py`, so
+    large auxiliary data is only loaded if it is used. MATLAB v5 files
+    cannot be read in parts, and are read whole on first access.
+    """
+
+    def __init__(self, path, sparse="csr"):
+        self.path = path
+        self.sparse = sparse
+        self._struct = None
+        self._values = {}
+
+    def _load(self):
+        if self._struct is not None:
+            return self._struct
+        if is_hdf5(self.path):
+            try:
+                import h5py
+            except ImportError:
+                raise ImportError(
+                    f"{self.path} is a MATLAB v7.3 file, which requires h5py"
+                )
+            self._struct = _H5Struct(h5py.File(self.path, "r")["Problem"])
+        else:
+            import scipy.io
+
+            self._struct = scipy.io.loadmat(
+                self.path,
+                variable_names=["Problem"],
+                squeeze_me=True,
+                struct_as_record=False,
+            )["Problem"]
+        return self._struct
+
+    def fields(self):
+        """
+        Returns the names of the fields of the struct.
+        """
+        struct = self._load()
+        if isinstance(struct, _H5Struct):
+            return struct.fields()
+        return list(struct._fieldnames)
+
+    def __getattr__(self, field):
+        if field.startswith("_"):
+            raise AttributeError(field)
+        if field not in self._values:
+            try:
+                value = getattr(self._load(), field)
+            except (AttributeError, KeyError):
+                raise AttributeError(f"Problem has no field {field!r}")
+            if scipy.sparse.issparse(value):
+                value = _convert(value, self.sparse)
+            self._values[field] = value
+        return self._values[field]
+
+
+class _H5Struct:
+    # A MATLAB struct stored as an HDF5 group, decoded on access
+
+    def __init__(self, group):
+        self._group = group
+
+    def fields(self):
+        return list(self._group.keys())
+
+    def __getattr__(self, field):
+        if field.startswith("_"):
+            raise AttributeError(field)
+        return _h5_value(self._group[field])
+
+
+def _h5_value(node):
+    import h5py
+
+    if isinstance(node, h5py.Group):
+        if "MATLAB_sparse" in node.attrs:
+            nrows = int(node.attrs["MATLAB_sparse"])
+            indptr = node["jc"][()]
+            data = (
+                node["data"][()]
+                if "data" in node
+                else np.ones(len(node["ir"]), dtype=np.float64)
+            )
+            if data.dtype.names:
+                data = data["real"] + 1j * data["imag"]
+            return scipy.sparse.csc_matrix(
+                (data, node["ir"][()], indptr),
+                shape=(nrows, len(indptr) - 1),
+            )
+        return _H5Struct(node)
+    matlab_class = node.attrs.get("MATLAB_class", b"")
+    if isinstance(matlab_class, bytes):
+        matlab_class = matlab_class.decode("ascii")
+    value = node[()]
+    if matlab_class == "char":
+        # Stored as a column of UTF-16 code units per row
+        return "\n".join(
+            "".join(map(chr, row)) for row in np.atleast_2d(value.T)
+        )
+    if matlab_class == "cell":
+        return [_h5_value(node.file[ref]) for ref in value.T.flat]
+    if value.dtype.names:
+        value = value["real"] + 1j * value["imag"]
+    # MATLAB arrays are column-major
+    return value.T
+
+
+def read_mat(path, sparse="csr"):
+    """
+    Returns the matrix `Problem.A` of the SuiteSparse `.mat` file `path`
+    as a SciPy sparse matrix in the `sparse` format.
+    """
+    return Problem(path, sparse).A
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _layout(header_size, sizes):
+    # Yields the offset of each array, given their sizes in bytes
+    offset = _aligned(header_size)
+    for nbytes in sizes:
+        yield offset
+        offset = _aligned(offset + nbytes)
+
+
+def write_binary(path, matrix):
+    """
+    Writes the sparse matrix `matrix` to `path` in the binary CSR layout
+    read by `read_binary`. The file is written under a temporary name
+    and renamed when complete, so readers never see a partial file.
+    """
+    matrix = scipy.sparse.csr_matrix(matrix)
+    arrays = [
+        np.ascontiguousarray(a).astype(a.dtype.newbyteorder("<"), copy=False)
+        for a in (matrix.indptr, matrix.indices, matrix.data)
+    ]
+    header = _HEADER.pack(
+        BINARY_MAGIC,
+        BINARY_VERSION,
+        matrix.shape[0],
+        matrix.shape[1],
+        matrix.nnz,
+        *(a.dtype.str.encode("ascii") for a in arrays),
+    )
+    fd, temp = tempfile.mkstemp(
+        prefix=".", suffix=".part", dir=os.path.dirname(path) or "."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            offsets = _layout(len(header), (a.nbytes for a in arrays))
+            for offset, array in zip(offsets, arrays):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(array.data)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def read_binary(path, sparse="csr"):
+    """
+    Opens a file written by `write_binary` and returns a SciPy sparse
+    matrix in the `sparse` format. CSR matrices are backed directly by
+    read-only memory maps of the file.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or not header.startswith(BINARY_MAGIC):
+        raise ValueError(f"{path} is not a binary CSR file")
+    _, version, nrows, ncols, nnz, *dtypes = _HEADER.unpack(header)
+    if version != BINARY_VERSION:
+        raise ValueError(f"{path} has unsupported version {version}")
+    dtypes = [np.dtype(d.rstrip(b"\0").decode("ascii")) for d in dtypes]
+    sizes = (nrows + 1, nnz, nnz)
+    offsets = _layout(
+        _HEADER.size, (n * dtype.itemsize for n, dtype in zip(sizes, dtypes))
+    )
+    arrays = [
+        np.memmap(path, dtype, "r", offset, (n,)) if n else np.empty(0, dtype)
+        for dtype, offset, n in zip(dtypes, offsets, sizes)
+    ]
+    matrix = scipy.sparse.csr_matrix(
+        (arrays[2], arrays[1], arrays[0]), shape=(nrows, ncols), copy=False
+    )
+    return _convert(matrix, sparse)
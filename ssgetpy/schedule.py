@@ -0,0 +1,178 @@
+"""
+The `schedule` module decides which matrices of a batch to download, and
+in which order, so that the batch fits in a byte budget.
+
+The size of each download is either estimated from the number of
+non-zeros and the data type recorded in the index, which is free but
+only accurate to within a factor of two or so, or read from the
+`Content-Length` of a HEAD request, which is exact but costs a round trip
+per matrix. Matrices that are already on disk cost nothing.
+
+The matrices are then taken in the order set by a policy, skipping any
+that would take the total over the budget:
+
+* `smallest`: smallest first, which downloads the most matrices,
+* `largest`: largest first,
+* `round-robin`: smallest first within each group, taking one matrix
+  from each group in turn so that every group is represented,
+* `index`: in the order they were given.
+"""
+
+import collections
+import itertools
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("smallest", "largest", "round-robin", "index")
+ESTIMATES = ("nnz", "head")
+
+# Approximate compressed bytes per stored non-zero, by data type, and
+# per file, fitted to bundles in the SuiteSparse Matrix Collection
+BYTES_PER_NONZERO = {"binary": 3, "real": 8, "complex": 16}
+BYTES_PER_FILE = 1024
+
+Entry = collections.namedtuple("Entry", ["matrix", "size"])
+
+
+def estimate_size(matrix, format="MM"):
+    """
+    Returns the approximate size in bytes of `matrix` downloaded in
+    `format`, judging by its number of non-zeros and data type.
+    """
+    matrix._filename(format)  # Validates format
+    per_nonzero = BYTES_PER_NONZERO.get(matrix.dtype, 8)
+    return BYTES_PER_FILE + per_nonzero * (matrix.nnz or 0)
+
+
+def remote_size(matrix, format="MM"):
+    """
+    Returns the size in bytes of `matrix` in `format` reported by the
+    server, or its estimated size if the server does not say.
+    """
+    from . import net
+
+    response = net.head(matrix.url(format), allow_redirects=True)
+    response.raise_for_status()
+    length = response.headers.get("Content-Length")
+    return int(length) if length else estimate_size(matrix, format)
+
+
+class Schedule:
+    """
+    The outcome of `plan`: the `selected` matrices, in the order they
+    should be downloaded, and the `skipped` ones that did not fit in the
+    `budget`, each as an `Entry` of the matrix and its size in bytes.
+    """
+
+    def __init__(self, selected, skipped, budget, policy):
+        self.selected = selected
+        self.skipped = skipped
+        self.budget = budget
+        self.policy = policy
+
+    @property
+    def total(self):
+        return sum(entry.size for entry in self.selected)
+
+    @property
+    def matrices(self):
+        from .matrix import MatrixList
+
+        return MatrixList(entry.matrix for entry in self.selected)
+
+    def __str__(self):
+        lines = [
+            "%12d  %s/%s" % (size, matrix.group, matrix.name)
+            for matrix, size in self.selected
+        ]
+        lines.extend(
+            "%12d  %s/%s (over budget)" % (size, matrix.group, matrix.name)
+            for matrix, size in self.skipped
+        )
+        lines.append(
+            "%d matrices, %d bytes, budget %s, policy %s, %d skipped"
+            % (
+                len(self.selected),
+                self.total,
+                "none" if self.budget is None else self.budget,
+                self.policy,
+                len(self.skipped),
+            )
+        )
+        return "\n".join(lines)
+
+
+def _order(entries, policy):
+    by_size = sorted(entries, key=lambda e: (e.size, e.matrix.id))
+    if policy == "smallest":
+        return by_size
+    elif policy == "largest":
+        return by_size[::-1]
+    elif policy == "round-robin":
+        groups = collections.OrderedDict()
+        for entry in by_size:
+            groups.setdefault(entry.matrix.group, []).append(entry)
+        rounds = itertools.zip_longest(*groups.values())
+        return [entry for batch in rounds for entry in batch if entry]
+    elif policy == "index":
+        return list(entries)
+    raise ValueError(f"Policy must be one of {', '.join(POLICIES)}")
+
+
+def plan(
+    matrices,
+    format="MM",
+    destpath=None,
+    extract=False,
+    budget=None,
+    policy="smallest",
+    estimate="nnz",
+    workers=None,
+):
+    """
+    Returns the `Schedule` for downloading `matrices` in `format` to
+    `destpath` within `budget` bytes (no limit if None) according to
+    `policy`. `estimate` is "nnz" to estimate sizes from the index or
+    "head" to ask the server, with up to `workers` requests at a time.
+    """
+    from .net import POOL_SIZE
+
+    if policy not in POLICIES:
+        raise ValueError(f"Policy must be one of {', '.join(POLICIES)}")
+    if estimate == "nnz":
+        size = estimate_size
+    elif estimate == "head":
+        size = remote_size
+    else:
+        raise ValueError(f"Estimate must be one of {', '.join(ESTIMATES)}")
+
+    pending = [
+        m
+        for m in matrices
+        if not os.access(m.localpath(format, destpath, extract)[0], os.F_OK)
+    ]
+    if estimate == "head" and len(pending) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(workers or POOL_SIZE) as executor:
+            sizes = list(executor.map(lambda m: size(m, format), pending))
+    else:
+        sizes = [size(m, format) for m in pending]
+    sizes = dict(zip((m.id for m in pending), sizes))
+
+    selected, skipped = [], []
+    total = 0
+    entries = [Entry(m, sizes.get(m.id, 0)) for m in matrices]
+    for entry in _order(entries, policy):
+        if budget is not None and total + entry.size > budget:
+            skipped.append(entry)
+        else:
+            selected.append(entry)
+            total += entry.size
+    logger.debug(
+        f"Scheduled {len(selected)} matrices, {total} bytes, "
+        + f"skipped {len(skipped)}"
+    )
+    return Schedule(selected, skipped, budget, policy)
@@ -0,0 +1,372 @@
+"""
+The `transfer` module streams the body of an HTTP response to disk.
+
+`RemoteFile` is a file-like reader over a URL that transparently reconnects
+with HTTP `Range` requests after a failure, so it can feed consumers such
+as a streaming `tarfile` directly. `download` uses it to write to a `.part`
+file that is renamed into place only once it is complete.
+
+By default the chunk size adapts to the observed throughput so that fast
+links use large reads and slow links still report progress regularly.
+An optional `TokenBucket` caps the transfer rate, e.g. when sharing a link.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from . import net
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# The adaptive reader aims to spend roughly this many seconds per chunk
+TARGET_CHUNK_TIME = 0.25
+
+# Incomplete downloads are kept under this suffix until they are finished
+PART_SUFFIX = ".part"
+
+# Interrupted transfers are resumed this many times, waiting
+# RETRY_BACKOFF, 2 * RETRY_BACKOFF, 4 * RETRY_BACKOFF, ... seconds in between.
+# Failures to connect are retried by the `net` session instead.
+RETRIES = 5
+RETRY_BACKOFF = 1.0
+
+
+class TokenBucket:
+    """
+    Limits throughput to `rate` bytes per second, allowing bursts of up to
+    `capacity` bytes (one second's worth by default). A single bucket may
+    be shared between several threads to cap their combined rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("Rate limit must be a positive number of bytes")
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, nbytes):
+        """
+        Takes `nbytes` tokens from the bucket without waiting and returns
+        the number of seconds the caller should wait before going on.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.timestamp) * self.rate
+            )
+            self.timestamp = now
+            self.tokens -= nbytes
+            return max(-self.tokens, 0) / self.rate
+
+    def consume(self, nbytes):
+        """
+        Takes `nbytes` tokens from the bucket, sleeping for as long as it
+        takes for the bucket to refill if it runs into deficit.
+        """
+        delay = self.take(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def as_bucket(rate_limit):
+    """
+    Returns a `TokenBucket` for `rate_limit`, which may be `None`, a number
+    of bytes per second or an existing bucket.
+    """
+    if rate_limit is None or isinstance(rate_limit, TokenBucket):
+        return rate_limit
+    return TokenBucket(rate_limit)
+
+
+class _ChunkSizer:
+    def __init__(self, chunk_size=None, bucket=None):
+        self.fixed = chunk_size is not None
+        self.size = chunk_size or MIN_CHUNK_SIZE
+        self.limit = MAX_CHUNK_SIZE
+        if bucket is not None and not self.fixed:
+            # Never ask for more than the bucket can hold at once
+            self.limit = max(1, min(self.limit, int(bucket.capacity)))
+            self.size = min(self.size, self.limit)
+
+    def adjust(self, elapsed):
+        if self.fixed:
+            return
+        if elapsed < TARGET_CHUNK_TIME / 2:
+            self.size = min(self.size * 2, self.limit)
+        elif elapsed > TARGET_CHUNK_TIME * 2:
+            # A small bucket may hold less than MIN_CHUNK_SIZE
+            self.size = min(max(self.size // 2, MIN_CHUNK_SIZE), self.limit)
+
+
+class IncompleteDownload(IOError):
+    """
+    Raised when a transfer ends before the expected number of bytes has
+    been received and no more retries are left.
+    """
+
+
+def _transient_errors():
+    # requests is imported on first use to keep `import ssgetpy` light
+    import requests
+    from urllib3.exceptions import HTTPError
+
+    return (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        HTTPError,
+        IncompleteDownload,
+    )
+
+
+def _content_range(response):
+    # Parses "bytes start-end/total" into (start, total)
+    value = response.headers.get("content-range", "")
+    try:
+        unit, spec = value.split(" ", 1)
+        span, total = spec.split("/", 1)
+        start = int(span.split("-", 1)[0]) if span != "*" else None
+        return start, (int(total) if total != "*" else None)
+    except ValueError:
+        return None, None
+
+
+class RemoteFile:
+    """
+    A read-only file object over the body of `url`, starting at byte
+    `offset`.
+
+    If the body is interrupted, `read` reconnects with an HTTP `Range`
+    request at the current position, up to `retries` times (`RETRIES` by
+    default); servers that ignore the range have the bytes before the
+    current position skipped. Failures to connect are left to the retries
+    of the `net` session, so the two do not multiply.
+
+    `rate_limit` is a number of bytes per second or a `TokenBucket`.
+    `progress`, if given, has `add_total(nbytes)` called once with the
+    size of the body and `update(nbytes)` called as bytes are read, and
+    `retry(attempt, error)`, if it has such a method, called before each
+    reconnection; see `events.Tracker`.
+
+    If the body turns out to be shorter than `offset` when first
+    connecting, the transfer starts over from the beginning and
+    `restarted` is set.
+    """
+
+    def __init__(
+        self, url, offset=0, rate_limit=None, progress=None, retries=None
+    ):
+        self.url = url
+        self.offset = offset
+        self.total = None
+        self.bucket = as_bucket(rate_limit)
+        self.progress = progress
+        self.retries = RETRIES if retries is None else retries
+        self.attempt = 0
+        self.response = None
+        self.connected = False
+        self.restarted = False
+        self._retry(lambda: None)
+
+    def _retry(self, operation, *args):
+        while True:
+            if not self.connected:
+                self._connect()
+                self.connected = True
+            try:
+                return operation(*args)
+            except _transient_errors() as exc:
+                if self.attempt >= self.retries:
+                    raise
+                self.attempt += 1
+                if hasattr(self.progress, "retry"):
+                    self.progress.retry(self.attempt, exc)
+                logger.warning(
+                    f"Download of {self.url} interrupted ({exc}), resuming "
+                    + f"at byte {self.offset} "
+                    + f"(attempt {self.attempt}/{self.retries})"
+                )
+                self.close()
+                self.connected = False
+                time.sleep(RETRY_BACKOFF * 2 ** (self.attempt - 1))
+
+    def _connect(self):
+        headers = {"Accept-Encoding": "identity"}
+        if self.offset:
+            headers["Range"] = f"bytes={self.offset}-"
+        response = net.get(self.url, stream=True, headers=headers)
+
+        if response.status_code == 416 and self.offset:
+            # Everything up to the end of the body has already been read
+            _, length = _content_range(response)
+            response.close()
+            if length != self.offset:
+                return self._too_short(length)
+            self._set_total(length)
+            return
+        response.raise_for_status()
+
+        start, length = _content_range(response)
+        if response.status_code != 206 or start != self.offset:
+            length = int(response.headers.get("content-length", 0)) or None
+            if length is not None and length < self.offset:
+                response.close()
+                return self._too_short(length)
+            if not self._skip(response):
+                return self._too_short(None)
+        self.response = response
+        self._set_total(length)
+
+    def _too_short(self, length):
+        # Handles a body of `length` bytes, if known, that ends before
+        # `offset`
+        if self.total is None:
+            return self._restart()
+        if length is None:
+            raise IncompleteDownload(
+                f"{self.url} ended before byte {self.offset}"
+            )
+        raise IncompleteDownload(
+            f"{self.url} has {length} bytes, expected {self.offset}"
+        )
+
+    def _skip(self, response):
+        # The server ignored the range, so discard what we have; returns
+        # False, having closed `response`, if it ends before `offset`
+        skip = self.offset
+        while skip > 0:
+            chunk = response.raw.read(
+                min(skip, MAX_CHUNK_SIZE), decode_content=True
+            )
+            if not chunk:
+                response.close()
+                return False
+            skip -= len(chunk)
+        return True
+
+    def _restart(self):
+        # The body is shorter than the partial file being resumed, which
+        # must be left over from a different version, so start over
+        logger.warning(
+            f"{self.url} is shorter than the {self.offset} bytes already "
+            + "downloaded, starting over"
+        )
+        self.offset = 0
+        self.restarted = True
+        self._connect()
+
+    def _set_total(self, total):
+        if self.total is None:
+            self.total = total
+            if self.progress is not None:
+                self.progress.add_total(total or 0)
+                if self.offset:
+                    self.progress.update(self.offset)
+
+    def _read(self, size):
+        if self.response is None:
+            return b""
+        chunk = self.response.raw.read(size, decode_content=True)
+        if not chunk and self.total is not None and self.offset < self.total:
+            raise IncompleteDownload(
+                f"Received {self.offset} of {self.total} bytes from {self.url}"
+            )
+        return chunk
+
+    def read(self, size=-1):
+        """
+        Reads up to `size` bytes, or the rest of the body if `size` is
+        negative, and returns an empty string at the end of the body.
+        """
+        chunk = self._retry(self._read, None if size < 0 else size)
+        self.offset += len(chunk)
+        if chunk:
+            if self.progress is not None:
+                self.progress.update(len(chunk))
+            if self.bucket is not None:
+                self.bucket.consume(len(chunk))
+        return chunk
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def stream(source, outfile, chunk_size=None):
+    """
+    Copies `source`, which is usually a `RemoteFile`, to `outfile` and
+    returns the number of bytes written.
+
+    `chunk_size` fixes the read size; by default it adapts between
+    `MIN_CHUNK_SIZE` and `MAX_CHUNK_SIZE` to the observed throughput.
+    """
+    sizer = _ChunkSizer(chunk_size, getattr(source, "bucket", None))
+    nbytes = 0
+    while True:
+        start = time.monotonic()
+        chunk = source.read(sizer.size)
+        if not chunk:
+            break
+        outfile.write(chunk)
+        nbytes += len(chunk)
+        sizer.adjust(time.monotonic() - start)
+    return nbytes
+
+
+def download(
+    url,
+    localdest,
+    chunk_size=None,
+    rate_limit=None,
+    progress=None,
+    retries=None,
+    on_open=None,
+    digest=None,
+):
+    """
+    Downloads `url` to `localdest` atomically and returns its size.
+
+    The data is written to `localdest + ".part"` and renamed into place
+    only once it is complete. Interrupted transfers are resumed as
+    described in `RemoteFile`, and a partial file left behind by an
+    earlier run is resumed the same way, or replaced if it is longer than
+    the file at `url`.
+
+    `on_open`, if given, is called with the `RemoteFile` once the
+    connection is established and before any of the body is written.
+    `digest`, if given, is a `hashlib` hash object that is fed the whole
+    file as it is written, starting with any partial file resumed.
+    """
+    from . import integrity
+
+    partfile = localdest + PART_SUFFIX
+    offset = os.path.getsize(partfile) if os.path.exists(partfile) else 0
+    with RemoteFile(url, offset, rate_limit, progress, retries) as remote:
+        if on_open is not None:
+            on_open(remote)
+        if remote.restarted:
+            offset = 0
+        with open(partfile, "ab" if offset else "wb") as outfile:
+            writer = outfile
+            if digest is not None:
+                if offset:
+                    integrity.hash_file(partfile, digest)
+                writer = integrity.HashingWriter(outfile, digest)
+            stream(remote, writer, chunk_size)
+    os.replace(partfile, localdest)
+    return remote.offset